@@ -0,0 +1,246 @@
+"""
+Modo batch (sem interface) do LLM Data Analyzer Challenge.
+
+Lê perguntas de um arquivo ou do stdin (JSONL com o campo "pergunta" e, opcionalmente, "id";
+ou CSV com as mesmas colunas) e executa o pipeline de main.py para cada uma, em paralelo:
+- um pool limitado de threads (--workers / BATCH_WORKERS), cuja concorrência efetiva é reduzida
+  à metade quando a API da LLM responde com limite de taxa (429) e volta a crescer aos poucos;
+- perguntas com erro transitório da API (limite de taxa, 5xx, timeout) são repetidas com espera
+  exponencial (--tentativas / BATCH_MAX_RETRIES);
+- cada resultado (resposta, SQL, linhas, tempos) é gravado no JSONL de saída assim que fica pronto;
+- ao ser executado de novo com a mesma saída, pula as perguntas já respondidas sem erro
+  (retomada depois de uma falha ou interrupção).
+
+As chamadas à LLM do batch entram no agendador (core/llm_scheduler.py) com prioridade menor que as
+do chatbot e sem as novas tentativas do agendador: as repetições ficam só com o batch, para que uma
+pergunta não seja tentada (tentativas do batch × do agendador) vezes. Cada pergunta é independente:
+não há histórico compartilhado entre elas.
+
+Uso:
+    python batch.py perguntas.jsonl --saida respostas.jsonl --workers 8
+    cat perguntas.csv | python batch.py - --formato csv --saida respostas.jsonl --dados resultados/
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import load_config, get_setting
+from core.pipeline import carregar_contexto, processar_mensagem
+from core.tracing import span
+from core.llm_scheduler import prioridade_llm, sem_novas_tentativas_llm, erro_transitorio, PRIORIDADE_BATCH
+
+_REGEX_LIMITE_TAXA = re.compile(r"\b429\b|rate.?limit", re.IGNORECASE)
+
+def ler_perguntas(arquivo, formato="jsonl"):
+    """
+    Lê as perguntas de um arquivo aberto. Retorna a lista de {'id', 'pergunta'}; sem "id",
+    a pergunta é identificada pelo número da linha (estável enquanto o arquivo não mudar).
+    """
+    if formato == "csv":
+        registros = list(csv.DictReader(arquivo))
+    else:
+        registros = [json.loads(linha) for linha in arquivo if linha.strip()]
+    perguntas = []
+    for numero, registro in enumerate(registros, start=1):
+        pergunta = (registro.get("pergunta") or "").strip()
+        if pergunta:
+            perguntas.append({"id": str(registro.get("id") or f"linha-{numero}"), "pergunta": pergunta})
+    return perguntas
+
+def ids_concluidos(caminho_saida):
+    """
+    Retorna os ids já respondidos sem erro no JSONL de saída. Linhas incompletas
+    (por exemplo, gravadas pela metade antes de uma queda) são ignoradas.
+    """
+    concluidos = set()
+    if not os.path.exists(caminho_saida):
+        return concluidos
+    with open(caminho_saida, encoding="utf-8") as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                continue
+            if not registro.get("erro"):
+                concluidos.add(registro["id"])
+    return concluidos
+
+class LimiteConcorrencia:
+    """
+    Limita o número de perguntas em andamento. O limite começa em `maximo`, cai à metade a cada
+    resposta limitada pela API e cresce de um em um após `limite` perguntas seguidas sem limitação.
+    """
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self.limite = maximo
+        self.em_uso = 0
+        self._sucessos = 0
+        self._condicao = threading.Condition()
+
+    def adquirir(self):
+        with self._condicao:
+            while self.em_uso >= self.limite:
+                self._condicao.wait()
+            self.em_uso += 1
+
+    def liberar(self, limitado=False):
+        with self._condicao:
+            self.em_uso -= 1
+            if limitado:
+                self.limite = max(1, self.limite // 2)
+                self._sucessos = 0
+            else:
+                self._sucessos += 1
+                if self._sucessos >= self.limite and self.limite < self.maximo:
+                    self.limite += 1
+                    self._sucessos = 0
+            self._condicao.notify_all()
+
+def responder_pergunta(item, contexto, limite, tentativas=3, espera_base=2.0, processar=processar_mensagem):
+    """
+    Executa o pipeline para uma pergunta, repetindo com espera exponencial (com jitter) quando a API
+    da LLM retorna um erro transitório; só o limite de taxa reduz a concorrência. Retorna o registro
+    gravado na saída; 'erro' fica preenchido sempre que a resposta não é confiável: falha na consulta
+    SQL ou erro da API tratado pelo pipeline (que responde com uma mensagem de desculpas ou cai no
+    fallback), para que a retomada repita a pergunta.
+    """
+    registro = {"id": item["id"], "pergunta": item["pergunta"]}
+    for tentativa in range(1, tentativas + 1):
+        limite.adquirir()
+        erros = []
+        try:
+            with span("batch.pergunta", id=item["id"], tentativa=tentativa) as atual, \
+                    prioridade_llm(PRIORIDADE_BATCH), sem_novas_tentativas_llm():
+                resultado = processar(item["pergunta"], [("user", item["pergunta"])], contexto)
+            # As funções da LLM e do banco tratam os erros (com print); eles ficam anotados nos spans da pergunta
+            erros = list(atual.erros_no_trace)
+        except Exception as e:
+            resultado = None
+            erros = [f"{type(e).__name__}: {e}"]
+        finally:
+            limitado = any(_REGEX_LIMITE_TAXA.search(erro) for erro in erros)
+            limite.liberar(limitado)
+        if tentativa == tentativas or not any(erro_transitorio(erro) for erro in erros):
+            break
+        time.sleep(espera_base * 2 ** (tentativa - 1) * random.uniform(0.5, 1.5))
+
+    registro["tentativas"] = tentativa
+    if resultado is None:
+        registro["erro"] = erros[0]
+        return registro
+    df = resultado["df"]
+    if limitado:
+        erro = f"Limite de taxa da API após {tentativa} tentativas: {erros[0]}"
+    elif erros and erro_transitorio(erros[0]):
+        erro = f"Erro transitório da API após {tentativa} tentativas: {erros[0]}"
+    elif erros:
+        erro = erros[0]
+    elif resultado["tipo"] == "sql_request" and df is None:
+        erro = "A consulta SQL falhou."
+    else:
+        erro = None
+    registro.update({
+        "tipo": resultado["tipo"],
+        "sql": resultado["sql"],
+        "resposta": resultado["resposta"],
+        "linhas": len(df) if df is not None else None,
+        "truncado": bool(df.attrs.get("truncado", False)) if df is not None else False,
+        "tempos": resultado["tempos"],
+        "erro": erro,
+    })
+    registro["_df"] = df
+    return registro
+
+def _nome_arquivo(id_pergunta):
+    return re.sub(r"[^\w.-]", "_", id_pergunta)
+
+def _terminar_linha_incompleta(caminho):
+    # Uma linha gravada pela metade antes de uma queda não pode emendar com a próxima
+    if os.path.exists(caminho) and os.path.getsize(caminho) > 0:
+        with open(caminho, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+def executar_batch(perguntas, contexto, caminho_saida, workers=4, tentativas=3, espera_base=2.0,
+                   dir_dados=None, processar=processar_mensagem):
+    """
+    Responde as perguntas ainda não concluídas em `caminho_saida`, acrescentando ao arquivo um
+    registro por pergunta assim que ela termina. Com `dir_dados`, o resultado de cada consulta é
+    gravado em <dir_dados>/<id>.csv. Retorna {'total', 'puladas', 'respondidas', 'erros'}.
+    """
+    concluidos = ids_concluidos(caminho_saida)
+    pendentes = [item for item in perguntas if item["id"] not in concluidos]
+    resumo = {"total": len(perguntas), "puladas": len(perguntas) - len(pendentes), "respondidas": 0, "erros": 0}
+    if not pendentes:
+        return resumo
+    if dir_dados:
+        os.makedirs(dir_dados, exist_ok=True)
+    if os.path.dirname(caminho_saida):
+        os.makedirs(os.path.dirname(caminho_saida), exist_ok=True)
+
+    limite = LimiteConcorrencia(workers)
+    _terminar_linha_incompleta(caminho_saida)
+    with open(caminho_saida, "a", encoding="utf-8") as saida, ThreadPoolExecutor(max_workers=workers) as executor:
+        futuros = [
+            executor.submit(responder_pergunta, item, contexto, limite, tentativas, espera_base, processar)
+            for item in pendentes
+        ]
+        for futuro in as_completed(futuros):
+            registro = futuro.result()
+            df = registro.pop("_df", None)
+            if dir_dados and df is not None:
+                df.to_csv(os.path.join(dir_dados, f"{_nome_arquivo(registro['id'])}.csv"), index=False)
+            saida.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+            saida.flush()
+            os.fsync(saida.fileno())
+            resumo["erros" if registro.get("erro") else "respondidas"] += 1
+            print(
+                f"[{resumo['respondidas'] + resumo['erros']}/{len(pendentes)}] {registro['id']}"
+                f"{' (erro)' if registro.get('erro') else ''}",
+                file=sys.stderr,
+            )
+    return resumo
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Responde perguntas em lote, sem interface.")
+    parser.add_argument("entrada", help="arquivo de perguntas (JSONL ou CSV) ou - para o stdin")
+    parser.add_argument("--saida", required=True, help="JSONL de resultados (também usado para retomar)")
+    parser.add_argument("--formato", choices=["jsonl", "csv"], help="padrão: pela extensão do arquivo (jsonl no stdin)")
+    parser.add_argument("--workers", type=int, help="perguntas em paralelo (padrão: BATCH_WORKERS ou 4)")
+    parser.add_argument("--tentativas", type=int, help="tentativas por pergunta limitada pela API (padrão: BATCH_MAX_RETRIES ou 3)")
+    parser.add_argument("--dados", help="diretório para gravar o resultado de cada consulta em CSV")
+    args = parser.parse_args(argumentos)
+
+    config = load_config()
+    formato = args.formato or ("csv" if args.entrada.lower().endswith(".csv") else "jsonl")
+    if args.entrada == "-":
+        perguntas = ler_perguntas(sys.stdin, formato)
+    else:
+        with open(args.entrada, encoding="utf-8", newline="") as f:
+            perguntas = ler_perguntas(f, formato)
+
+    contexto = carregar_contexto(config)
+    resumo = executar_batch(
+        perguntas, contexto, args.saida,
+        workers=args.workers or get_setting(config, "BATCH_WORKERS", 4, int),
+        tentativas=args.tentativas or get_setting(config, "BATCH_MAX_RETRIES", 3, int),
+        dir_dados=args.dados,
+    )
+    print(
+        f"{resumo['respondidas']} respondidas, {resumo['erros']} com erro, "
+        f"{resumo['puladas']} já concluídas (de {resumo['total']}).",
+        file=sys.stderr,
+    )
+    return 1 if resumo["erros"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+Cópia local e semeada da tabela de crédito (colunas do resources/data_dictionary.txt), em SQLite.
+"""
+
+import os
+import random
+import sqlite3
+from datetime import date
+
+UFS = [
+    "AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT",
+    "PA", "PB", "PE", "PI", "PR", "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO",
+]
+
+def _linha(aleatorio):
+    mes = aleatorio.randrange(24)
+    return (
+        date(2017 + mes // 12, mes % 12 + 1, 1).isoformat(),
+        1 if aleatorio.random() < 0.2 else 0,
+        aleatorio.choice(["F", "M", None]),
+        aleatorio.randint(18, 90),
+        "S" if aleatorio.random() < 0.01 else None,
+        aleatorio.choice(UFS + [None]),
+        aleatorio.choice(["A", "B", "C", "D", "E", None]),
+    )
+
+def criar_banco_credito(caminho, linhas=50000, semente=42):
+    """
+    Cria (ou reaproveita, se já existir com os mesmos parâmetros) o banco SQLite com a tabela
+    `credito` e retorna a URI SQLAlchemy dele.
+    """
+    versao = f"{linhas}:{semente}"
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    with sqlite3.connect(caminho) as conexao:
+        try:
+            existente = conexao.execute("SELECT versao FROM benchmark_meta").fetchone()
+        except sqlite3.OperationalError:
+            existente = None
+        if existente is None or existente[0] != versao:
+            aleatorio = random.Random(semente)
+            conexao.executescript(
+                "DROP TABLE IF EXISTS credito; DROP TABLE IF EXISTS benchmark_meta;"
+                "CREATE TABLE credito (REF_DATE TEXT, TARGET INTEGER, VAR2 TEXT, IDADE INTEGER,"
+                " VAR4 TEXT, VAR5 TEXT, VAR8 TEXT);"
+                "CREATE TABLE benchmark_meta (versao TEXT);"
+            )
+            conexao.executemany(
+                "INSERT INTO credito VALUES (?, ?, ?, ?, ?, ?, ?)", (_linha(aleatorio) for _ in range(linhas))
+            )
+            conexao.execute("INSERT INTO benchmark_meta VALUES (?)", (versao,))
+    return f"sqlite:///{caminho}"
@@ -0,0 +1,93 @@
+"""
+LLM local e determinística para os benchmarks, com latência configurável.
+
+Implementa a parte da interface do AzureChatOpenAI usada pelo projeto (invoke, ainvoke, stream e bind)
+e é injetada no registro de clientes com llm_utils.definir_fabrica_llm. A resposta depende apenas
+do tipo do prompt (identificado pelo texto do system) e da pergunta do corpus presente nele.
+"""
+
+import json
+import time
+import asyncio
+from types import SimpleNamespace
+from core.metrics import registrar_metrica
+from core.prompt_utils import contar_tokens
+
+# Trecho do system de cada prompt de llm_utils -> tipo do prompt
+MARCADORES = [
+    ("First decide whether the user's last message", "combinado"),
+    ("determining whether a query is a data request", "classificacao"),
+    ("specialist in creating and building SQL", "sql"),
+    ("answer the user's question in clear, natural English", "resposta"),
+    ("generate a single, clean Python code snippet", "grafico"),
+    ("maintain a running summary of a conversation", "resumo"),
+    ("friendly data analyst assistant", "casual"),
+]
+
+CODIGO_GRAFICO = "```python\nplt.bar(df.iloc[:, 0].astype(str), df.iloc[:, -1])\n```"
+
+class LLMFalso:
+    """
+    LLM falsa. `corpus` é a lista de itens {'pergunta', 'tipo', 'sql'}; `latencia` é o tempo fixo por
+    chamada (até o primeiro token, no streaming) e `latencia_por_token`, o tempo de geração de cada
+    token da resposta. Registra os tokens de cada prompt em benchmark.prompt_tokens.<tipo>.
+    """
+
+    def __init__(self, corpus, latencia=0.0, latencia_por_token=0.0, tokens_resposta=60):
+        self.corpus = list(corpus)
+        self.latencia = latencia
+        self.latencia_por_token = latencia_por_token
+        self.tokens_resposta = tokens_resposta
+        self.chamadas = 0
+
+    def bind(self, **kwargs):
+        return self
+
+    def invoke(self, prompt):
+        texto = self._responder(prompt)
+        time.sleep(self._duracao(texto))
+        return SimpleNamespace(content=texto)
+
+    async def ainvoke(self, prompt):
+        texto = self._responder(prompt)
+        await asyncio.sleep(self._duracao(texto))
+        return SimpleNamespace(content=texto)
+
+    def stream(self, prompt):
+        texto = self._responder(prompt)
+        time.sleep(self.latencia)
+        for palavra in texto.split(" "):
+            time.sleep(self.latencia_por_token)
+            yield SimpleNamespace(content=palavra + " ")
+
+    def _duracao(self, texto):
+        return self.latencia + self.latencia_por_token * len(texto.split(" "))
+
+    def _item(self, prompt):
+        # A pergunta atual é a última do corpus que aparece no prompt (as anteriores estão no histórico)
+        posicoes = [(prompt.rfind(item["pergunta"]), item) for item in self.corpus]
+        posicao, item = max(posicoes, key=lambda par: par[0])
+        return item if posicao >= 0 else {"pergunta": "", "tipo": "casual_interaction", "sql": None}
+
+    def _responder(self, prompt):
+        self.chamadas += 1
+        tipo = next((tipo for marcador, tipo in MARCADORES if marcador in prompt), "desconhecido")
+        registrar_metrica(f"benchmark.prompt_tokens.{tipo}", contar_tokens(prompt))
+        item = self._item(prompt)
+        if tipo == "classificacao":
+            return item["tipo"]
+        if tipo == "sql":
+            return f"```sql\n{item['sql']}\n```" if item.get("sql") else "NO_CONTEXT"
+        if tipo == "combinado":
+            if item["tipo"] == "sql_request":
+                return json.dumps({"intent": "sql_request", "sql": item["sql"], "reply": None})
+            return json.dumps({"intent": "casual_interaction", "sql": None, "reply": self._texto(item)})
+        if tipo == "grafico":
+            return CODIGO_GRAFICO
+        return self._texto(item)
+
+    def _texto(self, item):
+        palavras = f"Resposta para: {item['pergunta']}".split()
+        while len(palavras) < self.tokens_resposta:
+            palavras.append("dados")
+        return " ".join(palavras)
@@ -0,0 +1,229 @@
+"""
+Benchmark do pipeline pergunta -> resposta (o mesmo de main.py e page_chatbot.py).
+
+Repete o corpus de perguntas contra uma cópia local e semeada da tabela de crédito, com uma LLM falsa
+e determinística injetada no registro de clientes, e reporta:
+- percentis (p50/p95/p99) da latência de cada etapa do pipeline;
+- tokens dos prompts por tipo de chamada à LLM;
+- tempo, linhas e memória estimada das consultas SQL;
+- pico de memória Python de cada turno (tracemalloc).
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.run_benchmark --modo classic --repeticoes 5 --latencia 0.05
+    python -m benchmarks.run_benchmark --salvar-baseline     # grava benchmarks/baselines/<modo>.json
+    python -m benchmarks.run_benchmark                       # compara com a baseline; sai com código 1 se regredir
+"""
+
+import os
+import sys
+import json
+import argparse
+import tracemalloc
+from core import llm_utils
+from core.metrics import limpar_metricas, resumo_metricas
+from core.pipeline import (
+    carregar_contexto,
+    criar_historico,
+    processar_mensagem,
+    aprocessar_mensagem,
+    executar_assincrono,
+)
+from benchmarks.dados import criar_banco_credito
+from benchmarks.llm_falso import LLMFalso
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+CORPUS_PADRAO = os.path.join(DIRETORIO, "corpus.jsonl")
+BANCO_PADRAO = os.path.join(".cache", "benchmark_credito.sqlite3")
+
+def carregar_corpus(caminho=CORPUS_PADRAO):
+    with open(caminho, encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f if linha.strip()]
+
+def percentis(valores):
+    """
+    Retorna {'n', 'media', 'p50', 'p95', 'p99', 'max'} dos valores.
+    """
+    ordenados = sorted(valores)
+    if not ordenados:
+        return {"n": 0}
+    def p(q):
+        return ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))]
+    return {
+        "n": len(ordenados),
+        "media": sum(ordenados) / len(ordenados),
+        "p50": p(0.5),
+        "p95": p(0.95),
+        "p99": p(0.99),
+        "max": ordenados[-1],
+    }
+
+def montar_config(db_uri, modo, com_cache=False):
+    """
+    Configuração do benchmark: banco local, credenciais fictícias e nada gravado em disco
+    (caches, snapshot do schema e logs desativados, salvo com_cache=True).
+    """
+    return {
+        "SQLALCHEMY_DATABASE_URI": db_uri,
+        "AZURE_OPENAI_API_KEY": "benchmark",
+        "AZURE_OPENAI_ENDPOINT": "http://localhost",
+        "AZURE_OPENAI_DEPLOYMENT_NAME": "benchmark",
+        "AZURE_OPENAI_API_VERSION": "benchmark",
+        "AZURE_OPENAI_EMBEDDING_DEPLOYMENT": "",
+        "PIPELINE_MODE": modo,
+        "SQL_CACHE_ENABLED": str(com_cache),
+        "SQL_CACHE_PATH": ":memory:",
+        "RESULT_CACHE_ENABLED": str(com_cache),
+        "SCHEMA_CACHE_PATH": "",
+        "SCHEMA_REFRESH_SECONDS": "0",
+        "SCHEMA_RETRIEVAL_LOG_PATH": "",
+        "INTENT_ROUTER_MODEL_PATH": "",
+        "INTENT_ROUTER_LOG_PATH": "",
+    }
+
+def executar_benchmark(modo="classic", repeticoes=5, latencia=0.0, latencia_por_token=0.0, linhas=50000,
+                       stream=False, usar_async=False, com_cache=False, corpus=None, caminho_banco=BANCO_PADRAO):
+    """
+    Executa o corpus uma vez para aquecimento e depois `repeticoes` vezes (cada repetição é uma
+    conversa nova), e retorna o relatório.
+    """
+    corpus = corpus or carregar_corpus()
+    db_uri = criar_banco_credito(caminho_banco, linhas=linhas)
+    config = montar_config(db_uri, modo, com_cache)
+    llm = LLMFalso(corpus, latencia=latencia, latencia_por_token=latencia_por_token)
+    llm_utils.definir_fabrica_llm(lambda openai_config, temperature: llm)
+    tempos = {}
+    memoria_turno = []
+    try:
+        contexto = carregar_contexto(config)
+        # Aquecimento (não medido): importações tardias, cache de páginas do SQLite, tokenizador
+        history = criar_historico(config)
+        for item in corpus:
+            history.append(("user", item["pergunta"]))
+            resposta = processar_mensagem(item["pergunta"], history, contexto, stream=stream)["resposta"]
+            history.append(("assistant", resposta if isinstance(resposta, str) else "".join(resposta)))
+        limpar_metricas()
+        llm.chamadas = 0
+        for _ in range(repeticoes):
+            history = criar_historico(config)
+            for item in corpus:
+                history.append(("user", item["pergunta"]))
+                tracemalloc.start()
+                if usar_async:
+                    resultado = executar_assincrono(aprocessar_mensagem(item["pergunta"], history, contexto))
+                else:
+                    resultado = processar_mensagem(item["pergunta"], history, contexto, stream=stream)
+                resposta = resultado["resposta"]
+                if not isinstance(resposta, str):
+                    resposta = "".join(resposta)
+                memoria_turno.append(tracemalloc.get_traced_memory()[1] / (1024 * 1024))
+                tracemalloc.stop()
+                history.append(("assistant", resposta))
+                for etapa, segundos in resultado["tempos"].items():
+                    tempos.setdefault(etapa, []).append(segundos)
+    finally:
+        llm_utils.definir_fabrica_llm(None)
+
+    metricas = resumo_metricas()
+    return {
+        "parametros": {
+            "modo": modo, "repeticoes": repeticoes, "latencia": latencia, "latencia_por_token": latencia_por_token,
+            "linhas": linhas, "stream": stream, "async": usar_async, "com_cache": com_cache, "perguntas": len(corpus),
+        },
+        "etapas": {etapa: percentis(valores) for etapa, valores in tempos.items()},
+        "prompt_tokens": {
+            nome.rsplit(".", 1)[-1]: {"n": m["n"], "media": m["media"], "max": m["max"]}
+            for nome, m in metricas.items() if nome.startswith("benchmark.prompt_tokens.")
+        },
+        "banco": {nome: m for nome, m in metricas.items() if nome.startswith("sql.")},
+        "memoria_turno_mb": percentis(memoria_turno),
+        "chamadas_llm": llm.chamadas,
+    }
+
+def comparar_com_baseline(relatorio, baseline, tolerancia=0.2, folga_segundos=0.01):
+    """
+    Retorna a lista de regressões: etapas cujo p50 ou p95 passou da baseline em mais de `tolerancia`
+    (e de `folga_segundos`, para ignorar ruído em etapas muito rápidas) e tipos de prompt que ficaram
+    mais de `tolerancia` maiores.
+    """
+    regressoes = []
+    for etapa, atual in relatorio["etapas"].items():
+        anterior = baseline.get("etapas", {}).get(etapa)
+        if not anterior:
+            continue
+        for chave in ("p50", "p95"):
+            limite = anterior[chave] * (1 + tolerancia) + folga_segundos
+            if atual[chave] > limite:
+                regressoes.append(f"{etapa}.{chave}: {atual[chave]:.4f}s > {limite:.4f}s")
+    for tipo, atual in relatorio["prompt_tokens"].items():
+        anterior = baseline.get("prompt_tokens", {}).get(tipo)
+        if anterior and atual["media"] > anterior["media"] * (1 + tolerancia):
+            regressoes.append(f"prompt_tokens.{tipo}: {atual['media']:.0f} > {anterior['media']:.0f}")
+    return regressoes
+
+def formatar_relatorio(relatorio):
+    linhas = [f"Benchmark {json.dumps(relatorio['parametros'], ensure_ascii=False)}", "", "Etapa                 n     p50      p95      p99"]
+    for etapa, p in relatorio["etapas"].items():
+        linhas.append(f"{etapa:<20}{p['n']:>4}  {p['p50']:.4f}s  {p['p95']:.4f}s  {p['p99']:.4f}s")
+    linhas += ["", "Tokens por prompt (média / máx.)"]
+    for tipo, t in relatorio["prompt_tokens"].items():
+        linhas.append(f"{tipo:<20}{t['media']:>8.0f} / {t['max']:.0f}")
+    linhas += ["", "Banco"]
+    for nome, m in relatorio["banco"].items():
+        linhas.append(f"{nome:<24} média {m['media']:.4f}  p95 {m['p95']:.4f}")
+    memoria = relatorio["memoria_turno_mb"]
+    linhas += ["", f"Memória por turno: p50 {memoria['p50']:.1f} MB, p95 {memoria['p95']:.1f} MB"]
+    linhas.append(f"Chamadas à LLM: {relatorio['chamadas_llm']}")
+    return "\n".join(linhas)
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline com LLM falsa e SQLite local.")
+    parser.add_argument("--modo", default="classic", choices=["classic", "combined"])
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos por chamada à LLM")
+    parser.add_argument("--latencia-por-token", type=float, default=0.0, help="segundos por token gerado")
+    parser.add_argument("--linhas", type=int, default=50000, help="linhas da tabela credito")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--async", dest="usar_async", action="store_true")
+    parser.add_argument("--com-cache", action="store_true", help="mantém os caches de SQL e de resultados")
+    parser.add_argument("--corpus", default=CORPUS_PADRAO)
+    parser.add_argument("--baseline", help="arquivo da baseline (padrão: benchmarks/baselines/<modo>.json)")
+    parser.add_argument("--salvar-baseline", action="store_true")
+    parser.add_argument("--tolerancia", type=float, default=0.2)
+    parser.add_argument("--saida", help="grava o relatório em JSON neste arquivo")
+    args = parser.parse_args(argumentos)
+
+    relatorio = executar_benchmark(
+        modo=args.modo, repeticoes=args.repeticoes, latencia=args.latencia,
+        latencia_por_token=args.latencia_por_token, linhas=args.linhas, stream=args.stream,
+        usar_async=args.usar_async, com_cache=args.com_cache, corpus=carregar_corpus(args.corpus),
+    )
+    print(formatar_relatorio(relatorio))
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+
+    caminho_baseline = args.baseline or os.path.join(DIRETORIO, "baselines", f"{args.modo}.json")
+    if args.salvar_baseline:
+        os.makedirs(os.path.dirname(caminho_baseline), exist_ok=True)
+        with open(caminho_baseline, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+        print(f"\nBaseline salva em {caminho_baseline}")
+        return 0
+    if not os.path.exists(caminho_baseline):
+        print(f"\nSem baseline em {caminho_baseline}; use --salvar-baseline para criar.")
+        return 0
+    with open(caminho_baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("parametros") != relatorio["parametros"]:
+        print(f"\nAtenção: a baseline foi gerada com outros parâmetros: {baseline.get('parametros')}")
+    regressoes = comparar_com_baseline(relatorio, baseline, tolerancia=args.tolerancia)
+    if regressoes:
+        print("\nRegressões em relação à baseline:")
+        for regressao in regressoes:
+            print(f"- {regressao}")
+        return 1
+    print("\nSem regressões em relação à baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Benchmark de inicialização: tempo de importação dos pontos de entrada, medido com `python -X importtime`.
+
+Cada alvo é importado em um processo novo (sem os módulos em cache do processo atual); o relatório
+traz o tempo total (o menor entre as repetições), os módulos mais lentos e as bibliotecas pesadas que
+não deveriam ser importadas na inicialização (o langchain/openai só carrega no primeiro uso da LLM e
+as bibliotecas de gráficos só quando um gráfico é pedido; o main.py carrega o pipeline em segundo plano).
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.startup --salvar-baseline     # grava benchmarks/baselines/startup.json
+    python -m benchmarks.startup                       # compara com a baseline; sai com código 1 se regredir
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(DIRETORIO)
+BASELINE_PADRAO = os.path.join(DIRETORIO, "baselines", "startup.json")
+
+_BIBLIOTECAS_GRAFICOS = ["matplotlib", "seaborn", "plotly"]
+_BIBLIOTECAS_LLM = ["langchain_openai", "openai"]
+
+# Módulo -> bibliotecas que não podem aparecer na importação dele
+ALVOS = {
+    "main": _BIBLIOTECAS_LLM + _BIBLIOTECAS_GRAFICOS + ["pandas", "sqlalchemy", "sqlglot"],
+    "core.pipeline": _BIBLIOTECAS_LLM + _BIBLIOTECAS_GRAFICOS,
+}
+
+_REGEX_LINHA = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$")
+
+def medir_importacao(modulo):
+    """
+    Importa `modulo` em um processo novo com -X importtime. Retorna {módulo importado: segundos
+    acumulados} (tempo do módulo mais o das suas dependências importadas por ele).
+    """
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=RAIZ, capture_output=True, text=True, check=True,
+    )
+    linhas = [match for match in map(_REGEX_LINHA.match, processo.stderr.splitlines()) if match]
+    # O -X importtime lista cada módulo ao terminar de importá-lo, com recuo pelo nível de aninhamento;
+    # a árvore do alvo são as linhas desde a última importação de nível zero anterior a ele (as
+    # anteriores são do próprio interpretador, como o site)
+    fim = max(i for i, match in enumerate(linhas) if match.group(4) == modulo)
+    inicio = max((i + 1 for i, match in enumerate(linhas[:fim]) if len(match.group(3)) <= 1), default=0)
+    return {match.group(4): int(match.group(2)) / 1e6 for match in linhas[inicio:fim + 1]}
+
+def executar_benchmark(alvos=None, repeticoes=3, top=10):
+    """
+    Mede a importação de cada alvo `repeticoes` vezes. Retorna {'alvos': {módulo: {'total', 'modulos',
+    'mais_lentos', 'proibidos'}}}; 'total' é o menor tempo entre as repetições.
+    """
+    alvos = alvos or ALVOS
+    relatorio = {"parametros": {"repeticoes": repeticoes}, "alvos": {}}
+    for modulo, proibidos in alvos.items():
+        medicoes = [medir_importacao(modulo) for _ in range(repeticoes)]
+        melhor = min(medicoes, key=lambda tempos: tempos.get(modulo, 0.0))
+        # Só os módulos de primeiro nível: os submódulos entram no tempo acumulado do pacote
+        pacotes = {nome: segundos for nome, segundos in melhor.items() if "." not in nome and nome != modulo}
+        relatorio["alvos"][modulo] = {
+            "total": round(melhor.get(modulo, 0.0), 4),
+            "modulos": len(melhor),
+            "mais_lentos": {nome: round(segundos, 4) for nome, segundos in
+                            sorted(pacotes.items(), key=lambda item: -item[1])[:top]},
+            "proibidos": sorted(nome for nome in proibidos if nome in melhor),
+        }
+    return relatorio
+
+def comparar_com_baseline(relatorio, baseline, tolerancia=0.5, folga_segundos=0.05):
+    """
+    Retorna a lista de regressões: alvos que importam bibliotecas proibidas e alvos cujo tempo
+    total passou da baseline em mais de `tolerancia` (e de `folga_segundos`).
+    """
+    regressoes = []
+    for modulo, atual in relatorio["alvos"].items():
+        if atual["proibidos"]:
+            regressoes.append(f"{modulo}: importa {', '.join(atual['proibidos'])} na inicialização")
+        anterior = baseline.get("alvos", {}).get(modulo)
+        if not anterior:
+            continue
+        limite = anterior["total"] * (1 + tolerancia) + folga_segundos
+        if atual["total"] > limite:
+            regressoes.append(f"{modulo}.total: {atual['total']:.4f}s > {limite:.4f}s")
+    return regressoes
+
+def formatar_relatorio(relatorio):
+    linhas = []
+    for modulo, dados in relatorio["alvos"].items():
+        linhas.append(f"import {modulo}: {dados['total']:.4f}s ({dados['modulos']} módulos)")
+        for nome, segundos in dados["mais_lentos"].items():
+            linhas.append(f"  {nome:<28}{segundos:.4f}s")
+        if dados["proibidos"]:
+            linhas.append(f"  proibidos: {', '.join(dados['proibidos'])}")
+        linhas.append("")
+    return "\n".join(linhas).rstrip()
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Tempo de importação dos pontos de entrada (-X importtime).")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="módulos mais lentos listados por alvo")
+    parser.add_argument("--baseline", default=BASELINE_PADRAO)
+    parser.add_argument("--salvar-baseline", action="store_true")
+    parser.add_argument("--tolerancia", type=float, default=0.5)
+    args = parser.parse_args(argumentos)
+
+    relatorio = executar_benchmark(repeticoes=args.repeticoes, top=args.top)
+    print(formatar_relatorio(relatorio))
+
+    if args.salvar_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+        print(f"\nBaseline salva em {args.baseline}")
+        return 0
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressoes = comparar_com_baseline(relatorio, baseline, tolerancia=args.tolerancia)
+    if regressoes:
+        print("\nRegressões na inicialização:")
+        for regressao in regressoes:
+            print(f"- {regressao}")
+        return 1
+    print("\nSem regressões na inicialização.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,4 +4,19 @@ def load_config(path="Configuration.env"):
     """
     Carrega as configurações do arquivo .env.
     """
-    return dotenv_values(path)
\ No newline at end of file
+    return dotenv_values(path)
+
+def get_setting(config, key, default=None, cast=str):
+    """
+    Lê uma configuração opcional, convertendo o valor com `cast`.
+    Retorna `default` se a chave não existir, estiver vazia ou não puder ser convertida.
+    """
+    value = (config or {}).get(key)
+    if value is None or str(value).strip() == "":
+        return default
+    if cast is bool:
+        return str(value).strip().lower() in ("1", "true", "sim", "yes", "on")
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return default
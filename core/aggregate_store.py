@@ -0,0 +1,386 @@
+"""
+Cubo de agregados local para as consultas de GROUP BY mais comuns.
+
+A tabela de crédito tem poucas dimensões de baixa cardinalidade (VAR2 gênero, VAR5 UF, VAR8 classe
+social, TARGET e REF_DATE) e a maior parte das perguntas agrega IDADE por elas. CuboAgregados guarda,
+em SQLite, uma linha por combinação das dimensões com a contagem de linhas e, para cada medida,
+a contagem de não nulos, a soma, o mínimo e o máximo.
+
+Antes de ir ao banco, executar_sql pede ao cubo para responder a consulta (CuboAgregados.consultar):
+uma consulta elegível (um único SELECT sobre a tabela do cubo, sem joins nem subconsultas, filtrando
+e agrupando só por dimensões e agregando só medidas) é reescrita com o sqlglot para o cubo:
+COUNT(*) vira SUM(n), AVG(IDADE) vira SUM(soma_IDADE) / SUM(n_IDADE) e assim por diante.
+Consultas não elegíveis, ou que falham no cubo, seguem para o banco normalmente.
+
+As colunas de data ficam no cubo como texto ISO ('YYYY-MM-DD', ou 'YYYY-MM-DD HH:MM:SS' quando há
+horário), e os literais comparados a elas na consulta são convertidos para o mesmo formato: o driver
+pode devolver a data como datetime.date (o pyodbc no SQL Server), que o to_sql gravaria como
+'2023-01-01 00:00:00' e não casaria com WHERE REF_DATE = '2023-01-01'.
+
+O cubo é reconstruído por completo na primeira carga e a cada `intervalo_completo` segundos; entre
+as reconstruções, uma thread de fundo atualiza a cada `intervalo_atualizacao` segundos só as linhas
+a partir da maior data de referência já carregada. As respostas do cubo podem, portanto, estar até
+um intervalo atrasadas em relação ao banco.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+import pandas as pd
+from config import get_setting
+from core.db_utils import executar_sql
+from core.df_utils import otimizar_tipos
+from core.metrics import registrar_metrica
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:
+    sqlglot = None
+
+TABELA_CUBO = "cubo"
+
+_FORMATOS_DATA = {"year": "%Y", "month": "%m", "day": "%d"}
+_PREFIXOS_INTEIROS = ("int", "bigint", "smallint", "tinyint", "integer")
+_PREFIXOS_DATA = ("date", "datetime", "smalldatetime")
+_FORMATO_DIA = "%Y-%m-%d"
+_FORMATO_DATA_HORA = "%Y-%m-%d %H:%M:%S"
+_COMPARACOES = (exp.EQ, exp.NEQ, exp.GT, exp.GTE, exp.LT, exp.LTE, exp.Between, exp.In) if sqlglot else ()
+
+def _inteiro(tipo):
+    return str(tipo or "").lower().startswith(_PREFIXOS_INTEIROS)
+
+def _parte_da_data(unidade, coluna):
+    unidade = unidade.lower()
+    if unidade in ("quarter", "qq", "q"):
+        return f"((CAST(STRFTIME('%m', {coluna}) AS INTEGER) + 2) / 3)"
+    unidade = {"yy": "year", "yyyy": "year", "mm": "month", "m": "month", "dd": "day", "d": "day"}.get(unidade, unidade)
+    if unidade not in _FORMATOS_DATA:
+        return None
+    return f"CAST(STRFTIME('{_FORMATOS_DATA[unidade]}', {coluna}) AS INTEGER)"
+
+class CuboAgregados:
+    """
+    Agregados de `medidas` por todas as combinações de `dimensoes` da `tabela` do banco,
+    guardados em SQLite (`caminho`, ":memory:" por padrão). `tipos` ({coluna: tipo}) vem do
+    catálogo do schema e define as medidas inteiras (somadas como BIGINT) e as datas.
+    """
+
+    def __init__(self, engine, tabela, dimensoes, medidas, tipos=None, caminho=":memory:", coluna_data="REF_DATE",
+                 max_linhas=500000, intervalo_atualizacao=900, intervalo_completo=86400):
+        self.engine = engine
+        self.tabela = tabela
+        self.dimensoes = list(dimensoes)
+        self.medidas = list(medidas)
+        self.tipos = {coluna.lower(): tipo for coluna, tipo in (tipos or {}).items()}
+        self.coluna_data = coluna_data if coluna_data in self.dimensoes else None
+        self.max_linhas = max_linhas
+        self.intervalo_atualizacao = intervalo_atualizacao
+        self.intervalo_completo = intervalo_completo
+        self.pronto = False
+        self.atualizado_em = None
+        self.hits = 0
+        self.misses = 0
+        self._construido_em = None
+        self._dimensoes = {d.lower() for d in self.dimensoes}
+        self._medidas = {m.lower(): m for m in self.medidas}
+        self._formatos_data = {}
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+        if caminho != ":memory:" and os.path.dirname(caminho):
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        if intervalo_atualizacao:
+            self._thread = threading.Thread(target=self._atualizar_periodicamente, name="aggregate-store", daemon=True)
+            self._thread.start()
+
+    def _sql_construcao(self, desde=None):
+        colunas = ["COUNT(*) AS n"]
+        for medida in self.medidas:
+            valor = f"CAST({medida} AS BIGINT)" if _inteiro(self.tipos.get(medida.lower())) else medida
+            colunas += [
+                f"COUNT({medida}) AS n_{medida}", f"SUM({valor}) AS soma_{medida}",
+                f"MIN({medida}) AS min_{medida}", f"MAX({medida}) AS max_{medida}",
+            ]
+        dimensoes = ", ".join(self.dimensoes)
+        filtro = f" WHERE {self.coluna_data} >= :desde" if desde is not None else ""
+        return f"SELECT {dimensoes}, {', '.join(colunas)} FROM {self.tabela}{filtro} GROUP BY {dimensoes}"
+
+    def atualizar(self, completo=False):
+        """
+        Atualiza o cubo a partir do banco: por completo (na primeira carga, com completo=True ou quando
+        passou `intervalo_completo`) ou só a partir da maior data de referência carregada, que pode
+        estar incompleta. Retorna True se o cubo foi atualizado.
+        """
+        completo = (completo or not self.pronto or self.coluna_data is None
+                    or (self.intervalo_completo and time.monotonic() - self._construido_em >= self.intervalo_completo))
+        desde = None
+        if not completo:
+            with self._lock:
+                desde = self._conn.execute(f"SELECT MAX({self.coluna_data}) FROM {TABELA_CUBO}").fetchone()[0]
+            completo = desde is None
+        inicio = time.perf_counter()
+        parametros = {"desde": desde} if desde is not None else None
+        df = executar_sql(self.engine, self._sql_construcao(desde), max_linhas=self.max_linhas, parametros=parametros)
+        if df is None:
+            return False
+        if df.attrs.get("truncado"):
+            print(f"Cubo de agregados desativado: mais de {self.max_linhas} combinações de dimensões.")
+            return False
+        df = self._datas_em_texto(df)
+        with self._lock:
+            if completo:
+                df.to_sql(f"{TABELA_CUBO}_novo", self._conn, if_exists="replace", index=False)
+                self._conn.execute(f"DROP TABLE IF EXISTS {TABELA_CUBO}")
+                self._conn.execute(f"ALTER TABLE {TABELA_CUBO}_novo RENAME TO {TABELA_CUBO}")
+                self._construido_em = time.monotonic()
+            else:
+                self._conn.execute(f"DELETE FROM {TABELA_CUBO} WHERE {self.coluna_data} >= ?", (desde,))
+                df.to_sql(TABELA_CUBO, self._conn, if_exists="append", index=False)
+            self._conn.commit()
+            self.pronto = True
+            self.atualizado_em = time.time()
+        registrar_metrica("cubo.atualizacao", time.perf_counter() - inicio)
+        return True
+
+    def _formato_data(self, coluna, serie):
+        """
+        Formato ISO em que a dimensão de data é guardada, ou None se a coluna não é de data.
+        Pelo tipo do catálogo (DATE só com o dia) ou, sem ele, pelos valores (com horário só se algum tiver).
+        """
+        if coluna.lower() in self._formatos_data:
+            return self._formatos_data[coluna.lower()]
+        tipo = str(self.tipos.get(coluna.lower(), "")).lower()
+        if tipo.startswith(_PREFIXOS_DATA):
+            return _FORMATO_DIA if tipo == "date" else _FORMATO_DATA_HORA
+        if not (pd.api.types.is_datetime64_any_dtype(serie)
+                or pd.api.types.infer_dtype(serie, skipna=True) in ("date", "datetime")):
+            return None
+        datas = pd.to_datetime(serie).dropna()
+        return _FORMATO_DIA if (datas == datas.dt.normalize()).all() else _FORMATO_DATA_HORA
+
+    def _datas_em_texto(self, df):
+        """
+        Converte as dimensões de data para texto ISO, no formato já usado pelo cubo.
+        """
+        for coluna in self.dimensoes:
+            if coluna not in df.columns:
+                continue
+            formato = self._formato_data(coluna, df[coluna])
+            if formato is None:
+                continue
+            self._formatos_data[coluna.lower()] = formato
+            if not pd.api.types.is_string_dtype(df[coluna]):
+                df[coluna] = pd.to_datetime(df[coluna]).dt.strftime(formato)
+        return df
+
+    def _normalizar_datas(self, arvore):
+        """
+        Converte os literais comparados às dimensões de data para o formato guardado no cubo.
+        Retorna False se algum literal não é uma data reconhecível (a consulta fica com o banco).
+        """
+        for literal in list(arvore.find_all(exp.Literal)):
+            if not literal.is_string:
+                continue
+            alvo = literal.parent if isinstance(literal.parent, exp.Cast) else literal
+            comparacao = alvo.parent
+            if not isinstance(comparacao, _COMPARACOES):
+                continue
+            if isinstance(comparacao, (exp.Between, exp.In)) or comparacao.expression is alvo:
+                coluna = comparacao.this
+            else:
+                coluna = comparacao.expression
+            if not isinstance(coluna, exp.Column) or coluna.name.lower() not in self._formatos_data:
+                continue
+            try:
+                valor = pd.Timestamp(literal.this)
+            except (ValueError, TypeError):
+                return False
+            alvo.replace(exp.Literal.string(valor.strftime(self._formatos_data[coluna.name.lower()])))
+        return True
+
+    def parar(self):
+        """
+        Encerra a thread de atualização.
+        """
+        self._parar.set()
+
+    def _atualizar_periodicamente(self):
+        while True:
+            try:
+                self.atualizar()
+            except Exception as e:
+                print("Erro ao atualizar o cubo de agregados:", str(e))
+            if self._parar.wait(self.intervalo_atualizacao):
+                return
+
+    def _agregado_no_cubo(self, agregado):
+        """
+        Expressão equivalente ao agregado sobre as colunas do cubo, ou None se não houver.
+        """
+        argumento = agregado.this
+        if isinstance(agregado, exp.Count):
+            if isinstance(argumento, exp.Star):
+                return "SUM(n)"
+            if isinstance(argumento, exp.Distinct):
+                # Contagem de valores distintos só das dimensões, que o cubo mantém
+                colunas = list(argumento.find_all(exp.Column))
+                return agregado.sql(dialect="sqlite") if all(c.name.lower() in self._dimensoes for c in colunas) else None
+        convertido = isinstance(argumento, exp.Cast)
+        if convertido:
+            argumento = argumento.this
+        if not isinstance(argumento, exp.Column):
+            return None
+        nome = argumento.name.lower()
+        if isinstance(agregado, exp.Count) and nome in self._dimensoes:
+            return f"SUM(CASE WHEN {argumento.name} IS NOT NULL THEN n ELSE 0 END)"
+        if nome not in self._medidas:
+            return None
+        medida = self._medidas[nome]
+        if isinstance(agregado, exp.Count):
+            return f"SUM(n_{medida})"
+        if isinstance(agregado, exp.Avg):
+            expressao = f"SUM(soma_{medida}) * 1.0 / SUM(n_{medida})"
+        elif isinstance(agregado, exp.Sum):
+            expressao = f"SUM(soma_{medida})"
+        elif isinstance(agregado, exp.Min):
+            expressao = f"MIN(min_{medida})"
+        elif isinstance(agregado, exp.Max):
+            expressao = f"MAX(max_{medida})"
+        else:
+            return None
+        # Como no T-SQL, agregados de uma coluna inteira (sem CAST) são inteiros, e a média é truncada
+        if _inteiro(self.tipos.get(nome)) and not convertido:
+            return f"CAST({expressao} AS INTEGER)"
+        return expressao
+
+    def reescrever(self, sql):
+        """
+        Reescreve a consulta (T-SQL) para o cubo, em SQL do SQLite, ou retorna None se ela não é elegível.
+        """
+        if sqlglot is None:
+            return None
+        try:
+            arvore = sqlglot.parse_one(sql, read="tsql")
+        except sqlglot.errors.ParseError:
+            return None
+        if not isinstance(arvore, exp.Select) or arvore.find(exp.Join, exp.Subquery, exp.With, exp.Window, exp.Union):
+            return None
+        tabelas = list(arvore.find_all(exp.Table))
+        if len(tabelas) != 1 or tabelas[0].name.lower() != self.tabela.lower():
+            return None
+        agregados = list(arvore.find_all(exp.AggFunc))
+        if not agregados and not arvore.args.get("group"):
+            return None
+        apelidos = {e.alias.lower() for e in arvore.expressions if isinstance(e, exp.Alias)}
+        for coluna in arvore.find_all(exp.Column):
+            if coluna.find_ancestor(exp.AggFunc) is None and coluna.name.lower() not in self._dimensoes | apelidos:
+                return None
+
+        # Agregados sem apelido na projeção mantêm o texto original como nome da coluna
+        for expressao in list(arvore.expressions):
+            if not isinstance(expressao, exp.Alias) and isinstance(expressao, exp.AggFunc):
+                expressao.replace(exp.alias_(expressao.copy(), expressao.sql(dialect="tsql"), quoted=True))
+        for agregado in list(arvore.find_all(exp.AggFunc)):
+            if agregado.find_ancestor(exp.AggFunc) is not None:
+                return None
+            substituto = self._agregado_no_cubo(agregado)
+            if substituto is None:
+                return None
+            agregado.replace(sqlglot.parse_one(substituto, read="sqlite"))
+        for funcao in list(arvore.find_all(exp.Year, exp.Month, exp.Day, exp.Extract)):
+            if isinstance(funcao, exp.Extract):
+                unidade, coluna = funcao.this.name, funcao.expression
+            else:
+                unidade, coluna = type(funcao).__name__, funcao.this
+            substituto = _parte_da_data(unidade, coluna.sql(dialect="sqlite"))
+            if substituto is None:
+                return None
+            funcao.replace(sqlglot.parse_one(substituto, read="sqlite"))
+        if not self._normalizar_datas(arvore):
+            return None
+        tabela = tabelas[0]
+        tabela.set("this", exp.to_identifier(TABELA_CUBO))
+        tabela.set("db", None)
+        tabela.set("catalog", None)
+        return arvore.sql(dialect="sqlite")
+
+    def consultar(self, sql, parametros=None, max_linhas=None):
+        """
+        Responde a consulta pelo cubo. Retorna o DataFrame ou None se o cubo não está pronto,
+        a consulta não é elegível ou falhou no SQLite (e deve ir ao banco).
+        """
+        if not self.pronto:
+            return None
+        sql_cubo = self.reescrever(sql)
+        if sql_cubo is None:
+            self.misses += 1
+            return None
+        inicio = time.perf_counter()
+        try:
+            with self._lock:
+                df = pd.read_sql_query(sql_cubo, self._conn, params=parametros)
+        except Exception as e:
+            print("Consulta não respondida pelo cubo de agregados:", str(e))
+            self.misses += 1
+            return None
+        for coluna in df.columns:
+            if str(self.tipos.get(str(coluna).lower(), "")).lower().startswith(_PREFIXOS_DATA):
+                df[coluna] = pd.to_datetime(df[coluna], errors="coerce")
+        truncado = bool(max_linhas) and len(df) > max_linhas
+        df = otimizar_tipos(df.iloc[:max_linhas] if truncado else df)
+        df.attrs["truncado"] = truncado
+        self.hits += 1
+        registrar_metrica("cubo.consulta", time.perf_counter() - inicio)
+        return df
+
+_cubos = {}
+_cubos_lock = threading.Lock()
+
+def _lista(valor):
+    return [item.strip() for item in str(valor).split(",") if item.strip()]
+
+def obter_cubo_agregados(config, engine, catalogo=None):
+    """
+    Retorna o cubo de agregados compartilhado pelo processo, ou None se AGGREGATE_STORE_ENABLED=false
+    ou se nenhuma tabela do catálogo tem todas as dimensões e medidas configuradas.
+    A tabela vem de AGGREGATE_STORE_TABLE ou, sem ela, é a primeira do catálogo com essas colunas.
+    """
+    if not get_setting(config, "AGGREGATE_STORE_ENABLED", False, bool):
+        return None
+    dimensoes = _lista(get_setting(config, "AGGREGATE_DIMENSIONS", "VAR2,VAR5,VAR8,TARGET,REF_DATE"))
+    medidas = _lista(get_setting(config, "AGGREGATE_MEASURES", "IDADE"))
+    tabelas = catalogo.tabelas if catalogo is not None else {}
+    tabela = get_setting(config, "AGGREGATE_STORE_TABLE", "")
+    if not tabela:
+        necessarias = {c.lower() for c in dimensoes + medidas}
+        tabela = next(
+            (nome for nome, colunas in tabelas.items() if necessarias <= {c.lower() for c, _ in colunas}), None
+        )
+    if not tabela:
+        print("Cubo de agregados desativado: nenhuma tabela tem as dimensões e medidas configuradas.")
+        return None
+    chave = (engine.url.render_as_string(hide_password=True), tabela)
+    with _cubos_lock:
+        if chave not in _cubos:
+            _cubos[chave] = CuboAgregados(
+                engine, tabela, dimensoes, medidas,
+                tipos=dict(tabelas.get(tabela, [])),
+                caminho=get_setting(config, "AGGREGATE_STORE_PATH", ":memory:"),
+                coluna_data=get_setting(config, "AGGREGATE_DATE_COLUMN", "REF_DATE"),
+                max_linhas=get_setting(config, "AGGREGATE_MAX_ROWS", 500000, int),
+                intervalo_atualizacao=get_setting(config, "AGGREGATE_REFRESH_SECONDS", 900, float),
+                intervalo_completo=get_setting(config, "AGGREGATE_FULL_REFRESH_SECONDS", 86400, float),
+            )
+        return _cubos[chave]
+
+def limpar_cubos():
+    """
+    Encerra e descarta os cubos compartilhados.
+    """
+    with _cubos_lock:
+        for cubo in _cubos.values():
+            cubo.parar()
+        _cubos.clear()
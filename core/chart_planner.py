@@ -0,0 +1,181 @@
+"""
+Planejamento local de gráficos, sem chamada à LLM.
+
+Os resultados das consultas costumam ter formatos previsíveis ("média de idade por UF": uma coluna
+categórica e uma numérica). planejar_grafico inspeciona os tipos e a cardinalidade das colunas e
+escolhe um gráfico:
+- categórica + numérica(s): barras (até MAX_CATEGORIAS categorias, as maiores);
+- só uma categórica: barras com a contagem de cada categoria;
+- data (datetime ou texto ISO) + numérica(s): linha, com redução para até MAX_PONTOS pontos por média em blocos;
+- duas categóricas + numérica: mapa de calor;
+- só uma numérica (com pelo menos MIN_LINHAS_HISTOGRAMA linhas): histograma.
+
+O plano vira um código de plotagem comum (codigo_do_plano), renderizado e armazenado em cache como
+o código gerado pela LLM. Formatos não reconhecidos retornam None, e o código é pedido à LLM.
+"""
+
+import re
+import pandas as pd
+
+MAX_CATEGORIAS = 30
+MAX_CATEGORIAS_HEATMAP = 30
+MAX_PONTOS = 2000
+MAX_SERIES = 4
+MIN_LINHAS_HISTOGRAMA = 10
+
+_PREFIXOS_SOMA = ("qtd", "quant", "count", "cont", "total", "soma", "sum", "num", "n_")
+_REGEX_DATA_ISO = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$")
+
+def _agregacao(coluna):
+    """
+    Agregação usada quando a categoria se repete: soma para contagens e totais, média para o resto.
+    """
+    nome = str(coluna).lower()
+    return "sum" if nome == "n" or nome.startswith(_PREFIXOS_SOMA) else "mean"
+
+def _data_em_texto(serie):
+    """
+    Indica se a coluna guarda datas como texto ISO (como o SQLite as retorna) ou como datetime.date.
+    """
+    valores = serie.dropna()
+    if valores.empty or pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+        return False
+    if pd.api.types.infer_dtype(valores, skipna=True) == "date":
+        return True
+    return bool(valores.astype(str).str.match(_REGEX_DATA_ISO).all())
+
+def _papeis(df):
+    """
+    Separa as colunas em datas, numéricas e categóricas. Inteiros com poucos valores distintos
+    contam como categóricos quando há outra coluna numérica e nenhuma data (por exemplo, ano ou faixa).
+    """
+    datas, numericas, categoricas = [], [], []
+    for coluna in df.columns:
+        serie = df[coluna]
+        if pd.api.types.is_datetime64_any_dtype(serie) or _data_em_texto(serie):
+            datas.append(coluna)
+        elif pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+            numericas.append(coluna)
+        else:
+            categoricas.append(coluna)
+    if not datas and not categoricas and len(numericas) == 2:
+        inteiras = [c for c in numericas if pd.api.types.is_integer_dtype(df[c]) and df[c].nunique() <= MAX_CATEGORIAS]
+        if len(inteiras) == 1 and _agregacao(inteiras[0]) == "mean":
+            categoricas.append(inteiras[0])
+            numericas.remove(inteiras[0])
+    return datas, numericas, categoricas
+
+def planejar_grafico(df):
+    """
+    Retorna o plano do gráfico ({'tipo', 'x', 'y', ...}) para o formato do DataFrame, ou None
+    se o formato não for reconhecido.
+    """
+    if df is None or df.empty:
+        return None
+    datas, numericas, categoricas = _papeis(df)
+
+    if len(datas) == 1 and not categoricas and 1 <= len(numericas) <= MAX_SERIES:
+        return {
+            "tipo": "linha", "x": datas[0], "y": numericas, "reduzir": len(df) > MAX_PONTOS,
+            "converter_datas": not pd.api.types.is_datetime64_any_dtype(df[datas[0]]),
+        }
+    if datas:
+        return None
+    if len(categoricas) == 1 and 1 <= len(numericas) <= MAX_SERIES:
+        cardinalidade = df[categoricas[0]].nunique()
+        return {
+            "tipo": "barra", "x": categoricas[0], "y": numericas,
+            "agregacao": {coluna: _agregacao(coluna) for coluna in numericas},
+            "limitar": cardinalidade > MAX_CATEGORIAS, "horizontal": min(cardinalidade, MAX_CATEGORIAS) > 10,
+        }
+    if len(categoricas) == 1 and not numericas:
+        cardinalidade = df[categoricas[0]].nunique()
+        return {
+            "tipo": "contagem", "x": categoricas[0],
+            "limitar": cardinalidade > MAX_CATEGORIAS, "horizontal": min(cardinalidade, MAX_CATEGORIAS) > 10,
+        }
+    if len(categoricas) == 2 and len(numericas) == 1:
+        if all(df[coluna].nunique() <= MAX_CATEGORIAS_HEATMAP for coluna in categoricas):
+            return {
+                "tipo": "heatmap", "linhas": categoricas[0], "colunas": categoricas[1], "valor": numericas[0],
+                "agregacao": _agregacao(numericas[0]),
+            }
+        return None
+    if not categoricas and len(numericas) == 1 and len(df) >= MIN_LINHAS_HISTOGRAMA:
+        return {"tipo": "histograma", "x": numericas[0]}
+    return None
+
+def codigo_do_plano(plano):
+    """
+    Gera o código de plotagem (matplotlib/seaborn sobre `df`) do plano. A agregação é feita com
+    groupby/pivot_table e as séries longas são reduzidas antes de plotar.
+    """
+    tipo = plano["tipo"]
+    if tipo == "barra":
+        x, y = plano["x"], plano["y"]
+        linhas = [f"dados = df.groupby({x!r}, observed=True).agg({plano['agregacao']!r})"]
+        linhas.append(f"dados = dados.sort_values({y[0]!r}, ascending=False)")
+        if plano["limitar"]:
+            linhas.append(f"dados = dados.head({MAX_CATEGORIAS})")
+        titulo = f"{', '.join(map(str, y))} por {x}" + (f" (maiores {MAX_CATEGORIAS})" if plano["limitar"] else "")
+        tipo_barra = "barh" if plano["horizontal"] else "bar"
+        if plano["horizontal"]:
+            linhas.append("dados = dados.iloc[::-1]")
+        linhas += [
+            f"ax = dados.plot(kind={tipo_barra!r}, figsize=(10, 6), legend={len(y) > 1})",
+            f"ax.set_title({titulo!r})",
+        ]
+    elif tipo == "contagem":
+        x = plano["x"]
+        linhas = [f"dados = df[{x!r}].value_counts()"]
+        if plano["limitar"]:
+            linhas.append(f"dados = dados.head({MAX_CATEGORIAS})")
+        if plano["horizontal"]:
+            linhas.append("dados = dados.iloc[::-1]")
+        tipo_barra = "barh" if plano["horizontal"] else "bar"
+        linhas += [
+            f"ax = dados.plot(kind={tipo_barra!r}, figsize=(10, 6))",
+            f"ax.set_title({'Quantidade por ' + str(x)!r})",
+        ]
+    elif tipo == "linha":
+        x, y = plano["x"], plano["y"]
+        linhas = [f"dados = df.sort_values({x!r})[{[x] + y!r}]"]
+        if plano.get("converter_datas"):
+            linhas.append(f"dados[{x!r}] = pd.to_datetime(dados[{x!r}])")
+        if plano["reduzir"]:
+            # Média em blocos consecutivos: preserva a forma da série com no máximo MAX_PONTOS pontos
+            linhas += [
+                "import numpy as np",
+                f"blocos = np.arange(len(dados)) * {MAX_PONTOS} // len(dados)",
+                f"dados = dados.groupby(blocos).agg({dict([(x, 'first')] + [(c, 'mean') for c in y])!r})",
+            ]
+        titulo = f"{', '.join(map(str, y))} ao longo de {x}"
+        linhas += [
+            f"ax = dados.plot(x={x!r}, y={y!r}, figsize=(10, 6), legend={len(y) > 1})",
+            f"ax.set_title({titulo!r})",
+        ]
+    elif tipo == "heatmap":
+        titulo = f"{plano['valor']} por {plano['linhas']} e {plano['colunas']}"
+        linhas = [
+            f"dados = df.pivot_table(index={plano['linhas']!r}, columns={plano['colunas']!r}, "
+            f"values={plano['valor']!r}, aggfunc={plano['agregacao']!r}, observed=True)",
+            "fig, ax = plt.subplots(figsize=(10, 6))",
+            "sns.heatmap(dados, annot=dados.size <= 100, fmt='.3g', cmap='Blues', ax=ax)",
+            f"ax.set_title({titulo!r})",
+        ]
+    else:
+        x = plano["x"]
+        linhas = [
+            f"ax = df[{x!r}].plot(kind='hist', bins=30, figsize=(10, 6))",
+            f"ax.set_title({'Distribuição de ' + str(x)!r})",
+        ]
+    linhas.append("plt.tight_layout()")
+    return "\n".join(linhas)
+
+def gerar_codigo_grafico_local(df):
+    """
+    Retorna o código do gráfico planejado localmente para o DataFrame, ou None se o formato
+    não for reconhecido (e o código deve ser gerado pela LLM).
+    """
+    plano = planejar_grafico(df)
+    return codigo_do_plano(plano) if plano is not None else None
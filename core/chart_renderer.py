@@ -0,0 +1,364 @@
+"""
+Renderização dos gráficos gerados pela LLM fora do processo do Streamlit.
+
+- validar_codigo_grafico analisa a AST do código: só importações de bibliotecas de plotagem,
+  sem definições de funções/classes ou builtins perigosos, e só atributos de uma lista de funções de
+  plotagem e métodos de DataFrame (um nível a partir de cada módulo: plt.bar, mas não plt.matplotlib.x).
+- PoolGraficos mantém processos de renderização (core/chart_worker.py) com limites de CPU,
+  memória e tempo; um processo que estoura um limite é encerrado e substituído.
+- CacheGraficos guarda, por fingerprint do DataFrame, o código gerado para cada pergunta e o
+  gráfico renderizado (PNG ou JSON do Plotly) para cada código, evitando tanto a chamada à LLM
+  quanto a renderização quando o mesmo gráfico é pedido de novo.
+"""
+
+import os
+import ast
+import sys
+import json
+import time
+import queue
+import base64
+import pickle
+import hashlib
+import threading
+import subprocess
+from collections import OrderedDict
+from config import get_setting
+from core.df_utils import fingerprint_dataframe
+from core.sql_cache import normalizar_pergunta
+from core.metrics import registrar_metrica
+
+CAMINHO_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chart_worker.py")
+
+IMPORTACOES_PERMITIDAS = {
+    "matplotlib.pyplot": "plt",
+    "seaborn": "sns",
+    "plotly.express": "px",
+    "plotly.graph_objects": "go",
+    "pandas": "pd",
+    "numpy": "np",
+}
+
+NOMES_PROIBIDOS = {
+    "exec", "eval", "compile", "open", "input", "exit", "quit", "globals", "locals", "vars", "dir",
+    "getattr", "setattr", "delattr", "breakpoint", "help", "memoryview", "type", "object", "super",
+    "__import__", "__builtins__",
+}
+
+# Funções acessíveis em cada módulo (pelo nome com que é importado). Só um nível a partir do
+# módulo: cadeias como plt.matplotlib.subprocess ou np.lib.npyio são rejeitadas
+ATRIBUTOS_DOS_MODULOS = {
+    "plt": {
+        "figure", "subplots", "subplot", "plot", "bar", "barh", "scatter", "hist", "pie", "boxplot", "violinplot",
+        "stackplot", "fill_between", "step", "stem", "errorbar", "axhline", "axvline", "title", "suptitle",
+        "xlabel", "ylabel", "xticks", "yticks", "xlim", "ylim", "legend", "grid", "tight_layout",
+        "subplots_adjust", "annotate", "text", "gca", "gcf", "colorbar", "twinx", "show", "close", "setp",
+    },
+    "sns": {
+        "barplot", "lineplot", "scatterplot", "histplot", "boxplot", "violinplot", "countplot", "heatmap",
+        "pointplot", "kdeplot", "regplot", "stripplot", "swarmplot", "catplot", "relplot", "displot",
+        "lmplot", "pairplot", "set", "set_theme", "set_style", "set_palette", "color_palette", "despine",
+    },
+    "px": {
+        "bar", "line", "scatter", "pie", "histogram", "box", "violin", "area", "funnel", "treemap", "sunburst",
+        "density_heatmap", "imshow", "strip", "timeline",
+    },
+    "go": {
+        "Figure", "Bar", "Scatter", "Pie", "Histogram", "Box", "Heatmap", "Indicator", "Funnel", "Table", "Layout",
+    },
+    "pd": {
+        "DataFrame", "Series", "to_datetime", "to_numeric", "cut", "qcut", "concat", "merge", "melt",
+        "pivot_table", "crosstab", "Grouper", "date_range", "isna", "notna", "Categorical", "Timestamp",
+        "Timedelta", "NA",
+    },
+    "np": {
+        "arange", "linspace", "array", "mean", "median", "sum", "cumsum", "round", "where", "log", "log10",
+        "sqrt", "abs", "nan", "isnan", "zeros", "ones", "maximum", "minimum", "percentile", "unique", "sort",
+        "argsort", "clip", "diff", "polyfit", "poly1d", "std", "min", "max", "pi",
+    },
+}
+
+# Métodos e atributos permitidos nos demais objetos (DataFrames, Series, figuras e eixos). Ficam de fora
+# os que leem ou gravam arquivos (to_csv, savefig, write_html...), os que avaliam texto como código
+# (query, eval) e str.format, que acessa atributos pelo texto do formato
+ATRIBUTOS_PERMITIDOS = {
+    # DataFrame / Series / GroupBy
+    "head", "tail", "sort_values", "sort_index", "groupby", "agg", "aggregate", "sum", "mean", "median",
+    "count", "min", "max", "std", "var", "size", "nunique", "unique", "value_counts", "reset_index",
+    "set_index", "rename", "copy", "dropna", "fillna", "astype", "round", "abs", "cumsum", "pct_change",
+    "diff", "rolling", "resample", "pivot", "pivot_table", "melt", "merge", "nlargest", "nsmallest", "iloc",
+    "loc", "columns", "index", "values", "tolist", "to_list", "shape", "empty", "dtypes", "dtype", "name",
+    "str", "dt", "cat", "apply", "map", "isin", "between", "clip", "where", "mask", "assign", "drop",
+    "drop_duplicates", "duplicated", "explode", "stack", "unstack", "transpose", "T", "plot", "idxmax",
+    "idxmin", "any", "all", "isna", "notna", "cumcount", "first", "last", "shift", "rank", "corr",
+    "describe", "items", "keys", "get", "codes", "categories", "year", "month", "day", "quarter",
+    "strftime", "date", "to_period", "to_timestamp", "upper", "lower", "title", "strip", "replace",
+    "contains", "startswith", "endswith", "len", "split", "append", "extend",
+    # pandas.plot
+    "bar", "barh", "line", "area", "pie", "hist", "box", "scatter", "kde",
+    # matplotlib (Figure / Axes / Axis)
+    "set_title", "set_xlabel", "set_ylabel", "set_xticks", "set_xticklabels", "set_yticks",
+    "set_yticklabels", "set_xlim", "set_ylim", "set", "legend", "grid", "plot", "fill_between", "axhline",
+    "axvline", "annotate", "text", "tick_params", "twinx", "invert_xaxis", "invert_yaxis",
+    "get_xticklabels", "get_yticklabels", "set_rotation", "spines", "set_visible", "tight_layout",
+    "suptitle", "add_subplot", "subplots_adjust", "autofmt_xdate", "set_size_inches", "bar_label",
+    "containers", "patches", "get_height", "get_width", "get_x", "get_y", "xaxis", "yaxis",
+    "set_major_formatter", "set_major_locator", "flatten", "ravel", "colorbar",
+    # plotly (Figure)
+    "update_layout", "update_traces", "update_xaxes", "update_yaxes", "add_trace", "add_bar",
+    "add_scatter", "add_hline", "add_vline", "add_annotation", "update", "show", "data", "layout",
+}
+
+_NOS_PROIBIDOS = (
+    ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Global, ast.Nonlocal, ast.Delete,
+    ast.With, ast.AsyncWith, ast.Try, ast.While, ast.Await, ast.Yield, ast.YieldFrom,
+)
+
+def validar_codigo_grafico(code):
+    """
+    Valida o código de plotagem pela AST. Retorna (True, None) ou (False, motivo).
+    """
+    try:
+        arvore = ast.parse(code)
+    except SyntaxError as e:
+        return False, f"Código inválido: {e.msg}"
+    modulos = set(ATRIBUTOS_DOS_MODULOS)
+    usos_de_modulo = set()
+    for no in ast.walk(arvore):
+        if isinstance(no, _NOS_PROIBIDOS):
+            return False, f"Construção não permitida: {type(no).__name__}"
+        if isinstance(no, ast.Import):
+            for alias in no.names:
+                if IMPORTACOES_PERMITIDAS.get(alias.name) != alias.asname:
+                    return False, f"Importação não permitida: {alias.name}" + (f" as {alias.asname}" if alias.asname else "")
+        elif isinstance(no, ast.ImportFrom):
+            return False, f"Importação não permitida: from {no.module} import ..."
+        elif isinstance(no, ast.Name) and no.id in NOMES_PROIBIDOS:
+            return False, f"Nome não permitido: {no.id}"
+        elif isinstance(no, ast.Attribute):
+            if no.attr.startswith("_"):
+                return False, f"Atributo não permitido: {no.attr}"
+            if isinstance(no.value, ast.Name) and no.value.id in modulos:
+                usos_de_modulo.add(id(no.value))
+                if no.attr not in ATRIBUTOS_DOS_MODULOS[no.value.id]:
+                    return False, f"Atributo não permitido: {no.value.id}.{no.attr}"
+            elif no.attr not in ATRIBUTOS_PERMITIDOS:
+                return False, f"Atributo não permitido: {no.attr}"
+    # Os módulos só podem ser usados como `modulo.funcao` (não atribuídos a outro nome ou passados adiante)
+    for no in ast.walk(arvore):
+        if isinstance(no, ast.Name) and no.id in modulos and id(no) not in usos_de_modulo:
+            return False, f"Uso não permitido do módulo: {no.id}"
+    return True, None
+
+class _Trabalhador:
+    """
+    Um processo de renderização e a thread que lê suas respostas.
+    """
+
+    def __init__(self, memoria_mb):
+        self.processo = subprocess.Popen(
+            [sys.executable, CAMINHO_WORKER, str(memoria_mb or 0)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+        )
+        self.respostas = queue.Queue()
+        threading.Thread(target=self._ler_respostas, name="chart-worker-leitor", daemon=True).start()
+
+    def _ler_respostas(self):
+        for linha in self.processo.stdout:
+            self.respostas.put(json.loads(linha))
+        # Fim do stdout: o processo terminou (por exemplo, estourou o limite de CPU ou memória)
+        self.respostas.put(None)
+
+    def vivo(self):
+        return self.processo.poll() is None
+
+    def aguardar(self, timeout_segundos):
+        return self.respostas.get(timeout=timeout_segundos)
+
+    def encerrar(self):
+        if self.vivo():
+            self.processo.kill()
+        self.processo.wait()
+
+class PoolGraficos:
+    """
+    Pool de `tamanho` processos de renderização, iniciados sob demanda.
+    Cada renderização tem `timeout_segundos` de tempo total, `cpu_segundos` de CPU e o processo
+    fica limitado a `memoria_mb` de memória (CPU e memória só onde o módulo `resource` existe).
+    """
+
+    def __init__(self, tamanho=1, timeout_segundos=30, cpu_segundos=20, memoria_mb=1024, timeout_inicio=60):
+        self.tamanho = tamanho
+        self.timeout_segundos = timeout_segundos
+        self.cpu_segundos = cpu_segundos
+        self.memoria_mb = memoria_mb
+        self.timeout_inicio = timeout_inicio
+        self._livres = queue.Queue()
+        for _ in range(tamanho):
+            self._livres.put(None)
+
+    def renderizar(self, codigo, df):
+        """
+        Renderiza o código com o DataFrame `df` em um processo do pool.
+        Retorna {'tipo': 'png'|'plotly', 'conteudo': bytes do PNG ou JSON do Plotly} ou {'erro': mensagem}.
+        """
+        pedido = json.dumps({
+            "codigo": codigo,
+            "df": base64.b64encode(pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)).decode("ascii"),
+            "cpu_segundos": self.cpu_segundos,
+        })
+        trabalhador = self._livres.get()
+        inicio = time.perf_counter()
+        descartar = False
+        try:
+            if trabalhador is None or not trabalhador.vivo():
+                trabalhador = self._iniciar()
+            trabalhador.processo.stdin.write(pedido + "\n")
+            trabalhador.processo.stdin.flush()
+            resposta = trabalhador.aguardar(self.timeout_segundos)
+            if resposta is None:
+                descartar = True
+                resposta = {"erro": "O processo de renderização foi encerrado (limite de CPU ou memória)."}
+        except queue.Empty:
+            descartar = True
+            resposta = {"erro": f"A renderização do gráfico excedeu {self.timeout_segundos}s."}
+        except (OSError, RuntimeError) as e:
+            descartar = True
+            resposta = {"erro": f"Falha no processo de renderização: {e}"}
+        finally:
+            registrar_metrica("grafico.renderizacao", time.perf_counter() - inicio)
+        if descartar and trabalhador is not None:
+            trabalhador.encerrar()
+            trabalhador = None
+        self._livres.put(trabalhador)
+        if resposta.get("tipo") == "png":
+            resposta["conteudo"] = base64.b64decode(resposta["conteudo"])
+        return resposta
+
+    def _iniciar(self):
+        trabalhador = _Trabalhador(self.memoria_mb)
+        try:
+            sinal = trabalhador.aguardar(self.timeout_inicio)
+        except queue.Empty:
+            sinal = None
+        if not sinal or not sinal.get("pronto"):
+            trabalhador.encerrar()
+            raise RuntimeError("o processo não iniciou")
+        return trabalhador
+
+    def encerrar(self):
+        """
+        Encerra os processos ociosos do pool.
+        """
+        for _ in range(self.tamanho):
+            trabalhador = self._livres.get()
+            if trabalhador is not None:
+                trabalhador.encerrar()
+            self._livres.put(None)
+
+class CacheGraficos:
+    """
+    Cache LRU em memória do código dos gráficos, por (pergunta normalizada, fingerprint do DataFrame),
+    e dos gráficos renderizados, por (hash do código, fingerprint do DataFrame), limitado por `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes_em_uso = 0
+        self.hits = 0
+        self.misses = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def buscar_codigo(self, pergunta, fingerprint_df):
+        return self._buscar(("codigo", normalizar_pergunta(pergunta), fingerprint_df))
+
+    def armazenar_codigo(self, pergunta, fingerprint_df, codigo):
+        self._armazenar(("codigo", normalizar_pergunta(pergunta), fingerprint_df), codigo, len(codigo))
+
+    def buscar_render(self, codigo, fingerprint_df):
+        return self._buscar(("render", _hash_codigo(codigo), fingerprint_df))
+
+    def armazenar_render(self, codigo, fingerprint_df, resultado):
+        self._armazenar(("render", _hash_codigo(codigo), fingerprint_df), resultado, len(resultado["conteudo"]))
+
+    def _buscar(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.hits += 1
+            return entrada[0]
+
+    def _armazenar(self, chave, valor, tamanho):
+        if tamanho > self.max_bytes:
+            return
+        with self._lock:
+            if chave in self._entradas:
+                self.bytes_em_uso -= self._entradas.pop(chave)[1]
+            self._entradas[chave] = (valor, tamanho)
+            self.bytes_em_uso += tamanho
+            while self.bytes_em_uso > self.max_bytes:
+                _, (_, tamanho_removido) = self._entradas.popitem(last=False)
+                self.bytes_em_uso -= tamanho_removido
+
+def _hash_codigo(codigo):
+    return hashlib.sha256(codigo.strip().encode("utf-8")).hexdigest()
+
+def renderizar_grafico(codigo, df, pool, cache=None):
+    """
+    Valida e renderiza o código do gráfico, reaproveitando o resultado em cache se houver.
+    Retorna o mesmo dicionário de PoolGraficos.renderizar. Só resultados sem erro são armazenados.
+    """
+    valido, motivo = validar_codigo_grafico(codigo)
+    if not valido:
+        return {"erro": f"O código gerado pela IA não foi considerado seguro para execução. {motivo}"}
+    fingerprint_df = fingerprint_dataframe(df) if cache is not None else None
+    if cache is not None:
+        resultado = cache.buscar_render(codigo, fingerprint_df)
+        if resultado is not None:
+            return resultado
+    resultado = pool.renderizar(codigo, df)
+    if cache is not None and "erro" not in resultado:
+        cache.armazenar_render(codigo, fingerprint_df, resultado)
+    return resultado
+
+_pool_graficos = None
+_cache_graficos = None
+_graficos_lock = threading.Lock()
+
+def obter_pool_graficos(config):
+    """
+    Retorna o pool de renderização compartilhado pelo processo, configurado a partir do .env
+    (CHART_WORKERS, CHART_TIMEOUT_SECONDS, CHART_CPU_SECONDS e CHART_MEMORY_MB).
+    """
+    global _pool_graficos
+    with _graficos_lock:
+        if _pool_graficos is None:
+            _pool_graficos = PoolGraficos(
+                tamanho=get_setting(config, "CHART_WORKERS", 1, int),
+                timeout_segundos=get_setting(config, "CHART_TIMEOUT_SECONDS", 30, float),
+                cpu_segundos=get_setting(config, "CHART_CPU_SECONDS", 20, int),
+                memoria_mb=get_setting(config, "CHART_MEMORY_MB", 1024, int),
+            )
+        return _pool_graficos
+
+def obter_cache_graficos(config):
+    """
+    Retorna o cache de gráficos compartilhado pelo processo, ou None se CHART_CACHE_ENABLED=false.
+    """
+    global _cache_graficos
+    if not get_setting(config, "CHART_CACHE_ENABLED", True, bool):
+        return None
+    with _graficos_lock:
+        if _cache_graficos is None:
+            _cache_graficos = CacheGraficos(
+                max_bytes=int(get_setting(config, "CHART_CACHE_MAX_MB", 64, float) * 1024 * 1024)
+            )
+        return _cache_graficos
@@ -0,0 +1,162 @@
+"""
+Processo de renderização de gráficos, iniciado por core/chart_renderer.py.
+
+Executa o código de plotagem gerado pela LLM fora do processo do Streamlit, com builtins restritos,
+limites de CPU e memória (quando o sistema oferece o módulo `resource`) e um audit hook que bloqueia
+rede, subprocessos e acesso a arquivos fora das bibliotecas instaladas. O protocolo é uma linha
+JSON por pedido no stdin ({'codigo', 'df', 'cpu_segundos'}, com o DataFrame em pickle base64) e uma
+linha JSON por resposta no stdout ({'tipo': 'png'|'plotly', 'conteudo'} ou {'erro'}).
+
+Este arquivo é executado diretamente (python core/chart_worker.py) e não importa nada do projeto.
+"""
+
+import io
+import os
+import sys
+import json
+import base64
+import pickle
+import site
+import builtins
+
+try:
+    import resource
+except ImportError:
+    # Windows: sem limites de CPU/memória; vale apenas o timeout aplicado pelo processo principal
+    resource = None
+
+MODULOS_PERMITIDOS = {"matplotlib", "matplotlib.pyplot", "seaborn", "plotly", "plotly.express", "plotly.graph_objects",
+                      "pandas", "numpy"}
+
+_NOMES_BUILTINS = (
+    "abs", "all", "any", "bool", "dict", "enumerate", "filter", "float", "int", "isinstance", "len", "list",
+    "map", "max", "min", "print", "range", "reversed", "round", "set", "sorted", "str", "sum", "tuple", "zip",
+    "True", "False", "None", "ValueError", "KeyError", "Exception",
+)
+
+def _importar(nome, globais=None, locais=None, nomes=(), nivel=0):
+    if nivel or nome not in MODULOS_PERMITIDOS:
+        raise ImportError(f"Importação não permitida: {nome}")
+    return builtins.__import__(nome, globais, locais, nomes, nivel)
+
+BUILTINS_SEGUROS = {nome: getattr(builtins, nome) for nome in _NOMES_BUILTINS}
+BUILTINS_SEGUROS["__import__"] = _importar
+
+# Eventos de auditoria (sys.addaudithook) bloqueados no processo: rede, subprocessos e alterações no sistema de arquivos
+_EVENTOS_BLOQUEADOS = (
+    "socket.", "subprocess.", "os.system", "os.exec", "os.posix_spawn", "os.spawn", "os.fork", "os.kill",
+    "os.remove", "os.rename", "os.rmdir", "os.mkdir", "os.chmod", "os.chown", "os.symlink", "os.link",
+    "os.truncate", "os.utime", "shutil.", "urllib.", "http.", "ftplib.", "smtplib.", "webbrowser.",
+)
+_FLAGS_ESCRITA = os.O_WRONLY | os.O_RDWR | os.O_CREAT | os.O_APPEND | os.O_TRUNC
+
+def bloquear_acesso_externo(diretorios_leitura):
+    """
+    Instala um audit hook (que não pode ser removido) bloqueando rede, subprocessos e gravação de
+    arquivos; a leitura só é permitida dentro de `diretorios_leitura` (as bibliotecas instaladas).
+    Os arquivos já abertos (stdin e o canal de respostas) continuam utilizáveis.
+    """
+    permitidos = tuple(os.path.join(os.path.realpath(d), "") for d in diretorios_leitura if d)
+
+    def auditar(evento, argumentos):
+        if evento.startswith(_EVENTOS_BLOQUEADOS):
+            raise PermissionError(f"Operação não permitida na renderização: {evento}")
+        if evento == "open":
+            caminho, modo, flags = argumentos
+            if isinstance(caminho, int):
+                return
+            escrita = any(c in (modo or "") for c in "wax+") or (modo is None and flags & _FLAGS_ESCRITA)
+            caminho = os.path.realpath(os.fsdecode(caminho))
+            if escrita or not caminho.startswith(permitidos):
+                raise PermissionError(f"Acesso a arquivo não permitido na renderização: {caminho}")
+
+    sys.addaudithook(auditar)
+
+def _diretorios_de_bibliotecas():
+    import matplotlib
+    diretorios = {sys.prefix, sys.base_prefix, sys.exec_prefix, matplotlib.get_data_path(), matplotlib.get_cachedir(),
+                  matplotlib.get_configdir()}
+    diretorios.update(site.getsitepackages())
+    diretorios.add(site.getusersitepackages())
+    return diretorios
+
+def aplicar_limite_memoria(memoria_mb):
+    if resource is not None and memoria_mb:
+        limite = int(memoria_mb * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (limite, resource.getrlimit(resource.RLIMIT_AS)[1]))
+
+def aplicar_limite_cpu(cpu_segundos):
+    """
+    O limite de CPU do processo é cumulativo; cada pedido recebe `cpu_segundos` além do já consumido.
+    Ao estourar, o sistema encerra o processo e o processo principal inicia outro.
+    """
+    if resource is None or not cpu_segundos:
+        return
+    usado = resource.getrusage(resource.RUSAGE_SELF)
+    limite = int(usado.ru_utime + usado.ru_stime + cpu_segundos) + 1
+    rigido = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    if rigido != resource.RLIM_INFINITY:
+        limite = min(limite, rigido)
+    resource.setrlimit(resource.RLIMIT_CPU, (limite, rigido))
+
+def renderizar(pedido, modulos, figura_plotly):
+    df = pickle.loads(base64.b64decode(pedido["df"]))
+    plt = modulos["plt"]
+    plt.close("all")
+    # Os mesmos nomes que core/chart_renderer.py aceita sem importação (plt, sns, px, go, pd, np)
+    namespace = {"__builtins__": BUILTINS_SEGUROS, **modulos, "df": df}
+    exec(compile(pedido["codigo"], "<grafico>", "exec"), namespace)
+    figuras = [valor for valor in namespace.values() if isinstance(valor, figura_plotly)]
+    if figuras:
+        return {"tipo": "plotly", "conteudo": figuras[-1].to_json()}
+    if plt.get_fignums():
+        buffer = io.BytesIO()
+        plt.gcf().savefig(buffer, format="png", dpi=100, bbox_inches="tight")
+        plt.close("all")
+        return {"tipo": "png", "conteudo": base64.b64encode(buffer.getvalue()).decode("ascii")}
+    return {"erro": "O código não gerou nenhum gráfico."}
+
+def main():
+    # O stdout real fica reservado ao protocolo; prints do código gerado vão para o stderr
+    canal = io.TextIOWrapper(io.FileIO(_duplicar_stdout(), "w"), encoding="utf-8")
+    sys.stdout = sys.stderr
+    aplicar_limite_memoria(float(sys.argv[1]) if len(sys.argv) > 1 else 0)
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+    import plotly.graph_objects as go
+    from plotly.basedatatypes import BaseFigure
+    # fig.show()/plt.show() no código gerado não devem abrir janelas nem navegadores
+    BaseFigure.show = lambda self, *args, **kwargs: None
+    plt.show = lambda *args, **kwargs: None
+    modulos = {"plt": plt, "sns": sns, "px": px, "go": go, "pd": pd, "np": np}
+    bloquear_acesso_externo(_diretorios_de_bibliotecas())
+
+    canal.write(json.dumps({"pronto": True}) + "\n")
+    canal.flush()
+    for linha in sys.stdin:
+        if not linha.strip():
+            continue
+        pedido = json.loads(linha)
+        aplicar_limite_cpu(pedido.get("cpu_segundos"))
+        try:
+            resposta = renderizar(pedido, modulos, BaseFigure)
+        except MemoryError:
+            resposta = {"erro": "O gráfico excedeu o limite de memória."}
+        except Exception as e:
+            resposta = {"erro": f"{type(e).__name__}: {e}"}
+        canal.write(json.dumps(resposta) + "\n")
+        canal.flush()
+
+def _duplicar_stdout():
+    descritor = os.dup(sys.stdout.fileno())
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    return descritor
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,112 @@
+import time
+import asyncio
+import threading
 import pandas as pd
-from sqlalchemy import create_engine, inspect
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as SQLAlchemyTimeoutError
+from sqlalchemy.pool import QueuePool
+from config import get_setting
+from core.result_cache import tabelas_referenciadas
+from core.sql_utils import aplicar_limite_linhas
+from core.df_utils import otimizar_tipos
+from core.tracing import span, registrar_erro_no_span
+from core.metrics import registrar_metrica, resumo_metricas
+from core.schema_catalog import consultar_catalogo, formatar_schema
 
-def create_db_engine(db_uri):
-    return create_engine(db_uri)
+TAMANHO_LOTE_PADRAO = 5000
+
+class PoolMedido(QueuePool):
+    """
+    QueuePool que registra quanto tempo cada checkout esperou por uma conexão livre
+    (db.pool.espera_checkout, em segundos) e quantas vezes a espera estourou o pool_timeout.
+    """
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except SQLAlchemyTimeoutError:
+            registrar_metrica("db.pool.timeouts", 1)
+            raise
+        finally:
+            registrar_metrica("db.pool.espera_checkout", time.perf_counter() - inicio)
+
+def create_db_engine(db_uri, pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=1800, pool_pre_ping=True):
+    """
+    Cria a engine do banco. Bancos servidor (SQL Server, PostgreSQL...) usam um pool medido
+    com tamanho, overflow, tempo máximo de espera, reciclagem e pre-ping configuráveis;
+    o SQLite mantém o pool padrão do SQLAlchemy.
+    """
+    if make_url(db_uri).get_backend_name() == "sqlite":
+        return create_engine(db_uri)
+    return create_engine(
+        db_uri,
+        poolclass=PoolMedido,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+    )
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def obter_engine(config):
+    """
+    Retorna a engine compartilhada pelo processo para SQLALCHEMY_DATABASE_URI, configurada a partir
+    do .env (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE e DB_POOL_PRE_PING).
+    Todas as sessões do Streamlit e o terminal usam o mesmo pool de conexões.
+    """
+    db_uri = config["SQLALCHEMY_DATABASE_URI"]
+    with _engines_lock:
+        if db_uri not in _engines:
+            _engines[db_uri] = create_db_engine(
+                db_uri,
+                pool_size=get_setting(config, "DB_POOL_SIZE", 5, int),
+                max_overflow=get_setting(config, "DB_MAX_OVERFLOW", 10, int),
+                pool_timeout=get_setting(config, "DB_POOL_TIMEOUT", 30, float),
+                pool_recycle=get_setting(config, "DB_POOL_RECYCLE", 1800, int),
+                pool_pre_ping=get_setting(config, "DB_POOL_PRE_PING", True, bool),
+            )
+        return _engines[db_uri]
+
+def obter_estatisticas_pool_db(engine):
+    """
+    Retorna o estado do pool da engine (tamanho, conexões em uso, livres e em overflow)
+    e o resumo das esperas por conexão.
+    """
+    pool = engine.pool
+    estatisticas = {"pool": pool.status()}
+    if isinstance(pool, QueuePool):
+        estatisticas.update({
+            "tamanho": pool.size(),
+            "em_uso": pool.checkedout(),
+            "livres": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        })
+    estatisticas.update(resumo_metricas("db.pool."))
+    return estatisticas
+
+def limpar_engines():
+    """
+    Fecha e descarta as engines compartilhadas.
+    """
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
 
 def get_schema(engine, schema_name="dbo"):
     """
-    Retorna o schema do banco de dados (tabelas e colunas).
+    Retorna o schema do banco de dados (tabelas e colunas), lido com uma única consulta ao catálogo.
+    Se o banco não oferecer INFORMATION_SCHEMA, usa o inspector do SQLAlchemy tabela a tabela.
     """
+    try:
+        return formatar_schema(consultar_catalogo(engine, schema_name))
+    except SQLAlchemyError:
+        pass
     inspector = inspect(engine)
     schema_str = ""
     for table_name in inspector.get_table_names(schema=schema_name):
@@ -17,17 +115,262 @@ def get_schema(engine, schema_name="dbo"):
         schema_str += f"Tabela {table_name}: {', '.join(col_infos)}\n"
     return schema_str
 
-def executar_sql(engine, consulta_sql):
+class Cancelamento:
+    """
+    Permite cancelar, a partir de outra thread (por exemplo, um botão da interface), a consulta
+    em andamento em executar_sql.
+    """
+
+    def __init__(self):
+        self._evento = threading.Event()
+        self._acoes = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelado(self):
+        return self._evento.is_set()
+
+    def cancelar(self):
+        """
+        Sinaliza o cancelamento e interrompe a consulta registrada, se houver.
+        """
+        self._evento.set()
+        with self._lock:
+            acoes = list(self._acoes)
+        for acao in acoes:
+            try:
+                acao()
+            except Exception as e:
+                print("Erro ao cancelar a consulta:", str(e))
+
+    def _registrar(self, acao):
+        with self._lock:
+            self._acoes.append(acao)
+        if self.cancelado:
+            acao()
+
+    def _remover(self, acao):
+        with self._lock:
+            if acao in self._acoes:
+                self._acoes.remove(acao)
+
+class ConsultaCancelada(Exception):
+    pass
+
+def _configurar_interrupcao(conexao_dbapi, dialeto, timeout_segundos, cancelamento):
+    """
+    Aplica o timeout por consulta e prepara o cancelamento de acordo com o driver.
+    Retorna a função que, dado o cursor da consulta, a interrompe.
+    """
+    prazo = time.monotonic() + timeout_segundos if timeout_segundos else None
+    if dialeto == "sqlite":
+        # O SQLite não tem timeout de consulta: o progress handler aborta a execução
+        def verificar():
+            expirado = prazo is not None and time.monotonic() > prazo
+            return 1 if expirado or (cancelamento is not None and cancelamento.cancelado) else 0
+        conexao_dbapi.set_progress_handler(verificar, 1000)
+        return lambda cursor: conexao_dbapi.interrupt()
+    if timeout_segundos:
+        if dialeto == "mssql" and hasattr(conexao_dbapi, "timeout"):
+            conexao_dbapi.timeout = int(timeout_segundos)
+        elif dialeto in ("postgresql", "mysql", "mariadb"):
+            # No PostgreSQL, SET LOCAL vale só até o fim da transação da consulta (desfeita ao devolver a
+            # conexão ao pool); no MySQL o limite da sessão é restaurado em _restaurar_conexao
+            comando = "SET LOCAL statement_timeout = {}" if dialeto == "postgresql" else "SET SESSION MAX_EXECUTION_TIME = {}"
+            cursor_config = conexao_dbapi.cursor()
+            cursor_config.execute(comando.format(int(timeout_segundos * 1000)))
+            cursor_config.close()
+    def interromper(cursor):
+        if hasattr(cursor, "cancel"):
+            cursor.cancel()
+        elif hasattr(conexao_dbapi, "cancel"):
+            conexao_dbapi.cancel()
+    return interromper
+
+def _restaurar_conexao(conexao_dbapi, dialeto, timeout_segundos=None):
+    """
+    Desfaz o timeout e o cancelamento configurados na conexão, que volta ao pool para outras consultas.
+    """
+    if dialeto == "sqlite":
+        conexao_dbapi.set_progress_handler(None, 0)
+    elif dialeto == "mssql" and hasattr(conexao_dbapi, "timeout"):
+        conexao_dbapi.timeout = 0
+    elif dialeto in ("mysql", "mariadb") and timeout_segundos:
+        try:
+            cursor_config = conexao_dbapi.cursor()
+            cursor_config.execute("SET SESSION MAX_EXECUTION_TIME = DEFAULT")
+            cursor_config.close()
+        except Exception as e:
+            print("Erro ao restaurar o timeout da conexão:", str(e))
+
+def _abrir_cursor(conexao_dbapi, dialeto):
+    """
+    Abre o cursor da consulta. No PostgreSQL (psycopg2) usa um cursor nomeado, que mantém o
+    resultado no servidor e envia as linhas por lote; pyodbc e sqlite3 já leem sob demanda no fetchmany.
+    """
+    if dialeto == "postgresql":
+        try:
+            return conexao_dbapi.cursor(name="chatbot_consulta")
+        except TypeError:
+            pass
+    return conexao_dbapi.cursor()
+
+def _compilar_parametros(engine, consulta_sql, parametros):
+    """
+    Compila a consulta com parâmetros nomeados (:nome) via text() para o paramstyle do driver.
+    Retorna (sql, parâmetros ligados) para o cursor do DBAPI.
+    """
+    compilado = text(consulta_sql).compile(dialect=engine.dialect)
+    valores = compilado.construct_params(parametros)
+    if compilado.positiontup is not None:
+        return compilado.string, tuple(valores[nome] for nome in compilado.positiontup)
+    return compilado.string, valores
+
+def _executar_em_lotes(engine, consulta_sql, max_linhas, timeout_segundos, cancelamento, tamanho_lote,
+                       parametros=None):
+    """
+    Executa a consulta lendo o resultado em lotes de `tamanho_lote` linhas, cada um já convertido
+    para tipos compactos (otimizar_tipos), e para de ler assim que passa de max_linhas.
+    Com max_linhas, o limite também é aplicado no servidor (TOP/LIMIT) e df.attrs['truncado']
+    indica se havia mais linhas. Registra as métricas sql.linhas, sql.duracao,
+    sql.linhas_por_segundo e sql.pico_memoria_mb (estimativa da memória ocupada pelo resultado
+    durante a leitura). Com `parametros`, a consulta é executada como instrução preparada, com os
+    valores ligados pelo driver.
+    """
+    inicio = time.perf_counter()
+    dialeto = engine.dialect.name
+    if max_linhas:
+        consulta_sql = aplicar_limite_linhas(consulta_sql, max_linhas + 1, dialeto)
+    argumentos = _compilar_parametros(engine, consulta_sql, parametros) if parametros else (consulta_sql,)
+    lotes = []
+    tipos = {}
+    total_linhas = 0
+    bytes_lotes = 0
+    pico_bytes = 0
+    with engine.connect() as conexao:
+        conexao_dbapi = conexao.connection.dbapi_connection
+        interromper = _configurar_interrupcao(conexao_dbapi, dialeto, timeout_segundos, cancelamento)
+        cursor = _abrir_cursor(conexao_dbapi, dialeto)
+        acao_cancelar = lambda: interromper(cursor)
+        if cancelamento is not None:
+            cancelamento._registrar(acao_cancelar)
+        try:
+            cursor.execute(*argumentos)
+            colunas = [descricao[0] for descricao in cursor.description or []]
+            while not max_linhas or total_linhas <= max_linhas:
+                quantidade = tamanho_lote if not max_linhas else min(tamanho_lote, max_linhas + 1 - total_linhas)
+                linhas = cursor.fetchmany(quantidade)
+                if not linhas:
+                    break
+                lote = pd.DataFrame.from_records(linhas, columns=colunas)
+                del linhas
+                bytes_brutos = int(lote.memory_usage(deep=True, index=False).sum())
+                lote = otimizar_tipos(lote, tipos)
+                pico_bytes = max(pico_bytes, bytes_lotes + bytes_brutos)
+                bytes_lotes += int(lote.memory_usage(deep=True, index=False).sum())
+                total_linhas += len(lote)
+                lotes.append(lote)
+        except Exception:
+            if cancelamento is not None and cancelamento.cancelado:
+                raise ConsultaCancelada()
+            raise
+        finally:
+            if cancelamento is not None:
+                cancelamento._remover(acao_cancelar)
+            cursor.close()
+            _restaurar_conexao(conexao_dbapi, dialeto, timeout_segundos)
+
+    if not lotes:
+        df = pd.DataFrame(columns=colunas)
+    elif len(lotes) == 1:
+        df = lotes[0]
+    else:
+        df = otimizar_tipos(pd.concat(lotes, ignore_index=True), tipos)
+        # Durante a concatenação os lotes e o resultado final coexistem
+        pico_bytes = max(pico_bytes, 2 * bytes_lotes)
+    del lotes
+    truncado = bool(max_linhas) and len(df) > max_linhas
+    if truncado:
+        df = df.iloc[:max_linhas]
+    df.attrs["truncado"] = truncado
+
+    duracao = time.perf_counter() - inicio
+    registrar_metrica("sql.linhas", len(df))
+    registrar_metrica("sql.duracao", duracao)
+    registrar_metrica("sql.linhas_por_segundo", len(df) / duracao if duracao > 0 else 0)
+    registrar_metrica("sql.pico_memoria_mb", max(pico_bytes, bytes_lotes) / (1024 * 1024))
+    return df
+
+def executar_sql(engine, consulta_sql, cache=None, max_linhas=None, timeout_segundos=None, cancelamento=None,
+                 tamanho_lote=TAMANHO_LOTE_PADRAO, parametros=None, cubo=None):
     """
     Executa a consulta SQL no banco usando SQLAlchemy e retorna um DataFrame.
     Trata erros comuns e retorna mensagens amigáveis.
+    Se um `cache` (CacheResultados) for informado, reaproveita o resultado de uma consulta equivalente.
+    O resultado é lido em lotes de `tamanho_lote` linhas, com tipos compactos (texto no pyarrow,
+    inteiros em 32 bits quando possível). Limites opcionais:
+    - max_linhas: limita o resultado no servidor (TOP/LIMIT conforme o dialeto) e na leitura;
+      se havia mais linhas, df.attrs['truncado'] é True;
+    - timeout_segundos: tempo máximo de execução da consulta;
+    - cancelamento: objeto Cancelamento que permite interromper a consulta de outra thread.
+    `parametros` liga valores aos parâmetros nomeados (:nome) da consulta (templates de core/sql_templates.py).
+    Com um `cubo` (CuboAgregados), consultas de agregação elegíveis são respondidas pelo cubo local,
+    sem ir ao banco.
     """
-    try:
-        df = pd.read_sql_query(consulta_sql, engine)
-        return df
-    except SQLAlchemyError as e:
-        print("Erro ao executar a consulta SQL:", str(e))
-        return None
-    except Exception as e:
-        print("Erro inesperado:", str(e))
-        return None
\ No newline at end of file
+    with span("db.executar_sql", dialeto=engine.dialect.name) as atual:
+        if cache is not None:
+            namespace = engine.url.render_as_string(hide_password=True)
+            if max_linhas:
+                namespace += f"|max_linhas={max_linhas}"
+            if parametros:
+                namespace += f"|parametros={sorted(parametros.items())!r}"
+            chave = cache.chave(consulta_sql, namespace=namespace)
+            df = cache.buscar(chave)
+            if df is not None:
+                _anotar_resultado(atual, df, cache_hit=True)
+                return df
+        if cubo is not None:
+            df = cubo.consultar(consulta_sql, parametros, max_linhas)
+            if df is not None:
+                atual.definir(cubo=True)
+                _anotar_resultado(atual, df, cache_hit=False)
+                return df
+        try:
+            df = _executar_em_lotes(
+                engine, consulta_sql, max_linhas, timeout_segundos, cancelamento, tamanho_lote, parametros
+            )
+            if cache is not None:
+                cache.armazenar(chave, df, tabelas=tabelas_referenciadas(consulta_sql))
+            _anotar_resultado(atual, df, cache_hit=False)
+            return df
+        except ConsultaCancelada as e:
+            atual.definir(cancelada=True)
+            registrar_erro_no_span(e)
+            print("Consulta SQL cancelada.")
+            return None
+        except SQLAlchemyError as e:
+            registrar_erro_no_span(e)
+            print("Erro ao executar a consulta SQL:", str(e))
+            return None
+        except Exception as e:
+            registrar_erro_no_span(e)
+            print("Erro inesperado:", str(e))
+            return None
+
+def _anotar_resultado(atual, df, cache_hit):
+    atual.definir(
+        linhas=len(df),
+        bytes=int(df.memory_usage(deep=True).sum()),
+        truncado=bool(df.attrs.get("truncado", False)),
+        cache_hit=cache_hit,
+    )
+
+async def aexecutar_sql(engine, consulta_sql, cache=None, max_linhas=None, timeout_segundos=None, cancelamento=None,
+                        tamanho_lote=TAMANHO_LOTE_PADRAO, parametros=None, cubo=None):
+    """
+    Versão assíncrona de executar_sql: executa a consulta em uma thread, sem bloquear o event loop.
+    """
+    return await asyncio.to_thread(
+        executar_sql, engine, consulta_sql, cache, max_linhas, timeout_segundos, cancelamento, tamanho_lote,
+        parametros, cubo
+    )
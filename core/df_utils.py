@@ -0,0 +1,166 @@
+"""
+Resumo compacto de DataFrames para uso em prompts.
+
+O tamanho do texto enviado à LLM não depende do número de linhas do resultado:
+resultados pequenos vão inteiros; os grandes são amostrados (primeiras e últimas linhas)
+e acompanhados de estatísticas por coluna, tudo dentro de um orçamento de tokens.
+
+Também reúne a conversão de tipos usada na leitura em lotes dos resultados (otimizar_tipos).
+"""
+
+import json
+import hashlib
+import datetime
+import decimal
+import pandas as pd
+from core.prompt_utils import contar_tokens, truncar_para_tokens
+
+SEM_RESULTADOS = "No results found."
+
+def _obter_tipo_texto():
+    # No pandas 3 o tipo padrão de texto já é "str" (armazenado no pyarrow, se instalado)
+    padrao = pd.Series(["a"]).dtype
+    if padrao != object:
+        return padrao
+    try:
+        import pyarrow  # noqa: F401
+        return pd.StringDtype("pyarrow")
+    except ImportError:
+        return None
+
+TIPO_TEXTO = _obter_tipo_texto()
+_MIN_INT32, _MAX_INT32 = -(2 ** 31), 2 ** 31 - 1
+
+def _tipo_alvo(serie):
+    """
+    Tipo compacto para a coluna ('texto', 'decimal', 'data' ou 'int32'), decidido pelo primeiro
+    valor não nulo; None se a coluna não tem valores que permitam decidir.
+    """
+    if serie.dtype == object:
+        valores = serie.dropna()
+        if valores.empty:
+            return None
+        amostra = valores.iloc[0]
+        if isinstance(amostra, str):
+            return "texto" if TIPO_TEXTO is not None else "original"
+        if isinstance(amostra, decimal.Decimal):
+            return "decimal"
+        if isinstance(amostra, (datetime.date, datetime.datetime)):
+            return "data"
+        return "original"
+    if serie.dtype == "int64" and not serie.empty:
+        return "int32" if serie.between(_MIN_INT32, _MAX_INT32).all() else "original"
+    return "original"
+
+def otimizar_tipos(df, tipos=None):
+    """
+    Reduz a memória do DataFrame lido do banco:
+    - colunas object com textos passam para o tipo string do pyarrow (quando disponível);
+    - Decimal vira float64 e date/datetime vira datetime64;
+    - inteiros int64 que cabem em 32 bits passam para int32.
+    Tipos menores (int8/int16, float32) não são usados: facilitariam overflow e perda de precisão
+    nas contas feitas pelo código dos gráficos e em valores monetários.
+
+    Na leitura em lotes, passe o mesmo dicionário `tipos` ({coluna: tipo}) para todos os lotes da
+    consulta: o tipo de cada coluna é decidido uma vez (no primeiro lote com valores) e reaplicado
+    aos seguintes, para que a concatenação não volte a object nem mude o tipo no meio do resultado.
+    """
+    tipos = {} if tipos is None else tipos
+    for coluna in df.columns:
+        serie = df[coluna]
+        if tipos.get(coluna) is None:
+            tipos[coluna] = _tipo_alvo(serie)
+        tipo = tipos[coluna]
+        if tipo == "texto" and serie.dtype == object:
+            df[coluna] = serie.astype(TIPO_TEXTO)
+        elif tipo == "decimal" and serie.dtype == object:
+            df[coluna] = pd.to_numeric(serie.astype(float), errors="coerce")
+        elif tipo == "data" and serie.dtype == object:
+            df[coluna] = pd.to_datetime(serie, errors="coerce")
+        elif tipo == "int32" and serie.dtype == "int64" and serie.between(_MIN_INT32, _MAX_INT32).all():
+            # Um lote posterior fora da faixa fica em int64 e a concatenação mantém int64
+            df[coluna] = serie.astype("int32")
+    return df
+
+def fingerprint_dataframe(df):
+    """
+    Hash do conteúdo do DataFrame (valores, índice, nomes e tipos das colunas).
+    """
+    h = hashlib.sha256(json.dumps([[str(coluna), str(tipo)] for coluna, tipo in df.dtypes.items()]).encode("utf-8"))
+    try:
+        h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    except TypeError:
+        # Colunas com valores não hasheáveis (listas, dicionários)
+        h.update(df.to_csv().encode("utf-8"))
+    return h.hexdigest()
+
+def _tabela(df):
+    return df.to_markdown(index=False)
+
+def estatisticas_colunas(df, max_categorias=5):
+    """
+    Retorna um texto com estatísticas por coluna: mínimo, máximo, média e nulos para colunas
+    numéricas; número de valores distintos e valores mais frequentes para as demais.
+    """
+    linhas = []
+    numericas = df.select_dtypes(include="number")
+    if not numericas.empty:
+        descricao = numericas.agg(["min", "max", "mean"]).T
+        nulos = numericas.isna().sum()
+        for coluna, estat in descricao.iterrows():
+            linhas.append(
+                f"- {coluna} ({df[coluna].dtype}): min={estat['min']:.4g}, max={estat['max']:.4g}, "
+                f"mean={estat['mean']:.4g}, nulls={int(nulos[coluna])}"
+            )
+    for coluna in df.columns.difference(numericas.columns, sort=False):
+        serie = df[coluna]
+        frequentes = serie.value_counts(dropna=True).head(max_categorias)
+        topo = ", ".join(f"{valor} ({contagem})" for valor, contagem in frequentes.items())
+        linhas.append(
+            f"- {coluna} ({serie.dtype}): distinct={serie.nunique(dropna=True)}, "
+            f"nulls={int(serie.isna().sum())}, top: {topo}"
+        )
+    return "\n".join(linhas)
+
+def resumir_dataframe(df, max_linhas=50, max_tokens=1500, modo="amostra"):
+    """
+    Serializa o DataFrame para o prompt.
+    - modo="amostra": tabela completa se couber; senão primeiras/últimas linhas + estatísticas por coluna.
+    - modo="schema": apenas número de linhas, colunas, tipos e estatísticas (sem linhas), para o gerador de gráficos.
+    O texto resultante respeita `max_tokens`.
+    """
+    if df is None or df.empty:
+        return SEM_RESULTADOS
+    total_linhas, total_colunas = df.shape
+    aviso_truncado = ""
+    if df.attrs.get("truncado"):
+        aviso_truncado = f" The query result was capped at {total_linhas} rows by the row limit; more rows exist in the database."
+    if modo == "schema":
+        texto = (
+            f"DataFrame with {total_linhas} rows and {total_colunas} columns.{aviso_truncado}\n"
+            f"Columns:\n{estatisticas_colunas(df)}"
+        )
+        return truncar_para_tokens(texto, max_tokens)
+
+    if total_linhas <= max_linhas and not aviso_truncado:
+        texto = _tabela(df)
+        if contar_tokens(texto) <= max_tokens:
+            return texto
+
+    estatisticas = estatisticas_colunas(df)
+    linhas_amostra = min(max_linhas, total_linhas)
+    while True:
+        metade = max(linhas_amostra // 2, 1)
+        if total_linhas > 2 * metade:
+            amostra = pd.concat([df.head(metade), df.tail(metade)])
+            descricao = f"first {metade} and last {metade} rows"
+        else:
+            amostra = df
+            descricao = f"all {total_linhas} rows"
+        texto = (
+            f"Result has {total_linhas} rows and {total_colunas} columns.{aviso_truncado} Showing {descricao}.\n"
+            f"{_tabela(amostra)}\n\nColumn statistics (computed over all {total_linhas} rows):\n{estatisticas}"
+        )
+        if contar_tokens(texto) <= max_tokens or linhas_amostra <= 2:
+            return truncar_para_tokens(texto, max_tokens)
+        linhas_amostra //= 2
@@ -0,0 +1,173 @@
+"""
+Gerenciamento do histórico de conversa enviado nos prompts.
+
+Mantém as últimas mensagens literalmente e condensa as mais antigas em um resumo
+atualizado de forma incremental. Com um resumidor (a LLM), o resumo é refeito em uma thread de
+fundo; até ele terminar, as mensagens que saíram da janela entram no resumo de forma extrativa. Cada tipo de prompt (sql, resposta, classificacao, casual)
+tem seu orçamento de tokens, e o texto formatado é calculado uma vez por turno e reaproveitado
+por todas as chamadas à LLM desse turno.
+"""
+
+import threading
+from config import get_setting
+from core.prompt_utils import contar_tokens, truncar_para_tokens
+
+ORCAMENTOS_PADRAO = {
+    "sql": 1500,
+    "resposta": 1000,
+    "classificacao": 400,
+    "casual": 1000,
+}
+
+def resumir_extrativo(resumo_atual, mensagens, max_tokens=400, max_tokens_mensagem=60):
+    """
+    Resumo sem LLM: acrescenta uma linha curta por mensagem e descarta as linhas mais antigas
+    quando o resumo passa de `max_tokens`.
+    """
+    linhas = [linha for linha in (resumo_atual or "").splitlines() if linha.strip()]
+    for role, msg in mensagens:
+        texto = " ".join(str(msg).split())
+        linhas.append(f"- {role}: {truncar_para_tokens(texto, max_tokens_mensagem)}")
+    while len(linhas) > 1 and contar_tokens("\n".join(linhas)) > max_tokens:
+        linhas.pop(0)
+    return "\n".join(linhas)
+
+class GerenciadorHistorico:
+    """
+    Histórico limitado por tokens. Pode ser passado no lugar da lista `history`
+    para as funções de llm_utils e para o pipeline.
+    """
+
+    def __init__(self, max_mensagens_literais=6, orcamentos=None, resumidor=None, max_tokens_resumo=400):
+        self.max_mensagens_literais = max_mensagens_literais
+        self.orcamentos = dict(ORCAMENTOS_PADRAO, **(orcamentos or {}))
+        self.resumidor = resumidor
+        self.max_tokens_resumo = max_tokens_resumo
+        self.resumo = ""
+        self.mensagens = []
+        self._formatados = {}
+        self._lock = threading.Lock()
+        # Resumo do resumidor e mensagens que ele ainda não incorporou
+        self._resumo_base = ""
+        self._pendentes = []
+        self._thread_resumo = None
+
+    def __iter__(self):
+        return iter(list(self.mensagens))
+
+    def __len__(self):
+        return len(self.mensagens)
+
+    def adicionar(self, role, msg):
+        """
+        Acrescenta uma mensagem. As que saem da janela literal são incorporadas ao resumo.
+        """
+        with self._lock:
+            self.mensagens.append((role, msg))
+            excedentes = self.mensagens[:-self.max_mensagens_literais] if self.max_mensagens_literais else list(self.mensagens)
+            if excedentes:
+                self.mensagens = self.mensagens[len(excedentes):]
+                self.resumo = resumir_extrativo(self.resumo, excedentes, self.max_tokens_resumo)
+                if self.resumidor is not None:
+                    self._pendentes.extend(excedentes)
+                    if self._thread_resumo is None:
+                        self._thread_resumo = threading.Thread(
+                            target=self._resumir_em_segundo_plano, name="resumo-historico", daemon=True
+                        )
+                        self._thread_resumo.start()
+            self._formatados.clear()
+
+    def aguardar_resumo(self, timeout=None):
+        """
+        Espera o resumo em segundo plano terminar (se houver um em andamento).
+        """
+        thread = self._thread_resumo
+        if thread is not None:
+            thread.join(timeout)
+
+    def append(self, mensagem):
+        """
+        Permite usar o gerenciador onde se espera uma lista de (role, msg).
+        """
+        self.adicionar(*mensagem)
+
+    def formatar(self, tipo_prompt="resposta"):
+        """
+        Retorna o histórico formatado para o tipo de prompt, dentro do orçamento de tokens.
+        O resultado fica em cache até a próxima mensagem.
+        """
+        with self._lock:
+            if tipo_prompt not in self._formatados:
+                self._formatados[tipo_prompt] = self._formatar(self.orcamentos.get(tipo_prompt, 1000))
+            return self._formatados[tipo_prompt]
+
+    def _resumir_em_segundo_plano(self):
+        # A chamada ao resumidor fica fora do lock: o turno e as outras sessões não esperam por ela
+        while True:
+            with self._lock:
+                if not self._pendentes:
+                    self._thread_resumo = None
+                    return
+                lote, self._pendentes = self._pendentes, []
+                base = self._resumo_base
+            try:
+                resumo = truncar_para_tokens(self.resumidor(base, lote), self.max_tokens_resumo)
+            except Exception as e:
+                print("Erro ao resumir o histórico:", str(e))
+                resumo = resumir_extrativo(base, lote, self.max_tokens_resumo)
+            with self._lock:
+                self._resumo_base = resumo
+                # Mensagens que saíram da janela durante a chamada continuam no resumo, de forma extrativa
+                self.resumo = resumir_extrativo(resumo, self._pendentes, self.max_tokens_resumo) if self._pendentes else resumo
+                self._formatados.clear()
+
+    def _formatar(self, orcamento):
+        partes = []
+        restante = orcamento
+        if self.resumo:
+            resumo = truncar_para_tokens(self.resumo, min(self.max_tokens_resumo, orcamento // 3))
+            bloco_resumo = f"<|summary|>\n{resumo}\n"
+            restante -= contar_tokens(bloco_resumo)
+        else:
+            bloco_resumo = ""
+        # Inclui as mensagens mais recentes primeiro, até esgotar o orçamento
+        for role, msg in reversed(self.mensagens):
+            bloco = f"<|{role}|>\n{msg}\n"
+            tokens = contar_tokens(bloco)
+            if tokens > restante:
+                if not partes and restante > 20:
+                    partes.append(f"<|{role}|>\n{truncar_para_tokens(str(msg), restante - 10)}\n")
+                break
+            partes.append(bloco)
+            restante -= tokens
+        return bloco_resumo + "".join(reversed(partes))
+
+def formatar_historico(history, tipo_prompt="resposta"):
+    """
+    Formata o histórico para o prompt. Aceita uma lista de (role, msg), um GerenciadorHistorico
+    ou um texto já formatado.
+    """
+    if isinstance(history, str):
+        return history
+    if hasattr(history, "formatar"):
+        return history.formatar(tipo_prompt)
+    history_str = ""
+    for role, msg in history or []:
+        history_str += f"<|{role}|>\n{msg}\n"
+    return history_str
+
+def criar_gerenciador_historico(config, resumidor=None):
+    """
+    Cria o gerenciador de histórico a partir do .env (HISTORY_VERBATIM_MESSAGES,
+    HISTORY_SUMMARY_TOKENS e HISTORY_MAX_TOKENS_<TIPO>).
+    """
+    orcamentos = {
+        tipo: get_setting(config, f"HISTORY_MAX_TOKENS_{tipo.upper()}", padrao, int)
+        for tipo, padrao in ORCAMENTOS_PADRAO.items()
+    }
+    return GerenciadorHistorico(
+        max_mensagens_literais=get_setting(config, "HISTORY_VERBATIM_MESSAGES", 6, int),
+        orcamentos=orcamentos,
+        resumidor=resumidor,
+        max_tokens_resumo=get_setting(config, "HISTORY_SUMMARY_TOKENS", 400, int),
+    )
@@ -0,0 +1,245 @@
+"""
+Roteador local de intenção para evitar a chamada de classificação à LLM nos casos óbvios.
+
+Regras por palavras-chave/regex reconhecem saudações e agradecimentos e, como consulta, só perguntas
+que combinam uma pista de agregação ou filtro ("quantos", "média", "acima de") com o nome de uma
+tabela ou coluna do schema (ou um sinônimo de coluna de TERMOS_DOMINIO). Quando as regras não são conclusivas,
+um classificador Naive Bayes opcional, treinado a partir do tráfego registrado, é consultado.
+Se a confiança ficar abaixo do limiar, a decisão volta para a LLM.
+
+Para treinar o classificador a partir do log:
+    python -m core.intent_router .cache/intent_log.jsonl .cache/intent_model.json
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import threading
+import unicodedata
+from collections import Counter
+from config import get_setting
+
+SQL_REQUEST = "sql_request"
+CASUAL_INTERACTION = "casual_interaction"
+
+_REGEX_CASUAL = re.compile(
+    r"^(oi+|ola|hey|hi|hello|e ai|eai|bom dia|boa tarde|boa noite|good (morning|afternoon|evening)|"
+    r"obrigad[oa]|muito obrigad[oa]|valeu|thanks|thank you|thx|tchau|ate mais|ate logo|bye|"
+    r"tudo bem|tudo bom|beleza|ok|certo|legal|perfeito|show)"
+    r"( (tudo bem|tudo bom|obrigad[oa]|pela ajuda|assistente|bot|chatbot|amigo|amiga))*$"
+)
+_REGEX_AGREGACAO = re.compile(
+    r"\b(quant[oa]s?|qual|quais|media|mediana|soma|total|percentual|porcentagem|proporcao|"
+    r"distribuicao|maior|menor|maximo|minimo|ranking|top|contagem|liste|listar|mostre|"
+    r"how many|average|count|sum)\b"
+)
+_REGEX_FILTRO = re.compile(
+    r"\b(acima|abaixo|igual|entre|apenas|somente|exceto|sem|por|com|onde|maior que|menor que|mais de|menos de|"
+    r"above|below|between|only|where|per|by)\b"
+)
+# Agradecimentos e saudações seguidos de outras palavras ("obrigado pelos dados", "valeu pela tabela")
+_REGEX_CORTESIA = re.compile(
+    r"^(oi+|ola|hey|hi|hello|bom dia|boa tarde|boa noite|obrigad[oa]|muito obrigad[oa]|valeu|thanks|thank you|"
+    r"tchau|ate mais|ate logo|bye)\b"
+)
+# Perguntas sobre o próprio assistente ou sobre o que há disponível ("que dados você tem?")
+_REGEX_META = re.compile(
+    r"\b(voce|vc|voces|assistente|chatbot|bot)\b|\b(quais|que) (dados|tabelas|colunas|informacoes) (existem|ha|tem)\b"
+)
+# Pedidos de explicação sobre os dados ("explique o que significa a variável TARGET") citam colunas,
+# mas não são consultas: a decisão fica com o classificador ou com a LLM
+_REGEX_EXPLICACAO = re.compile(
+    r"\b(expli\w*|signific\w*|entend\w*|ajud\w*|defin\w*|descrev\w*|descricao|"
+    r"o que (e|sao)|como funciona\w*|pra que serve|para que serve|explain|meaning|mean|understand)\b"
+)
+
+# Sinônimos das colunas da tabela de crédito usados nas perguntas. Palavras genéricas ("dados",
+# "tabela", "registros") e de uso comum ("estado") ficam de fora: sozinhas, não indicam uma consulta
+TERMOS_DOMINIO = {
+    "cliente", "clientes", "idade", "uf", "genero", "sexo", "masculino", "feminino",
+    "inadimplente", "inadimplentes", "inadimplencia", "pagador", "pagadores",
+    "obito", "falecido", "falecidos",
+}
+
+def normalizar_texto(texto):
+    """
+    Remove acentos e pontuação, converte para minúsculas e colapsa espaços.
+    """
+    texto = unicodedata.normalize("NFKD", str(texto or ""))
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return re.sub(r"\s+", " ", texto).strip()
+
+def _radical(palavra):
+    return palavra[:6] if len(palavra) > 6 else palavra
+
+def extrair_vocabulario(schema, data_dictionary):
+    """
+    Extrai o vocabulário de dados: nomes de tabelas e colunas do schema, colunas do dicionário
+    de dados e os termos de domínio. O texto descritivo do dicionário não entra: palavras como
+    "estado" ou "brasileiro" aparecem em perguntas que não têm nada a ver com os dados.
+    """
+    vocabulario = set(TERMOS_DOMINIO)
+    for linha in (schema or "").splitlines():
+        match = re.match(r"\s*Tabela\s+(\w+):\s*(.*)", linha)
+        if match:
+            vocabulario.add(match.group(1).lower())
+            vocabulario.update(col.lower() for col in re.findall(r"(\w+)\s*\(", match.group(2)))
+    for linha in (data_dictionary or "").splitlines():
+        match = re.match(r"\s*([A-Z][A-Z0-9_]+):\s*(.*)", linha)
+        if match:
+            vocabulario.add(match.group(1).lower())
+    return {_radical(normalizar_texto(termo)) for termo in vocabulario if termo}
+
+class ClassificadorNaiveBayes:
+    """
+    Classificador Naive Bayes multinomial de tokens, serializável em JSON.
+    """
+
+    def __init__(self, contagens=None, documentos=None):
+        self.contagens = contagens or {}
+        self.documentos = documentos or {}
+
+    def treinar(self, exemplos):
+        """
+        Treina a partir de uma lista de (mensagem, rótulo).
+        """
+        for mensagem, rotulo in exemplos:
+            tokens = normalizar_texto(mensagem).split()
+            self.contagens.setdefault(rotulo, Counter()).update(tokens)
+            self.documentos[rotulo] = self.documentos.get(rotulo, 0) + 1
+        return self
+
+    def prever(self, mensagem):
+        """
+        Retorna (rótulo, probabilidade) da classe mais provável, ou (None, 0.0) sem treino.
+        """
+        if not self.documentos:
+            return None, 0.0
+        tokens = normalizar_texto(mensagem).split()
+        vocabulario = set().union(*(set(c) for c in self.contagens.values()))
+        total_documentos = sum(self.documentos.values())
+        log_probs = {}
+        for rotulo, contagem in self.contagens.items():
+            total_tokens = sum(contagem.values())
+            log_prob = math.log(self.documentos[rotulo] / total_documentos)
+            for token in tokens:
+                log_prob += math.log((contagem.get(token, 0) + 1) / (total_tokens + len(vocabulario)))
+            log_probs[rotulo] = log_prob
+        maximo = max(log_probs.values())
+        soma = sum(math.exp(lp - maximo) for lp in log_probs.values())
+        rotulo = max(log_probs, key=log_probs.get)
+        return rotulo, 1.0 / soma
+
+    def salvar(self, caminho):
+        if os.path.dirname(caminho):
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump({"contagens": self.contagens, "documentos": self.documentos}, f, ensure_ascii=False)
+
+    @classmethod
+    def carregar(cls, caminho):
+        with open(caminho, encoding="utf-8") as f:
+            dados = json.load(f)
+        return cls({r: Counter(c) for r, c in dados["contagens"].items()}, dados["documentos"])
+
+class RoteadorIntencao:
+    """
+    Classifica mensagens localmente, sem chamadas de rede, e informa a confiança da decisão.
+    """
+
+    def __init__(self, schema, data_dictionary, limiar=0.8, caminho_modelo=None, caminho_log=None):
+        self.vocabulario = extrair_vocabulario(schema, data_dictionary)
+        self.limiar = limiar
+        self.caminho_log = caminho_log
+        self.classificador = None
+        self._lock = threading.Lock()
+        if caminho_modelo and os.path.exists(caminho_modelo):
+            try:
+                self.classificador = ClassificadorNaiveBayes.carregar(caminho_modelo)
+            except Exception as e:
+                print("Erro ao carregar o classificador de intenção:", str(e))
+
+    def classificar(self, mensagem):
+        """
+        Retorna (rótulo, confiança). O rótulo é None quando nada pôde ser inferido.
+        """
+        texto = normalizar_texto(mensagem)
+        tokens = texto.split()
+        if not tokens:
+            return CASUAL_INTERACTION, 0.9
+        if _REGEX_CASUAL.match(texto):
+            return CASUAL_INTERACTION, 0.95
+        if _REGEX_EXPLICACAO.search(texto) or _REGEX_META.search(texto):
+            return self.classificador.prever(mensagem) if self.classificador is not None else (None, 0.0)
+        menciona_coluna = any(_radical(token) in self.vocabulario for token in tokens)
+        pista = bool(_REGEX_AGREGACAO.search(texto) or _REGEX_FILTRO.search(texto))
+        consulta = menciona_coluna and pista
+        if _REGEX_CORTESIA.match(texto) and not consulta:
+            return CASUAL_INTERACTION, 0.9
+        if consulta:
+            return SQL_REQUEST, 0.97
+        if self.classificador is not None:
+            return self.classificador.prever(mensagem)
+        if menciona_coluna or pista:
+            return SQL_REQUEST, 0.6
+        return None, 0.0
+
+    def decidir(self, mensagem):
+        """
+        Retorna o rótulo se a confiança atingir o limiar, ou None para consultar a LLM.
+        """
+        rotulo, confianca = self.classificar(mensagem)
+        return rotulo if rotulo is not None and confianca >= self.limiar else None
+
+    def registrar_exemplo(self, mensagem, rotulo):
+        """
+        Registra a decisão da LLM no log de tráfego usado para treinar o classificador.
+        """
+        if not self.caminho_log or rotulo not in (SQL_REQUEST, CASUAL_INTERACTION):
+            return
+        try:
+            with self._lock:
+                if os.path.dirname(self.caminho_log):
+                    os.makedirs(os.path.dirname(self.caminho_log), exist_ok=True)
+                with open(self.caminho_log, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"mensagem": mensagem, "rotulo": rotulo}, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print("Erro ao registrar exemplo de intenção:", str(e))
+
+def treinar_classificador(caminho_log, caminho_modelo):
+    """
+    Treina o classificador a partir do log JSONL de tráfego e o salva em `caminho_modelo`.
+    """
+    exemplos = []
+    with open(caminho_log, encoding="utf-8") as f:
+        for linha in f:
+            if linha.strip():
+                registro = json.loads(linha)
+                exemplos.append((registro["mensagem"], registro["rotulo"]))
+    classificador = ClassificadorNaiveBayes().treinar(exemplos)
+    classificador.salvar(caminho_modelo)
+    return classificador
+
+def criar_roteador_intencao(config, schema, data_dictionary):
+    """
+    Cria o roteador a partir do .env. Retorna None se estiver desabilitado (INTENT_ROUTER_ENABLED=false).
+    """
+    if not get_setting(config, "INTENT_ROUTER_ENABLED", True, bool):
+        return None
+    return RoteadorIntencao(
+        schema,
+        data_dictionary,
+        limiar=get_setting(config, "INTENT_ROUTER_THRESHOLD", 0.8, float),
+        caminho_modelo=get_setting(config, "INTENT_ROUTER_MODEL_PATH", os.path.join(".cache", "intent_model.json")),
+        caminho_log=get_setting(config, "INTENT_ROUTER_LOG_PATH", os.path.join(".cache", "intent_log.jsonl")),
+    )
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python -m core.intent_router <log.jsonl> <modelo.json>")
+        sys.exit(1)
+    modelo = treinar_classificador(sys.argv[1], sys.argv[2])
+    print("Classificador treinado com", sum(modelo.documentos.values()), "exemplos.")
@@ -0,0 +1,348 @@
+"""
+Agendador central das chamadas à LLM (Azure OpenAI).
+
+Todas as chamadas feitas pelos clientes de llm_utils passam por um AgendadorLLM por deployment:
+- baldes de tokens para a cota do deployment: requisições por minuto (AZURE_OPENAI_RPM) e tokens
+  por minuto (AZURE_OPENAI_TPM, estimados pelo prompt e corrigidos pelo uso informado pela API),
+  com rajada de até 1/6 da cota, já que o Azure avalia a cota em janelas curtas;
+- limite de chamadas simultâneas (LLM_MAX_CONCURRENCY);
+- prioridade: a vez é sempre da chamada pendente de menor nível (interativas antes do batch,
+  veja prioridade_llm);
+- novas tentativas em erros transitórios (429, 5xx, timeout, conexão) com espera exponencial
+  e jitter, respeitando o Retry-After da API (desligadas com sem_novas_tentativas_llm, para quem
+  repete a operação inteira, como o modo batch);
+- prazo por chamada (LLM_REQUEST_DEADLINE_SECONDS, ou prazo_llm para um trecho do código): a chamada
+  desiste com PrazoExcedido quando a fila, as esperas ou as tentativas passariam do prazo.
+
+Quota 0 (padrão) desativa o balde correspondente; as novas tentativas continuam valendo.
+"""
+
+import re
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from config import get_setting
+from core.metrics import registrar_metrica
+from core.tracing import somar_no_span
+
+PRIORIDADE_INTERATIVA = 0
+PRIORIDADE_BATCH = 10
+
+_INTERVALO_VERIFICACAO = 0.05
+_STATUS_TRANSITORIOS = {408, 409, 429, 500, 502, 503, 504}
+_NOMES_TRANSITORIOS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError",
+                       "ServiceUnavailableError", "TimeoutException", "ConnectError", "ReadTimeout"}
+_REGEX_TRANSITORIO = re.compile(r"\b(429|502|503|504)\b|rate.?limit", re.IGNORECASE)
+
+_prioridade = contextvars.ContextVar("prioridade_llm", default=PRIORIDADE_INTERATIVA)
+_prazo = contextvars.ContextVar("prazo_llm", default=None)
+_novas_tentativas = contextvars.ContextVar("novas_tentativas_llm", default=True)
+
+class PrazoExcedido(Exception):
+    """
+    A chamada à LLM não pôde ser concluída dentro do prazo.
+    """
+
+@contextmanager
+def prioridade_llm(nivel):
+    """
+    Define a prioridade das chamadas à LLM feitas dentro do bloco (menor = mais urgente).
+    """
+    token = _prioridade.set(nivel)
+    try:
+        yield
+    finally:
+        _prioridade.reset(token)
+
+@contextmanager
+def prazo_llm(segundos):
+    """
+    Limita a `segundos` a partir de agora o prazo de todas as chamadas à LLM feitas dentro do bloco.
+    """
+    limite = time.monotonic() + segundos
+    anterior = _prazo.get()
+    token = _prazo.set(limite if anterior is None else min(anterior, limite))
+    try:
+        yield
+    finally:
+        _prazo.reset(token)
+
+@contextmanager
+def sem_novas_tentativas_llm():
+    """
+    Faz cada chamada à LLM feita dentro do bloco ser tentada uma única vez: os erros transitórios
+    propagam para quem chamou, que decide se repete.
+    """
+    token = _novas_tentativas.set(False)
+    try:
+        yield
+    finally:
+        _novas_tentativas.reset(token)
+
+class BaldeTokens:
+    """
+    Balde de tokens com `capacidade` e reposição contínua de `por_segundo`.
+    """
+
+    def __init__(self, capacidade, por_segundo):
+        self.capacidade = capacidade
+        self.por_segundo = por_segundo
+        self.disponivel = capacidade
+        self._ultimo = time.monotonic()
+
+    def _repor(self, agora):
+        self.disponivel = min(self.capacidade, self.disponivel + (agora - self._ultimo) * self.por_segundo)
+        self._ultimo = agora
+
+    def espera(self, quantidade, agora):
+        """
+        Segundos até haver `quantidade` disponível (pedidos maiores que o balde esperam o balde cheio).
+        """
+        self._repor(agora)
+        falta = min(quantidade, self.capacidade) - self.disponivel
+        return max(falta, 0) / self.por_segundo
+
+    def consumir(self, quantidade):
+        self.disponivel -= quantidade
+
+    def devolver(self, quantidade):
+        self.disponivel = min(self.capacidade, self.disponivel + quantidade)
+
+def _criar_balde(cota_por_minuto):
+    if not cota_por_minuto:
+        return None
+    return BaldeTokens(max(1.0, cota_por_minuto / 6), cota_por_minuto / 60)
+
+def erro_transitorio(erro):
+    """
+    Indica se o erro da API vale uma nova tentativa (limite de taxa, indisponibilidade, timeout, conexão).
+    Aceita também o erro já formatado como texto ("RateLimitError: ...", como nos spans).
+    """
+    if isinstance(erro, str):
+        return erro.split(":", 1)[0] in _NOMES_TRANSITORIOS or bool(_REGEX_TRANSITORIO.search(erro))
+    status = getattr(erro, "status_code", None)
+    if status is not None:
+        return status in _STATUS_TRANSITORIOS
+    if type(erro).__name__ in _NOMES_TRANSITORIOS or isinstance(erro, (TimeoutError, ConnectionError)):
+        return True
+    return bool(_REGEX_TRANSITORIO.search(str(erro)))
+
+def _retry_after(erro):
+    resposta = getattr(erro, "response", None)
+    cabecalhos = getattr(resposta, "headers", None) or {}
+    for nome in ("retry-after-ms", "retry-after"):
+        valor = cabecalhos.get(nome)
+        if valor is None:
+            continue
+        try:
+            segundos = float(valor)
+        except (TypeError, ValueError):
+            continue
+        return segundos / 1000 if nome.endswith("-ms") else segundos
+    return None
+
+class AgendadorLLM:
+    """
+    Agenda as chamadas a um deployment: cota (RPM/TPM), concorrência, prioridade, novas tentativas e prazo.
+    """
+
+    def __init__(self, rpm=0, tpm=0, max_concorrencia=8, max_tentativas=5, espera_base=1.0, espera_maxima=30.0,
+                 prazo_padrao=120.0):
+        self.max_concorrencia = max_concorrencia
+        self.max_tentativas = max_tentativas
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.prazo_padrao = prazo_padrao
+        self.em_andamento = 0
+        self._balde_rpm = _criar_balde(rpm)
+        self._balde_tpm = _criar_balde(tpm)
+        self._pendentes = []
+        self._sequencia = itertools.count()
+        self._condicao = threading.Condition()
+
+    def _prazo(self):
+        limite = time.monotonic() + self.prazo_padrao if self.prazo_padrao else None
+        contexto = _prazo.get()
+        if contexto is None:
+            return limite
+        return contexto if limite is None else min(limite, contexto)
+
+    def _tentar_reservar(self, bilhete, tokens):
+        """
+        Reserva a vez do bilhete se ele é o primeiro da fila e há cota e vaga. Retorna 0 se reservou,
+        ou quantos segundos esperar antes de tentar de novo. Chamado com a condição adquirida.
+        """
+        if self._pendentes[0] != bilhete or self.em_andamento >= self.max_concorrencia:
+            return _INTERVALO_VERIFICACAO
+        agora = time.monotonic()
+        esperas = [0.0]
+        if self._balde_rpm is not None:
+            esperas.append(self._balde_rpm.espera(1, agora))
+        if self._balde_tpm is not None:
+            esperas.append(self._balde_tpm.espera(tokens, agora))
+        if max(esperas) > 0:
+            return max(esperas)
+        if self._balde_rpm is not None:
+            self._balde_rpm.consumir(1)
+        if self._balde_tpm is not None:
+            self._balde_tpm.consumir(tokens)
+        heapq.heappop(self._pendentes)
+        self.em_andamento += 1
+        self._condicao.notify_all()
+        return 0
+
+    def _desistir(self, bilhete):
+        # O bilhete pode já ter saído da fila (a vez foi reservada) quando a espera é interrompida
+        if bilhete in self._pendentes:
+            self._pendentes.remove(bilhete)
+            heapq.heapify(self._pendentes)
+        self._condicao.notify_all()
+
+    def _entrar_na_fila(self):
+        bilhete = (_prioridade.get(), next(self._sequencia))
+        heapq.heappush(self._pendentes, bilhete)
+        return bilhete
+
+    def _aguardar_vez(self, tokens, prazo):
+        inicio = time.monotonic()
+        with self._condicao:
+            bilhete = self._entrar_na_fila()
+            # Qualquer saída sem a vez (prazo, KeyboardInterrupt, cancelamento) tira o bilhete da fila;
+            # um bilhete esquecido no início da fila travaria todas as chamadas seguintes
+            try:
+                while True:
+                    espera = self._tentar_reservar(bilhete, tokens)
+                    if not espera:
+                        break
+                    if prazo is not None and time.monotonic() + espera > prazo:
+                        raise PrazoExcedido("Prazo da chamada à LLM excedido na fila do agendador.")
+                    self._condicao.wait(espera)
+            except BaseException:
+                self._desistir(bilhete)
+                raise
+        self._registrar_espera(time.monotonic() - inicio)
+
+    async def _aaguardar_vez(self, tokens, prazo):
+        inicio = time.monotonic()
+        with self._condicao:
+            bilhete = self._entrar_na_fila()
+        try:
+            while True:
+                with self._condicao:
+                    espera = self._tentar_reservar(bilhete, tokens)
+                if espera and prazo is not None and time.monotonic() + espera > prazo:
+                    raise PrazoExcedido("Prazo da chamada à LLM excedido na fila do agendador.")
+                if not espera:
+                    break
+                await asyncio.sleep(min(espera, _INTERVALO_VERIFICACAO))
+        except BaseException:
+            # Inclui o asyncio.CancelledError da tarefa cancelada durante a espera
+            with self._condicao:
+                self._desistir(bilhete)
+            raise
+        self._registrar_espera(time.monotonic() - inicio)
+
+    def _registrar_espera(self, segundos):
+        registrar_metrica("llm.agendador.espera", segundos)
+        somar_no_span(espera_agendador=segundos)
+
+    def _liberar(self):
+        with self._condicao:
+            self.em_andamento -= 1
+            self._condicao.notify_all()
+
+    def ajustar_tokens(self, estimados, reais):
+        """
+        Corrige o balde de TPM com o consumo real informado pela API.
+        """
+        if self._balde_tpm is None or reais is None:
+            return
+        with self._condicao:
+            if reais < estimados:
+                self._balde_tpm.devolver(estimados - reais)
+            else:
+                self._balde_tpm.consumir(reais - estimados)
+
+    def _espera_nova_tentativa(self, erro, tentativa, prazo):
+        """
+        Retorna quanto esperar antes da próxima tentativa, ou None se o erro não é transitório,
+        as tentativas acabaram ou a espera passaria do prazo.
+        """
+        if not _novas_tentativas.get() or not erro_transitorio(erro) or tentativa >= self.max_tentativas:
+            return None
+        espera = _retry_after(erro)
+        if espera is None:
+            espera = min(self.espera_maxima, self.espera_base * 2 ** (tentativa - 1)) * random.uniform(0.5, 1.0)
+        if prazo is not None and time.monotonic() + espera > prazo:
+            return None
+        registrar_metrica("llm.agendador.novas_tentativas", 1)
+        somar_no_span(novas_tentativas=1)
+        return espera
+
+    def executar(self, chamada, tokens=0):
+        """
+        Executa `chamada()` na vez dela, com novas tentativas nos erros transitórios.
+        """
+        prazo = self._prazo()
+        for tentativa in itertools.count(1):
+            self._aguardar_vez(tokens, prazo)
+            try:
+                return chamada()
+            except Exception as e:
+                espera = self._espera_nova_tentativa(e, tentativa, prazo)
+                if espera is None:
+                    raise
+            finally:
+                self._liberar()
+            time.sleep(espera)
+
+    async def aexecutar(self, chamada, tokens=0):
+        """
+        Versão assíncrona de executar: `chamada()` retorna uma corrotina.
+        """
+        prazo = self._prazo()
+        for tentativa in itertools.count(1):
+            await self._aaguardar_vez(tokens, prazo)
+            try:
+                return await chamada()
+            except Exception as e:
+                espera = self._espera_nova_tentativa(e, tentativa, prazo)
+                if espera is None:
+                    raise
+            finally:
+                self._liberar()
+            await asyncio.sleep(espera)
+
+_agendadores = {}
+_agendadores_lock = threading.Lock()
+
+def obter_agendador_llm(config):
+    """
+    Retorna o agendador compartilhado pelo processo para o deployment configurado
+    (a cota do Azure OpenAI é por deployment).
+    """
+    chave = (get_setting(config, "AZURE_OPENAI_ENDPOINT", ""), get_setting(config, "AZURE_OPENAI_DEPLOYMENT_NAME", ""))
+    with _agendadores_lock:
+        if chave not in _agendadores:
+            _agendadores[chave] = AgendadorLLM(
+                rpm=get_setting(config, "AZURE_OPENAI_RPM", 0, int),
+                tpm=get_setting(config, "AZURE_OPENAI_TPM", 0, int),
+                max_concorrencia=get_setting(config, "LLM_MAX_CONCURRENCY", 8, int),
+                max_tentativas=get_setting(config, "LLM_MAX_RETRIES", 5, int),
+                espera_base=get_setting(config, "LLM_BACKOFF_BASE_SECONDS", 1.0, float),
+                espera_maxima=get_setting(config, "LLM_BACKOFF_MAX_SECONDS", 30.0, float),
+                prazo_padrao=get_setting(config, "LLM_REQUEST_DEADLINE_SECONDS", 120.0, float),
+            )
+        return _agendadores[chave]
+
+def limpar_agendadores():
+    """
+    Descarta os agendadores compartilhados.
+    """
+    with _agendadores_lock:
+        _agendadores.clear()
@@ -1,20 +1,315 @@
 import re
-from langchain_openai import AzureChatOpenAI
+import json
+import time
+import hashlib
+import itertools
+import threading
+import httpx
+from config import get_setting
+from core.metrics import registrar_metrica
+from core.history_utils import formatar_historico
+from core.df_utils import resumir_dataframe
+from core.chart_renderer import validar_codigo_grafico
+from core.llm_scheduler import obter_agendador_llm, limpar_agendadores
+from core.prompt_utils import contar_tokens
+from core.tracing import rastrear, span, span_atual, somar_no_span, registrar_erro_no_span
 
-def gerar_sql_llm_chat(user_question, schema, openai_config, sintax, data_dictionary, history):
+# Registro de clientes LLM compartilhado pelo processo (terminal e todas as sessões do Streamlit).
+# Cada combinação de configuração + temperatura reaproveita o mesmo cliente e o mesmo pool HTTP keep-alive.
+_pool_lock = threading.Lock()
+_clientes_llm = {}
+_clientes_http = {}
+_estatisticas_pool = {"hits": 0, "misses": 0}
+_hooks_pool = []
+_fabrica_llm = None
+
+# Classe do cliente Azure OpenAI. O langchain_openai leva mais de um segundo para importar e só é
+# carregado na criação do primeiro cliente (ou por precarregar_cliente_llm).
+AzureChatOpenAI = None
+
+def precarregar_cliente_llm():
     """
-    Gera uma consulta SQL a partir de uma pergunta em linguagem natural usando LLM.
+    Importa o langchain_openai, se ainda não foi importado. Chamado em segundo plano na
+    inicialização do terminal e do chatbot, para que a primeira pergunta não pague a importação.
+    """
+    global AzureChatOpenAI
+    if AzureChatOpenAI is None:
+        from langchain_openai import AzureChatOpenAI as classe
+        AzureChatOpenAI = classe
+    return AzureChatOpenAI
+
+def _chave_cliente_llm(openai_config, temperature):
+    """
+    Monta a chave do registro a partir da configuração da Azure OpenAI e da temperatura.
+    A chave de API entra apenas como hash.
+    """
+    api_key_hash = hashlib.sha256(str(openai_config["AZURE_OPENAI_API_KEY"]).encode("utf-8")).hexdigest()
+    return (
+        api_key_hash,
+        openai_config["AZURE_OPENAI_ENDPOINT"],
+        openai_config["AZURE_OPENAI_DEPLOYMENT_NAME"],
+        openai_config["AZURE_OPENAI_API_VERSION"],
+        temperature,
+    )
+
+def _obter_cliente_http(openai_config):
+    """
+    Retorna o cliente HTTP (httpx) compartilhado para o endpoint, com pool de conexões keep-alive.
+    Deve ser chamada com o lock do pool adquirido.
+    """
+    endpoint = openai_config["AZURE_OPENAI_ENDPOINT"]
+    if endpoint not in _clientes_http:
+        limites = httpx.Limits(
+            max_connections=get_setting(openai_config, "LLM_POOL_MAX_CONNECTIONS", 20, int),
+            max_keepalive_connections=get_setting(openai_config, "LLM_POOL_MAX_KEEPALIVE", 10, int),
+            keepalive_expiry=get_setting(openai_config, "LLM_POOL_KEEPALIVE_EXPIRY", 60.0, float),
+        )
+        timeout = get_setting(openai_config, "LLM_REQUEST_TIMEOUT", 60.0, float)
+        _clientes_http[endpoint] = httpx.Client(limits=limites, timeout=timeout)
+    return _clientes_http[endpoint]
+
+def _notificar_hooks_pool(evento):
+    estatisticas = obter_estatisticas_pool_llm()
+    for hook in list(_hooks_pool):
+        try:
+            hook(evento, estatisticas)
+        except Exception as e:
+            print("Erro no hook de estatísticas do pool LLM:", str(e))
+
+TOKENS_RESPOSTA_ESTIMADOS = 256
+
+def _registrar_uso(prompt, resposta):
     """
-    llm = AzureChatOpenAI(
+    Acumula no span atual os tokens do prompt e da resposta: os informados pela API (usage_metadata)
+    ou, na falta deles, a contagem local. Retorna o total de tokens, ou None se a API não o informou.
+    """
+    uso = getattr(resposta, "usage_metadata", None)
+    if isinstance(uso, dict) and "input_tokens" in uso:
+        somar_no_span(chamadas_llm=1, prompt_tokens=uso["input_tokens"], completion_tokens=uso.get("output_tokens", 0))
+        return uso["input_tokens"] + uso.get("output_tokens", 0)
+    conteudo = resposta if isinstance(resposta, str) else getattr(resposta, "content", None)
+    somar_no_span(
+        chamadas_llm=1,
+        prompt_tokens=contar_tokens(prompt) if isinstance(prompt, str) else 0,
+        completion_tokens=contar_tokens(conteudo) if isinstance(conteudo, str) else 0,
+    )
+    return None
+
+def _tokens_estimados(prompt):
+    return (contar_tokens(prompt) if isinstance(prompt, str) else 0) + TOKENS_RESPOSTA_ESTIMADOS
+
+class _ClienteRastreado:
+    """
+    Envolve o cliente da LLM para passar cada chamada pelo agendador do deployment (cota, prioridade,
+    novas tentativas e prazo; veja core/llm_scheduler.py), acumular no span atual os tokens
+    e anotar no span os erros da API (que as funções deste módulo tratam com print).
+    """
+
+    def __init__(self, llm, agendador):
+        self._llm = llm
+        self._agendador = agendador
+
+    def __getattr__(self, nome):
+        return getattr(self._llm, nome)
+
+    def bind(self, **kwargs):
+        return _ClienteRastreado(self._llm.bind(**kwargs), self._agendador)
+
+    def invoke(self, prompt, *args, **kwargs):
+        tokens = _tokens_estimados(prompt)
+        try:
+            resposta = self._agendador.executar(lambda: self._llm.invoke(prompt, *args, **kwargs), tokens)
+        except Exception as e:
+            registrar_erro_no_span(e)
+            raise
+        self._agendador.ajustar_tokens(tokens, _registrar_uso(prompt, resposta))
+        return resposta
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        tokens = _tokens_estimados(prompt)
+        try:
+            resposta = await self._agendador.aexecutar(lambda: self._llm.ainvoke(prompt, *args, **kwargs), tokens)
+        except Exception as e:
+            registrar_erro_no_span(e)
+            raise
+        self._agendador.ajustar_tokens(tokens, _registrar_uso(prompt, resposta))
+        return resposta
+
+    def stream(self, prompt, *args, **kwargs):
+        # Só o início do stream (até o primeiro trecho) passa pelo agendador e pode ser repetido
+        def iniciar():
+            iterador = iter(self._llm.stream(prompt, *args, **kwargs))
+            return iterador, next(iterador, None)
+
+        partes = []
+        try:
+            iterador, primeiro = self._agendador.executar(iniciar, _tokens_estimados(prompt))
+            if primeiro is not None:
+                for chunk in itertools.chain([primeiro], iterador):
+                    if isinstance(chunk.content, str):
+                        partes.append(chunk.content)
+                    yield chunk
+        except Exception as e:
+            registrar_erro_no_span(e)
+            raise
+        _registrar_uso(prompt, "".join(partes))
+
+def _criar_cliente_azure(openai_config, temperature):
+    parametros = dict(
         openai_api_key=openai_config["AZURE_OPENAI_API_KEY"],
         azure_endpoint=openai_config["AZURE_OPENAI_ENDPOINT"],
         deployment_name=openai_config["AZURE_OPENAI_DEPLOYMENT_NAME"],
         openai_api_version=openai_config["AZURE_OPENAI_API_VERSION"],
-        temperature=0
+        http_client=_obter_cliente_http(openai_config),
     )
-    history_str = ""
-    for role, msg in history:
-        history_str += f"<|{role}|>\n{msg}\n"
+    if temperature is not None:
+        parametros["temperature"] = temperature
+    # As novas tentativas ficam com o agendador (core/llm_scheduler.py), que conhece a cota e o prazo
+    parametros["max_retries"] = 0
+    return precarregar_cliente_llm()(**parametros)
+
+def definir_fabrica_llm(fabrica):
+    """
+    Substitui a criação dos clientes do registro por `fabrica(openai_config, temperature)`,
+    que deve retornar um objeto com a interface do AzureChatOpenAI (invoke, ainvoke, stream, bind).
+    Usado pelos benchmarks para injetar uma LLM local; `None` volta ao AzureChatOpenAI.
+    Os clientes já criados são descartados.
+    """
+    global _fabrica_llm
+    limpar_pool_llm()
+    _fabrica_llm = fabrica
+
+def obter_cliente_llm(openai_config, temperature=None):
+    """
+    Retorna um cliente AzureChatOpenAI reaproveitado do registro do processo.
+    Cria o cliente apenas na primeira chamada para cada combinação de configuração e temperatura.
+    """
+    chave = _chave_cliente_llm(openai_config, temperature)
+    with _pool_lock:
+        llm = _clientes_llm.get(chave)
+        if llm is not None:
+            _estatisticas_pool["hits"] += 1
+            evento = "hit"
+        else:
+            llm = _ClienteRastreado(
+                (_fabrica_llm or _criar_cliente_azure)(openai_config, temperature), obter_agendador_llm(openai_config)
+            )
+            _clientes_llm[chave] = llm
+            _estatisticas_pool["misses"] += 1
+            evento = "miss"
+    _notificar_hooks_pool(evento)
+    return llm
+
+def obter_estatisticas_pool_llm():
+    """
+    Retorna as estatísticas do registro de clientes: hits, misses, taxa de acerto e clientes ativos.
+    """
+    hits = _estatisticas_pool["hits"]
+    misses = _estatisticas_pool["misses"]
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / total if total else 0.0,
+        "clientes_ativos": len(_clientes_llm),
+    }
+
+def registrar_hook_pool_llm(hook):
+    """
+    Registra uma função `hook(evento, estatisticas)` chamada a cada hit ou miss do registro.
+    """
+    _hooks_pool.append(hook)
+
+def obter_funcao_embedding(openai_config):
+    """
+    Retorna a função de embedding (texto -> vetor) do deployment configurado em
+    AZURE_OPENAI_EMBEDDING_DEPLOYMENT, ou None se não houver deployment de embeddings.
+    """
+    deployment = get_setting(openai_config, "AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+    if not deployment:
+        return None
+    from langchain_openai import AzureOpenAIEmbeddings
+    chave = _chave_cliente_llm(openai_config, "embedding") + (deployment,)
+    with _pool_lock:
+        if chave not in _clientes_llm:
+            _clientes_llm[chave] = AzureOpenAIEmbeddings(
+                openai_api_key=openai_config["AZURE_OPENAI_API_KEY"],
+                azure_endpoint=openai_config["AZURE_OPENAI_ENDPOINT"],
+                azure_deployment=deployment,
+                openai_api_version=openai_config["AZURE_OPENAI_API_VERSION"],
+                http_client=_obter_cliente_http(openai_config),
+            )
+        embeddings = _clientes_llm[chave]
+    return embeddings.embed_query
+
+def limpar_pool_llm():
+    """
+    Descarta todos os clientes do registro, fecha os pools HTTP e zera as estatísticas.
+    """
+    with _pool_lock:
+        for cliente_http in _clientes_http.values():
+            cliente_http.close()
+        _clientes_llm.clear()
+        _clientes_http.clear()
+        limpar_agendadores()
+        _estatisticas_pool["hits"] = 0
+        _estatisticas_pool["misses"] = 0
+
+def _transmitir_resposta(llm, prompt, nome_metrica, mensagem_erro):
+    """
+    Retorna um gerador que consome llm.stream(prompt) gerando os trechos de texto e registra o tempo
+    até o primeiro token na métrica '<nome_metrica>.ttft'. Em caso de erro, gera `mensagem_erro`
+    formatada com o erro. O span `nome_metrica` cobre todo o consumo e é filho do span atual.
+    """
+    pai = span_atual()
+
+    def gerar():
+        with span(nome_metrica, pai=pai, stream=True) as atual:
+            inicio = time.perf_counter()
+            primeiro_token = True
+            try:
+                for chunk in llm.stream(prompt):
+                    if not chunk.content:
+                        continue
+                    if primeiro_token:
+                        registrar_metrica(f"{nome_metrica}.ttft", time.perf_counter() - inicio)
+                        atual.definir(ttft=time.perf_counter() - inicio)
+                        primeiro_token = False
+                    yield chunk.content
+            except Exception as e:
+                yield mensagem_erro.format(str(e))
+            finally:
+                registrar_metrica(f"{nome_metrica}.duracao", time.perf_counter() - inicio)
+    return gerar()
+
+def _buscar_sql_em_cache(cache, user_question, schema, sintax, data_dictionary, history):
+    """
+    Retorna a resposta no formato ```sql``` com o SQL em cache, ou None.
+    O SQL só entra no cache depois de executado com sucesso (veja pipeline._registrar_consulta).
+    """
+    if cache is None:
+        return None
+    sql_em_cache = cache.buscar(user_question, cache.chave_contexto(schema, sintax, data_dictionary, history, user_question))
+    return f"```sql\n{sql_em_cache}\n```" if sql_em_cache else None
+
+def _selecionar_schema(recuperador, user_question, schema, data_dictionary, history):
+    """
+    Retorna (schema, data_dictionary) para o prompt: apenas as partes relevantes para a pergunta,
+    se houver um `recuperador` (RecuperadorSchema), ou os textos completos.
+    A busca considera também a pergunta anterior do usuário, para perguntas de acompanhamento.
+    """
+    if recuperador is None:
+        return schema, data_dictionary
+    try:
+        perguntas = [] if isinstance(history, str) else [msg for role, msg in history or [] if role == "user"]
+        anteriores = [msg for msg in perguntas[-2:] if msg != user_question]
+        return recuperador.selecionar(" ".join(anteriores[-1:] + [user_question]))
+    except Exception as e:
+        print("Erro ao selecionar o schema relevante:", str(e))
+        return schema, data_dictionary
+
+def _montar_prompt_sql(user_question, schema, sintax, data_dictionary, history):
+    history_str = formatar_historico(history, "sql")
     prompt = f'''
 <|system|>
 You are a specialist in creating and building SQL queries. You must follow the syntax rules according to
@@ -39,12 +334,50 @@ the engine. You must respond ONLY WITH THE QUERY according to USER. You must str
 {user_question}
 <|assistant|>:
 '''
+    return prompt
+
+@rastrear("llm.gerar_sql")
+def gerar_sql_llm_chat(user_question, schema, openai_config, sintax, data_dictionary, history, cache=None,
+                       recuperador=None):
+    """
+    Gera uma consulta SQL a partir de uma pergunta em linguagem natural usando LLM.
+    Se um `cache` (CacheSQL) for informado, um acerto devolve o SQL armazenado sem chamar a LLM.
+    Com um `recuperador` (RecuperadorSchema), o prompt leva só as tabelas, colunas e entradas do
+    dicionário relevantes para a pergunta; a chave do cache continua usando o schema completo.
+    """
+    resposta_em_cache = _buscar_sql_em_cache(cache, user_question, schema, sintax, data_dictionary, history)
+    if resposta_em_cache:
+        return resposta_em_cache
+    llm = obter_cliente_llm(openai_config, temperature=0)
+    schema_prompt, dicionario_prompt = _selecionar_schema(recuperador, user_question, schema, data_dictionary, history)
+    prompt = _montar_prompt_sql(user_question, schema_prompt, sintax, dicionario_prompt, history)
     try:
         response = llm.invoke(prompt)
-        return response.content.strip()
+        resposta = response.content.strip()
+    except Exception as e:
+        print("Erro ao chamar a LLM para gerar SQL:", str(e))
+        return "NO_CONTEXT"
+    return resposta
+
+@rastrear("llm.gerar_sql")
+async def agerar_sql_llm_chat(user_question, schema, openai_config, sintax, data_dictionary, history, cache=None,
+                              recuperador=None):
+    """
+    Versão assíncrona de gerar_sql_llm_chat.
+    """
+    resposta_em_cache = _buscar_sql_em_cache(cache, user_question, schema, sintax, data_dictionary, history)
+    if resposta_em_cache:
+        return resposta_em_cache
+    llm = obter_cliente_llm(openai_config, temperature=0)
+    schema_prompt, dicionario_prompt = _selecionar_schema(recuperador, user_question, schema, data_dictionary, history)
+    prompt = _montar_prompt_sql(user_question, schema_prompt, sintax, dicionario_prompt, history)
+    try:
+        response = await llm.ainvoke(prompt)
+        resposta = response.content.strip()
     except Exception as e:
         print("Erro ao chamar a LLM para gerar SQL:", str(e))
         return "NO_CONTEXT"
+    return resposta
 
 def extrair_sql_da_resposta(resposta_llm):
     """
@@ -66,23 +399,71 @@ def extrair_sql_da_resposta(resposta_llm):
         raise ValueError("A resposta da LLM não contém uma consulta SQL SELECT válida.")
     return sql_final
 
-def gerar_resposta_natural(df, user_question, consulta_sql, openai_config, history):
+def _montar_prompt_reparo_sql(user_question, consulta_sql, erros, schema, sintax):
+    erros_str = "\n".join(f"- {erro}" for erro in erros)
+    prompt = f'''
+<|system|>
+You are a specialist in fixing SQL queries. The QUERY below was written for the USER question but
+failed the validation against the SCHEMA with the listed ERRORS. Fix ONLY what the errors point to.
+<|sintax|>
+{sintax}
+<|rules|>
+- Return SQL only
+- DO NOT RETURN EXPLANATIONS
+- Use only tables and columns that exist in the SCHEMA
+- Keep the meaning of the original query
+- If unable to, return NO_CONTEXT
+- The answer MUST ALWAYS be between ```sql and ```
+<|schema|>
+{schema}
+<|query|>
+{consulta_sql}
+<|errors|>
+{erros_str}
+<|user|>:
+{user_question}
+<|assistant|>:
+'''
+    return prompt
+
+@rastrear("llm.reparo_sql")
+def reparar_sql_llm(user_question, consulta_sql, erros, schema, sintax, openai_config):
     """
-    Gera uma resposta em linguagem natural para o usuário, baseada no DataFrame retornado da consulta SQL,
-    na pergunta original e na query SQL gerada.
+    Pede à LLM a correção de uma consulta que falhou na validação local (core/sql_validator.py),
+    informando os erros exatos. Retorna a resposta da LLM (com o SQL entre ```sql e ```)
+    ou "NO_CONTEXT" em caso de erro.
     """
-    llm = AzureChatOpenAI(
-        openai_api_key=openai_config["AZURE_OPENAI_API_KEY"],
-        azure_endpoint=openai_config["AZURE_OPENAI_ENDPOINT"],
-        deployment_name=openai_config["AZURE_OPENAI_DEPLOYMENT_NAME"],
-        openai_api_version=openai_config["AZURE_OPENAI_API_VERSION"],
-        temperature=0
-    )
-    history_str = ""
-    for role, msg in history:
-        history_str += f"<|{role}|>\n{msg}\n"
+    llm = obter_cliente_llm(openai_config, temperature=0)
+    prompt = _montar_prompt_reparo_sql(user_question, consulta_sql, erros, schema, sintax)
+    try:
+        response = llm.invoke(prompt)
+        return response.content.strip()
+    except Exception as e:
+        print("Erro ao chamar a LLM para corrigir o SQL:", str(e))
+        return "NO_CONTEXT"
 
-    df_str = df.to_markdown(index=False) if df is not None and not df.empty else "No results found."
+@rastrear("llm.reparo_sql")
+async def areparar_sql_llm(user_question, consulta_sql, erros, schema, sintax, openai_config):
+    """
+    Versão assíncrona de reparar_sql_llm.
+    """
+    llm = obter_cliente_llm(openai_config, temperature=0)
+    prompt = _montar_prompt_reparo_sql(user_question, consulta_sql, erros, schema, sintax)
+    try:
+        response = await llm.ainvoke(prompt)
+        return response.content.strip()
+    except Exception as e:
+        print("Erro ao chamar a LLM para corrigir o SQL:", str(e))
+        return "NO_CONTEXT"
+
+def _montar_prompt_resposta_natural(df, user_question, consulta_sql, history, openai_config):
+    history_str = formatar_historico(history, "resposta")
+
+    df_str = resumir_dataframe(
+        df,
+        max_linhas=get_setting(openai_config, "PROMPT_RESULT_MAX_ROWS", 50, int),
+        max_tokens=get_setting(openai_config, "PROMPT_RESULT_MAX_TOKENS", 1500, int),
+    )
     prompt = f"""
 <|system|>
 You are a data analyst assistant. Your job is to answer the user's question in clear, natural English, based on the SQL query result below.
@@ -101,27 +482,47 @@ Always be concise, objective, and use the data to justify your answer. If the re
 
 <|assistant|>
 """
+    return prompt
+
+@rastrear("llm.resposta_natural")
+def gerar_resposta_natural(df, user_question, consulta_sql, openai_config, history):
+    """
+    Gera uma resposta em linguagem natural para o usuário, baseada no DataFrame retornado da consulta SQL,
+    na pergunta original e na query SQL gerada.
+    """
+    llm = obter_cliente_llm(openai_config, temperature=0)
+    prompt = _montar_prompt_resposta_natural(df, user_question, consulta_sql, history, openai_config)
     try:
         response = llm.invoke(prompt)
         return response.content.strip()
     except Exception as e:
         return f"Desculpe, eu não pude gerar uma resposta em linguagem natural. Erro: {str(e)}"
 
-def classificar_mensagem(user_message, openai_config, history):
+@rastrear("llm.resposta_natural")
+async def agerar_resposta_natural(df, user_question, consulta_sql, openai_config, history):
     """
-    Classifica a mensagem do usuário como 'sql_request' ou 'casual_interaction' usando uma LLM.
+    Versão assíncrona de gerar_resposta_natural.
     """
-    llm = AzureChatOpenAI(
-        openai_api_key=openai_config["AZURE_OPENAI_API_KEY"],
-        azure_endpoint=openai_config["AZURE_OPENAI_ENDPOINT"],
-        deployment_name=openai_config["AZURE_OPENAI_DEPLOYMENT_NAME"],
-        openai_api_version=openai_config["AZURE_OPENAI_API_VERSION"],
-        temperature=0
+    llm = obter_cliente_llm(openai_config, temperature=0)
+    prompt = _montar_prompt_resposta_natural(df, user_question, consulta_sql, history, openai_config)
+    try:
+        response = await llm.ainvoke(prompt)
+        return response.content.strip()
+    except Exception as e:
+        return f"Desculpe, eu não pude gerar uma resposta em linguagem natural. Erro: {str(e)}"
+
+def gerar_resposta_natural_stream(df, user_question, consulta_sql, openai_config, history):
+    """
+    Versão em streaming de gerar_resposta_natural: gera os trechos da resposta à medida que chegam da LLM.
+    """
+    llm = obter_cliente_llm(openai_config, temperature=0)
+    prompt = _montar_prompt_resposta_natural(df, user_question, consulta_sql, history, openai_config)
+    return _transmitir_resposta(
+        llm, prompt, "llm.resposta_natural", "Desculpe, eu não pude gerar uma resposta em linguagem natural. Erro: {}"
     )
-    
-    history_str = ""
-    for role, msg in history:
-        history_str += f"<|{role}|>\n{msg}\n"
+
+def _montar_prompt_classificacao(user_message, history):
+    history_str = formatar_historico(history, "classificacao")
 
     prompt = f"""
 <|system|>
@@ -139,27 +540,133 @@ Important: Only return "sql_request" or "casual_interaction" and nothing else. D
 
 <|assistant|>
 """
+    return prompt
+
+@rastrear("llm.classificacao")
+def classificar_mensagem(user_message, openai_config, history, roteador=None):
+    """
+    Classifica a mensagem do usuário como 'sql_request' ou 'casual_interaction' usando uma LLM.
+    Se um `roteador` (RoteadorIntencao) for informado, os casos óbvios são decididos localmente
+    e a LLM só é chamada quando a confiança local é baixa.
+    """
+    if roteador is not None:
+        tipo_local = roteador.decidir(user_message)
+        if tipo_local is not None:
+            return tipo_local
+    llm = obter_cliente_llm(openai_config, temperature=0)
+    prompt = _montar_prompt_classificacao(user_message, history)
     try:
         response = llm.invoke(prompt)
-        return response.content.strip().lower()
+        tipo = response.content.strip().lower()
     except Exception as e:
         print("Erro ao classificar mensagem:", str(e))
         return "casual_interaction"
+    if roteador is not None:
+        roteador.registrar_exemplo(user_message, tipo)
+    return tipo
 
-def responder_casual_interaction(history, user_message, openai_config):
+@rastrear("llm.classificacao")
+async def aclassificar_mensagem(user_message, openai_config, history, roteador=None):
     """
-    Responde a interações casuais usando uma LLM, considerando o histórico de mensagens.
-    Não conversa sobre assuntos que não tenham relação com análise de dados, negócios ou perguntas sobre o sistema.
+    Versão assíncrona de classificar_mensagem.
     """
-    llm = AzureChatOpenAI(
-        openai_api_key=openai_config["AZURE_OPENAI_API_KEY"],
-        azure_endpoint=openai_config["AZURE_OPENAI_ENDPOINT"],
-        deployment_name=openai_config["AZURE_OPENAI_DEPLOYMENT_NAME"],
-        openai_api_version=openai_config["AZURE_OPENAI_API_VERSION"]
-    )
-    history_str = ""
-    for role, msg in history:
-        history_str += f"<|{role}|>\n{msg}\n"
+    if roteador is not None:
+        tipo_local = roteador.decidir(user_message)
+        if tipo_local is not None:
+            return tipo_local
+    llm = obter_cliente_llm(openai_config, temperature=0)
+    prompt = _montar_prompt_classificacao(user_message, history)
+    try:
+        response = await llm.ainvoke(prompt)
+        tipo = response.content.strip().lower()
+    except Exception as e:
+        print("Erro ao classificar mensagem:", str(e))
+        return "casual_interaction"
+    if roteador is not None:
+        roteador.registrar_exemplo(user_message, tipo)
+    return tipo
+
+def _montar_prompt_combinado(user_message, schema, sintax, data_dictionary, history):
+    history_str = formatar_historico(history, "sql")
+    prompt = f'''
+<|system|>
+You are a data analyst assistant. First decide whether the user's last message is a data request or a casual interaction.
+- Data request (e.g., "What's the most expensive product?", "How many sales did we have today?"): write a SQL query that answers it,
+following the syntax rules and using only names that exist in the SCHEMA.
+- Casual interaction (e.g., "hi", "thanks", "good afternoon"): reply in a natural and polite way. Do not engage in conversations
+that are not related to data analysis, business insights, or questions about the system. Politely redirect the user if the topic is not relevant.
+<|sintax|>
+{sintax}
+<|schema|>
+{schema}
+<|data dictionary|>
+{data_dictionary}
+<|output|>
+Respond ONLY with a JSON object with the keys:
+- "intent": "sql_request" or "casual_interaction"
+- "sql": the SQL query for sql_request (or "NO_CONTEXT" if it cannot be answered with the SCHEMA), otherwise null
+- "reply": the reply for casual_interaction, otherwise null
+<|history|>
+{history_str}
+<|user|>
+{user_message}
+<|assistant|>
+'''
+    return prompt
+
+def _interpretar_resposta_combinada(conteudo):
+    match = re.search(r"\{.*\}", conteudo, re.DOTALL)
+    dados = json.loads(match.group(0) if match else conteudo)
+    tipo = str(dados.get("intent") or "").strip().lower()
+    if tipo == "sql_request":
+        resposta_sql = f"```sql\n{dados.get('sql') or 'NO_CONTEXT'}\n```"
+        return {"tipo": tipo, "resposta_sql": resposta_sql, "resposta": None}
+    return {"tipo": tipo, "resposta_sql": None, "resposta": str(dados.get("reply") or "").strip()}
+
+def _erro_resposta_combinada(erro):
+    print("Erro ao classificar e gerar SQL com a LLM:", str(erro))
+    return {"tipo": "casual_interaction", "resposta_sql": None, "resposta": f"Desculpe, eu não puder responder devido ao erro: {str(erro)}"}
+
+@rastrear("llm.classificacao_e_sql")
+def classificar_e_gerar_sql(user_message, schema, openai_config, sintax, data_dictionary, history, cache=None,
+                            recuperador=None):
+    """
+    Classifica a mensagem e, na mesma chamada à LLM, gera o SQL (sql_request) ou a resposta casual
+    (casual_interaction). Retorna um dicionário com as chaves 'tipo', 'resposta_sql' e 'resposta'.
+    'resposta_sql' segue o formato de gerar_sql_llm_chat, para uso em extrair_sql_da_resposta.
+    """
+    resposta_em_cache = _buscar_sql_em_cache(cache, user_message, schema, sintax, data_dictionary, history)
+    if resposta_em_cache:
+        return {"tipo": "sql_request", "resposta_sql": resposta_em_cache, "resposta": None}
+    llm = obter_cliente_llm(openai_config, temperature=0)
+    schema_prompt, dicionario_prompt = _selecionar_schema(recuperador, user_message, schema, data_dictionary, history)
+    prompt = _montar_prompt_combinado(user_message, schema_prompt, sintax, dicionario_prompt, history)
+    try:
+        response = llm.bind(response_format={"type": "json_object"}).invoke(prompt)
+        return _interpretar_resposta_combinada(response.content)
+    except Exception as e:
+        return _erro_resposta_combinada(e)
+
+@rastrear("llm.classificacao_e_sql")
+async def aclassificar_e_gerar_sql(user_message, schema, openai_config, sintax, data_dictionary, history, cache=None,
+                                   recuperador=None):
+    """
+    Versão assíncrona de classificar_e_gerar_sql.
+    """
+    resposta_em_cache = _buscar_sql_em_cache(cache, user_message, schema, sintax, data_dictionary, history)
+    if resposta_em_cache:
+        return {"tipo": "sql_request", "resposta_sql": resposta_em_cache, "resposta": None}
+    llm = obter_cliente_llm(openai_config, temperature=0)
+    schema_prompt, dicionario_prompt = _selecionar_schema(recuperador, user_message, schema, data_dictionary, history)
+    prompt = _montar_prompt_combinado(user_message, schema_prompt, sintax, dicionario_prompt, history)
+    try:
+        response = await llm.bind(response_format={"type": "json_object"}).ainvoke(prompt)
+        return _interpretar_resposta_combinada(response.content)
+    except Exception as e:
+        return _erro_resposta_combinada(e)
+
+def _montar_prompt_casual(history, user_message):
+    history_str = formatar_historico(history, "casual")
     prompt = f"""
 <|system|>
 You are a friendly data analyst assistant. Respond to the user's last message in a natural and polite way, considering the conversation history.
@@ -172,22 +679,46 @@ Do not engage in conversations that are not related to data analysis, business i
 
 <|assistant|>
 """
+    return prompt
+
+@rastrear("llm.resposta_casual")
+def responder_casual_interaction(history, user_message, openai_config):
+    """
+    Responde a interações casuais usando uma LLM, considerando o histórico de mensagens.
+    Não conversa sobre assuntos que não tenham relação com análise de dados, negócios ou perguntas sobre o sistema.
+    """
+    llm = obter_cliente_llm(openai_config)
+    prompt = _montar_prompt_casual(history, user_message)
     try:
         response = llm.invoke(prompt)
         return response.content.strip()
     except Exception as e:
         return f"Desculpe, eu não puder responder devido ao erro: {str(e)}"
-    
-def gerar_codigo_grafico_llm(df, user_message, openai_config):
+
+@rastrear("llm.resposta_casual")
+async def aresponder_casual_interaction(history, user_message, openai_config):
     """
-    Gera um código Python para visualização de dados com base no DataFrame e na pergunta do usuário.
+    Versão assíncrona de responder_casual_interaction.
     """
-    llm = AzureChatOpenAI(
-        openai_api_key=openai_config["AZURE_OPENAI_API_KEY"],
-        azure_endpoint=openai_config["AZURE_OPENAI_ENDPOINT"],
-        deployment_name=openai_config["AZURE_OPENAI_DEPLOYMENT_NAME"],
-        openai_api_version=openai_config["AZURE_OPENAI_API_VERSION"],
-        temperature=0.2  
+    llm = obter_cliente_llm(openai_config)
+    prompt = _montar_prompt_casual(history, user_message)
+    try:
+        response = await llm.ainvoke(prompt)
+        return response.content.strip()
+    except Exception as e:
+        return f"Desculpe, eu não puder responder devido ao erro: {str(e)}"
+
+def responder_casual_interaction_stream(history, user_message, openai_config):
+    """
+    Versão em streaming de responder_casual_interaction: gera os trechos da resposta à medida que chegam da LLM.
+    """
+    llm = obter_cliente_llm(openai_config)
+    prompt = _montar_prompt_casual(history, user_message)
+    return _transmitir_resposta(llm, prompt, "llm.resposta_casual", "Desculpe, eu não puder responder devido ao erro: {}")
+
+def _montar_prompt_grafico(df, user_message, openai_config):
+    df_str = resumir_dataframe(
+        df, modo="schema", max_tokens=get_setting(openai_config, "PROMPT_CHART_MAX_TOKENS", 800, int)
     )
     prompt = f"""
     <|system|>
@@ -206,50 +737,70 @@ def gerar_codigo_grafico_llm(df, user_message, openai_config):
     {user_message}
 
     <|dataframe|>
-    {df.to_markdown()}
+    {df_str}
 
     <|assistant|>
     """
+    return prompt
 
+@rastrear("llm.codigo_grafico")
+def gerar_codigo_grafico_llm(df, user_message, openai_config):
+    """
+    Gera um código Python para visualização de dados com base no DataFrame e na pergunta do usuário.
+    """
+    llm = obter_cliente_llm(openai_config, temperature=0.2)
+    prompt = _montar_prompt_grafico(df, user_message, openai_config)
     try:
         response = llm.invoke(prompt)
         return response.content.strip()
     except Exception as e:
         return f"Desculpe, não pude gerar o gráfico devido ao erro: {str(e)}"
+
+@rastrear("llm.codigo_grafico")
+async def agerar_codigo_grafico_llm(df, user_message, openai_config):
+    """
+    Versão assíncrona de gerar_codigo_grafico_llm.
+    """
+    llm = obter_cliente_llm(openai_config, temperature=0.2)
+    prompt = _montar_prompt_grafico(df, user_message, openai_config)
+    try:
+        response = await llm.ainvoke(prompt)
+        return response.content.strip()
+    except Exception as e:
+        return f"Desculpe, não pude gerar o gráfico devido ao erro: {str(e)}"
     
 
 
-def is_safe_plot_code(code: str) -> bool:
+@rastrear("llm.resumo_historico")
+def resumir_historico_llm(resumo_atual, mensagens, openai_config):
     """
-    Verifica se o código gerado pela LLM contém apenas comandos seguros de plotagem.
-    Permite apenas importações de matplotlib, seaborn, plotly e uso do DataFrame 'df'.
-    """
-    # Não permite comandos perigosos
-    forbidden = [
-        r"import\s+os", r"import\s+sys", r"open\(", r"exec\(", r"eval\(",
-        r"subprocess", r"shutil", r"pickle", r"__import__", r"del\s", r"exit\(",
-        r"quit\(", r"input\(", r"write\(", r"remove\(", r"system\("
-    ]
-    for pattern in forbidden:
-        if re.search(pattern, code, re.IGNORECASE):
-            return False
-
-    # Permite apenas imports de libs de plotagem
-    allowed_imports = [
-        r"import\s+matplotlib\.pyplot\s+as\s+plt",
-        r"import\s+seaborn\s+as\s+sns",
-        r"import\s+plotly\.express\s+as\s+px"
-    ]
-    for line in code.splitlines():
-        if line.strip().startswith("import"):
-            if not any(re.match(imp, line.strip()) for imp in allowed_imports):
-                return False
+    Atualiza o resumo da conversa incorporando as mensagens que saíram da janela literal do histórico.
+    """
+    llm = obter_cliente_llm(openai_config, temperature=0)
+    novas = "".join(f"<|{role}|>\n{msg}\n" for role, msg in mensagens)
+    prompt = f"""
+<|system|>
+You maintain a running summary of a conversation between a user and a data analyst assistant.
+Update the summary with the new messages. Keep the facts needed to answer follow-up questions
+(filters, columns, tables and numbers mentioned). Use at most 8 short bullet points.
+
+<|summary|>
+{resumo_atual or "(empty)"}
 
-    # Não permite definições de funções ou classes
-    if re.search(r"def\s+|class\s+", code):
-        return False
+<|new_messages|>
+{novas}
 
-    return True
+<|assistant|>
+"""
+    response = llm.invoke(prompt)
+    return response.content.strip()
+
+def is_safe_plot_code(code: str) -> bool:
+    """
+    Verifica se o código gerado pela LLM contém apenas comandos seguros de plotagem.
+    A análise é feita sobre a AST do código (veja core.chart_renderer.validar_codigo_grafico).
+    """
+    return validar_codigo_grafico(code)[0]
 
 def limpar_codigo_plot(code: str) -> str:
     """
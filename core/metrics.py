@@ -0,0 +1,49 @@
+"""
+Métricas simples em memória, compartilhadas pelo processo.
+
+Cada métrica guarda as últimas observações (por exemplo, tempo até o primeiro token
+de uma resposta em streaming) e pode ser resumida em contagem, média e percentis.
+"""
+
+import threading
+from collections import deque
+
+MAX_OBSERVACOES = 1000
+
+_lock = threading.Lock()
+_metricas = {}
+
+def registrar_metrica(nome, valor):
+    """
+    Registra uma observação da métrica `nome`.
+    """
+    with _lock:
+        _metricas.setdefault(nome, deque(maxlen=MAX_OBSERVACOES)).append(float(valor))
+
+def _percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+def resumo_metricas(prefixo=""):
+    """
+    Retorna {nome: {'n', 'media', 'p50', 'p95', 'max'}} das métricas que começam com `prefixo`.
+    """
+    with _lock:
+        observacoes = {nome: sorted(valores) for nome, valores in _metricas.items() if nome.startswith(prefixo)}
+    return {
+        nome: {
+            "n": len(valores),
+            "media": sum(valores) / len(valores),
+            "p50": _percentil(valores, 0.5),
+            "p95": _percentil(valores, 0.95),
+            "max": valores[-1],
+        }
+        for nome, valores in observacoes.items()
+        if valores
+    }
+
+def limpar_metricas():
+    """
+    Remove todas as observações registradas.
+    """
+    with _lock:
+        _metricas.clear()
@@ -0,0 +1,518 @@
+"""
+Fluxo de processamento de uma mensagem do usuário, compartilhado pelo terminal (main.py)
+e pelo chatbot do Streamlit (webapp/pages/page_chatbot.py).
+
+Modos (PIPELINE_MODE no .env):
+- classic: classificação, geração de SQL e resposta em chamadas separadas à LLM.
+- combined: uma única chamada classifica a mensagem e já devolve o SQL ou a resposta casual.
+
+Cada turno registra o tempo de cada etapa, para comparar os modos, e abre o span 'pipeline.turno'
+(core/tracing.py), pai dos spans das chamadas à LLM e da execução do SQL.
+
+aprocessar_mensagem é a versão assíncrona do fluxo: depois que o SQL é executado, a resposta
+em linguagem natural e o código do gráfico são gerados em paralelo. Corrotinas chamadas a partir
+de código síncrono rodam em um único event loop de fundo (executar_assincrono/agendar_assincrono),
+para que os clientes assíncronos da LLM sejam reaproveitados entre os turnos.
+"""
+
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from config import get_setting
+from core.db_utils import obter_engine, executar_sql, aexecutar_sql, ConsultaCancelada, TAMANHO_LOTE_PADRAO
+from core.llm_utils import (
+    gerar_sql_llm_chat,
+    agerar_sql_llm_chat,
+    extrair_sql_da_resposta,
+    gerar_resposta_natural,
+    agerar_resposta_natural,
+    gerar_resposta_natural_stream,
+    classificar_mensagem,
+    aclassificar_mensagem,
+    classificar_e_gerar_sql,
+    aclassificar_e_gerar_sql,
+    responder_casual_interaction,
+    aresponder_casual_interaction,
+    responder_casual_interaction_stream,
+    agerar_codigo_grafico_llm,
+    reparar_sql_llm,
+    areparar_sql_llm,
+    obter_funcao_embedding,
+    resumir_historico_llm,
+)
+from core.history_utils import criar_gerenciador_historico
+from core.prompt_utils import load_resource
+from core.schema_catalog import obter_catalogo_schema
+from core.schema_retrieval import criar_recuperador_schema
+from core.sql_cache import obter_cache_sql
+from core.result_cache import obter_cache_resultados
+from core.intent_router import criar_roteador_intencao
+from core.chart_planner import planejar_grafico
+from core.sql_validator import validar_sql
+from core.sql_templates import obter_templates_sql
+from core.aggregate_store import obter_cubo_agregados
+from core.metrics import registrar_metrica, resumo_metricas
+from core.tracing import adiar_fim_do_span, configurar_tracing, rastrear
+
+MODO_CLASSICO = "classic"
+MODO_COMBINADO = "combined"
+
+MENSAGEM_NAO_ENTENDIDA = "Desculpe, não pude entender sua mensagem. Por favor, tente novamente."
+MENSAGEM_CANCELADA = "Consulta cancelada."
+
+_loop_fundo = None
+_loop_fundo_lock = threading.Lock()
+
+def _obter_loop_fundo():
+    global _loop_fundo
+    with _loop_fundo_lock:
+        if _loop_fundo is None:
+            _loop_fundo = asyncio.new_event_loop()
+            threading.Thread(target=_loop_fundo.run_forever, name="pipeline-async", daemon=True).start()
+        return _loop_fundo
+
+def agendar_assincrono(corrotina):
+    """
+    Agenda a corrotina no event loop de fundo e retorna um concurrent.futures.Future com o resultado.
+    """
+    return asyncio.run_coroutine_threadsafe(corrotina, _obter_loop_fundo())
+
+def executar_assincrono(corrotina):
+    """
+    Executa a corrotina no event loop de fundo e aguarda o resultado.
+    """
+    return agendar_assincrono(corrotina).result()
+
+def carregar_contexto(config):
+    """
+    Carrega tudo o que o pipeline precisa: engine, schema, recursos, caches e roteador de intenção.
+    O schema vem do catálogo compartilhado pelo processo, que o mantém atualizado em segundo plano.
+    """
+    configurar_tracing(config)
+    engine = obter_engine(config)
+    catalogo = obter_catalogo_schema(config, engine, schema_name="dbo")
+    schema = catalogo.texto()
+    data_dictionary = load_resource("resources/data_dictionary.txt")
+    funcao_embedding = obter_funcao_embedding(config)
+    cache_sql = obter_cache_sql(config, funcao_embedding)
+    cache_resultados = obter_cache_resultados(config)
+    if cache_resultados is not None:
+        # Mudanças de DDL detectadas pelo catálogo invalidam os resultados das tabelas alteradas
+        catalogo.ao_alterar_tabela(cache_resultados.invalidar_tabela)
+    return {
+        "config": config,
+        "engine": engine,
+        "catalogo": catalogo,
+        "schema": schema,
+        "sintax": load_resource("resources/sintax.txt"),
+        "data_dictionary": data_dictionary,
+        "recuperador_schema": criar_recuperador_schema(config, catalogo, data_dictionary, funcao_embedding),
+        "cache_sql": cache_sql,
+        "templates_sql": obter_templates_sql(config, cache_sql),
+        "cubo_agregados": obter_cubo_agregados(config, engine, catalogo),
+        "cache_resultados": cache_resultados,
+        "roteador": criar_roteador_intencao(config, schema, data_dictionary),
+        "modo": get_setting(config, "PIPELINE_MODE", MODO_CLASSICO).strip().lower(),
+    }
+
+def criar_historico(config):
+    """
+    Cria o histórico limitado por tokens de uma sessão. Com HISTORY_SUMMARY_MODE=llm,
+    as mensagens antigas são resumidas pela LLM; caso contrário, por um resumo extrativo local.
+    """
+    resumidor = None
+    if get_setting(config, "HISTORY_SUMMARY_MODE", "extractive").strip().lower() == "llm":
+        resumidor = lambda resumo, mensagens: resumir_historico_llm(resumo, mensagens, config)
+    return criar_gerenciador_historico(config, resumidor=resumidor)
+
+def _opcoes_execucao(config):
+    """
+    Limites da execução protegida do SQL gerado (SQL_MAX_ROWS e SQL_TIMEOUT_SECONDS; 0 desativa)
+    e tamanho dos lotes lidos do banco (SQL_FETCH_CHUNK_SIZE).
+    """
+    return {
+        "max_linhas": get_setting(config, "SQL_MAX_ROWS", 10000, int) or None,
+        "timeout_segundos": get_setting(config, "SQL_TIMEOUT_SECONDS", 60, float) or None,
+        "tamanho_lote": get_setting(config, "SQL_FETCH_CHUNK_SIZE", TAMANHO_LOTE_PADRAO, int),
+    }
+
+def usar_grafico_local(config, df):
+    """
+    Indica se o gráfico do resultado sai de um template local (CHART_TEMPLATES_ENABLED),
+    dispensando a geração do código pela LLM.
+    """
+    return get_setting(config, "CHART_TEMPLATES_ENABLED", True, bool) and planejar_grafico(df) is not None
+
+def _schema(contexto):
+    """
+    Schema atual para os prompts: o do catálogo, se houver, para refletir mudanças de DDL.
+    """
+    catalogo = contexto.get("catalogo")
+    return catalogo.texto() if catalogo is not None else contexto["schema"]
+
+def _validacao(contexto, consulta_sql):
+    catalogo = contexto.get("catalogo")
+    tabelas = catalogo.tabelas if catalogo is not None else None
+    return validar_sql(consulta_sql, tabelas, dialeto=contexto["engine"].dialect.name)
+
+def _aplicar_reparo(contexto, validacao, resposta_reparo):
+    """
+    Valida o SQL devolvido pela chamada de reparo. Se a LLM não devolveu um SELECT, fica a versão anterior.
+    """
+    registrar_metrica("sql.validacao.reparos", 1)
+    try:
+        consulta_reparada = extrair_sql_da_resposta(resposta_reparo)
+    except ValueError:
+        return validacao
+    reparada = _validacao(contexto, consulta_reparada)
+    reparada["correcoes"] = validacao["correcoes"] + ["Consulta corrigida pela LLM"] + reparada["correcoes"]
+    return reparada
+
+def _precisa_reparo(config, validacao):
+    registrar_metrica("sql.validacao.correcoes", len(validacao["correcoes"]))
+    return bool(validacao["erros"]) and get_setting(config, "SQL_REPAIR_ENABLED", True, bool)
+
+def _validar_sql(contexto, consulta_sql, user_message, resultado):
+    """
+    Corrige e valida o SQL localmente antes da execução (SQL_VALIDATION_ENABLED; veja core/sql_validator.py).
+    Se sobrarem erros, faz uma única chamada de reparo à LLM (SQL_REPAIR_ENABLED) com as mensagens
+    exatas. Erros que persistirem não impedem a execução: o banco continua sendo a palavra final.
+    """
+    config = contexto["config"]
+    if not get_setting(config, "SQL_VALIDATION_ENABLED", True, bool):
+        return consulta_sql
+    validacao = _validacao(contexto, consulta_sql)
+    if _precisa_reparo(config, validacao):
+        resposta = reparar_sql_llm(
+            user_message, validacao["sql"], validacao["erros"], _schema(contexto), contexto["sintax"], config
+        )
+        validacao = _aplicar_reparo(contexto, validacao, resposta)
+    resultado["validacao_sql"] = validacao
+    return validacao["sql"]
+
+async def _avalidar_sql(contexto, consulta_sql, user_message, resultado):
+    """
+    Versão assíncrona de _validar_sql.
+    """
+    config = contexto["config"]
+    if not get_setting(config, "SQL_VALIDATION_ENABLED", True, bool):
+        return consulta_sql
+    validacao = _validacao(contexto, consulta_sql)
+    if _precisa_reparo(config, validacao):
+        resposta = await areparar_sql_llm(
+            user_message, validacao["sql"], validacao["erros"], _schema(contexto), contexto["sintax"], config
+        )
+        validacao = _aplicar_reparo(contexto, validacao, resposta)
+    resultado["validacao_sql"] = validacao
+    return validacao["sql"]
+
+def _casar_template(contexto, user_message):
+    """
+    Retorna (template, parâmetros) se a pergunta casa com um template de SQL (core/sql_templates.py), ou None.
+    """
+    templates = contexto.get("templates_sql")
+    return templates.casar(user_message) if templates is not None else None
+
+def _preencher_template(casamento, resultado):
+    """
+    Retorna o SQL do template com os valores (para exibição e para o prompt da resposta),
+    o SQL parametrizado executado no banco e os parâmetros.
+    """
+    template, parametros = casamento
+    resultado["template_sql"] = template.sql
+    registrar_metrica("sql_templates.acertos", 1)
+    return template.sql_preenchido(parametros), template.sql, parametros
+
+def _registrar_consulta(contexto, user_message, consulta_sql, df, history):
+    """
+    Registra a consulta gerada pela LLM no cache de SQL e para a mineração de templates, apenas se
+    ela foi executada com sucesso: SQL que falhou no banco ou foi cancelado não é reaproveitado.
+    """
+    if df is None:
+        return
+    cache = contexto.get("cache_sql")
+    if cache is not None:
+        chave = cache.chave_contexto(
+            _schema(contexto), contexto["sintax"], contexto["data_dictionary"], history, user_message
+        )
+        cache.armazenar(user_message, chave, consulta_sql)
+    templates = contexto.get("templates_sql")
+    if templates is not None:
+        templates.registrar(user_message, consulta_sql)
+
+def _verificar_cancelamento(cancelamento):
+    """
+    Interrompe o turno entre as etapas se a consulta foi cancelada. Uma chamada à LLM já em
+    andamento não é interrompida: o cancelamento vale a partir da etapa seguinte.
+    """
+    if cancelamento is not None and cancelamento.cancelado:
+        raise ConsultaCancelada()
+
+def _medidor(resultado):
+    """
+    Retorna um gerenciador de contexto que grava em resultado['tempos'] a duração de cada etapa.
+    """
+    @contextmanager
+    def medir(etapa):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            resultado["tempos"][etapa] = time.perf_counter() - inicio
+    return medir
+
+def _acompanhar_stream(gerador, resultado, etapa, inicio_turno, concluir_span):
+    """
+    Repassa os trechos do gerador e, ao final, completa os tempos do turno
+    (incluindo 'primeiro_token', medido desde o início do turno), os registra e conclui
+    o span do turno (veja tracing.adiar_fim_do_span).
+    """
+    inicio = time.perf_counter()
+    try:
+        for i, trecho in enumerate(gerador):
+            if i == 0:
+                resultado["tempos"]["primeiro_token"] = time.perf_counter() - inicio_turno
+            yield trecho
+    finally:
+        resultado["tempos"][etapa] = time.perf_counter() - inicio
+        resultado["tempos"]["total"] = time.perf_counter() - inicio_turno
+        _registrar_tempos(resultado["modo"], resultado["tempos"])
+        concluir_span()
+
+@rastrear("pipeline.turno")
+def processar_mensagem(user_message, history, contexto, stream=False, prefetch_grafico=False, cancelamento=None):
+    """
+    Processa a mensagem do usuário (já incluída no final de `history`, uma lista de (role, msg)
+    ou um GerenciadorHistorico) e retorna um dicionário com:
+    'tipo', 'resposta', 'sql', 'df' (DataFrame do resultado, se houver), 'modo' e 'tempos' (segundos por etapa).
+    Quando o SQL é validado (veja _validar_sql), 'validacao_sql' traz as correções aplicadas e os erros restantes.
+    Perguntas que casam com um template de SQL (core/sql_templates.py) não chamam a LLM para classificar
+    nem gerar o SQL; nesse caso 'template_sql' traz a consulta parametrizada executada.
+    Com stream=True, 'resposta' é sempre um iterador de trechos de texto; os tempos do turno
+    (e o span "pipeline.turno") só ficam completos depois que ele é consumido.
+    Com prefetch_grafico=True, o código do gráfico começa a ser gerado em paralelo assim que o SQL
+    retorna dados, e 'codigo_grafico' recebe um concurrent.futures.Future com o texto da LLM
+    (exceto quando o gráfico sai de um template local; veja usar_grafico_local).
+    `cancelamento` (db_utils.Cancelamento) permite interromper a consulta SQL a partir de outra thread;
+    nesse caso 'tipo' continua 'sql_request' e 'resposta' é MENSAGEM_CANCELADA. As etapas seguintes
+    (geração do SQL, execução, resposta e gráfico) não são iniciadas, mas uma chamada à LLM já em
+    andamento termina normalmente e seu resultado é descartado.
+    """
+    config = contexto["config"]
+    modo = contexto.get("modo", MODO_CLASSICO)
+    resultado = {
+        "tipo": None, "resposta": None, "sql": None, "df": None, "codigo_grafico": None, "modo": modo, "tempos": {}
+    }
+    inicio_turno = time.perf_counter()
+    medir = _medidor(resultado)
+
+    try:
+        roteador = contexto.get("roteador")
+        casamento = _casar_template(contexto, user_message)
+        if casamento is not None:
+            tipo_local = "sql_request"
+        else:
+            tipo_local = roteador.decidir(user_message) if roteador is not None else None
+        resposta_sql = None
+        if modo == MODO_COMBINADO and tipo_local is None:
+            with medir("classificacao_e_sql"):
+                combinado = classificar_e_gerar_sql(
+                    user_message, _schema(contexto), config, contexto["sintax"],
+                    contexto["data_dictionary"], history, cache=contexto.get("cache_sql"),
+                    recuperador=contexto.get("recuperador_schema"),
+                )
+            tipo = combinado["tipo"]
+            resposta_sql = combinado["resposta_sql"]
+            resultado["resposta"] = combinado["resposta"]
+        elif tipo_local is not None:
+            tipo = tipo_local
+        else:
+            with medir("classificacao"):
+                tipo = classificar_mensagem(user_message, config, history, roteador=roteador)
+        resultado["tipo"] = tipo
+
+        if tipo == "casual_interaction":
+            if not resultado["resposta"] and stream:
+                gerador = responder_casual_interaction_stream(history, user_message, config)
+                resultado["resposta"] = _acompanhar_stream(
+                    gerador, resultado, "resposta_casual", inicio_turno, adiar_fim_do_span()
+                )
+            elif not resultado["resposta"]:
+                with medir("resposta_casual"):
+                    resultado["resposta"] = responder_casual_interaction(history, user_message, config)
+        elif tipo == "sql_request":
+            if resposta_sql is None and casamento is None and not (cancelamento is not None and cancelamento.cancelado):
+                with medir("geracao_sql"):
+                    resposta_sql = gerar_sql_llm_chat(
+                        user_message, _schema(contexto), config, contexto["sintax"],
+                        contexto["data_dictionary"], history, cache=contexto.get("cache_sql"),
+                        recuperador=contexto.get("recuperador_schema"),
+                    )
+            try:
+                _verificar_cancelamento(cancelamento)
+                if casamento is not None:
+                    consulta_sql, consulta_executada, parametros = _preencher_template(casamento, resultado)
+                else:
+                    with medir("validacao_sql"):
+                        consulta_sql = _validar_sql(
+                            contexto, extrair_sql_da_resposta(resposta_sql), user_message, resultado
+                        )
+                    consulta_executada, parametros = consulta_sql, None
+                _verificar_cancelamento(cancelamento)
+                with medir("execucao_sql"):
+                    resultado["sql"] = consulta_sql
+                    resultado["df"] = executar_sql(
+                        contexto["engine"], consulta_executada, cache=contexto.get("cache_resultados"),
+                        cancelamento=cancelamento, parametros=parametros, cubo=contexto.get("cubo_agregados"),
+                        **_opcoes_execucao(config)
+                    )
+                if casamento is None:
+                    _registrar_consulta(contexto, user_message, consulta_sql, resultado["df"], history)
+                _verificar_cancelamento(cancelamento)
+                if (prefetch_grafico and resultado["df"] is not None and not resultado["df"].empty
+                        and not usar_grafico_local(config, resultado["df"].dropna())):
+                    resultado["codigo_grafico"] = agendar_assincrono(
+                        agerar_codigo_grafico_llm(resultado["df"].dropna(), user_message, config)
+                    )
+                if stream:
+                    gerador = gerar_resposta_natural_stream(
+                        resultado["df"], user_message, consulta_sql, config, history
+                    )
+                    resultado["resposta"] = _acompanhar_stream(
+                        gerador, resultado, "resposta_natural", inicio_turno, adiar_fim_do_span()
+                    )
+                else:
+                    with medir("resposta_natural"):
+                        resultado["resposta"] = gerar_resposta_natural(
+                            resultado["df"], user_message, consulta_sql, config, history
+                        )
+            except ConsultaCancelada:
+                resultado["resposta"] = MENSAGEM_CANCELADA
+            except Exception as e:
+                resultado["resposta"] = f"Desculpe, não pude processar seu pedido. Error: {str(e)}"
+        else:
+            resultado["resposta"] = MENSAGEM_NAO_ENTENDIDA
+    finally:
+        if isinstance(resultado["resposta"], str) or resultado["resposta"] is None:
+            resultado["tempos"]["total"] = time.perf_counter() - inicio_turno
+            _registrar_tempos(modo, resultado["tempos"])
+    if stream and isinstance(resultado["resposta"], str):
+        resultado["resposta"] = iter([resultado["resposta"]])
+    return resultado
+
+@rastrear("pipeline.turno")
+async def aprocessar_mensagem(user_message, history, contexto, prefetch_grafico=False, cancelamento=None):
+    """
+    Versão assíncrona de processar_mensagem. Retorna o mesmo dicionário; com prefetch_grafico=True,
+    a resposta e o código do gráfico são gerados concorrentemente e 'codigo_grafico' recebe o texto da LLM.
+    """
+    config = contexto["config"]
+    modo = contexto.get("modo", MODO_CLASSICO)
+    resultado = {
+        "tipo": None, "resposta": None, "sql": None, "df": None, "codigo_grafico": None, "modo": modo, "tempos": {}
+    }
+    inicio_turno = time.perf_counter()
+    medir = _medidor(resultado)
+
+    try:
+        roteador = contexto.get("roteador")
+        casamento = _casar_template(contexto, user_message)
+        if casamento is not None:
+            tipo_local = "sql_request"
+        else:
+            tipo_local = roteador.decidir(user_message) if roteador is not None else None
+        resposta_sql = None
+        if modo == MODO_COMBINADO and tipo_local is None:
+            with medir("classificacao_e_sql"):
+                combinado = await aclassificar_e_gerar_sql(
+                    user_message, _schema(contexto), config, contexto["sintax"],
+                    contexto["data_dictionary"], history, cache=contexto.get("cache_sql"),
+                    recuperador=contexto.get("recuperador_schema"),
+                )
+            tipo = combinado["tipo"]
+            resposta_sql = combinado["resposta_sql"]
+            resultado["resposta"] = combinado["resposta"]
+        elif tipo_local is not None:
+            tipo = tipo_local
+        else:
+            with medir("classificacao"):
+                tipo = await aclassificar_mensagem(user_message, config, history, roteador=roteador)
+        resultado["tipo"] = tipo
+
+        if tipo == "casual_interaction":
+            if not resultado["resposta"]:
+                with medir("resposta_casual"):
+                    resultado["resposta"] = await aresponder_casual_interaction(history, user_message, config)
+        elif tipo == "sql_request":
+            if resposta_sql is None and casamento is None and not (cancelamento is not None and cancelamento.cancelado):
+                with medir("geracao_sql"):
+                    resposta_sql = await agerar_sql_llm_chat(
+                        user_message, _schema(contexto), config, contexto["sintax"],
+                        contexto["data_dictionary"], history, cache=contexto.get("cache_sql"),
+                        recuperador=contexto.get("recuperador_schema"),
+                    )
+            try:
+                _verificar_cancelamento(cancelamento)
+                if casamento is not None:
+                    consulta_sql, consulta_executada, parametros = _preencher_template(casamento, resultado)
+                else:
+                    with medir("validacao_sql"):
+                        consulta_sql = await _avalidar_sql(
+                            contexto, extrair_sql_da_resposta(resposta_sql), user_message, resultado
+                        )
+                    consulta_executada, parametros = consulta_sql, None
+                _verificar_cancelamento(cancelamento)
+                with medir("execucao_sql"):
+                    resultado["sql"] = consulta_sql
+                    resultado["df"] = await aexecutar_sql(
+                        contexto["engine"], consulta_executada, cache=contexto.get("cache_resultados"),
+                        cancelamento=cancelamento, parametros=parametros, cubo=contexto.get("cubo_agregados"),
+                        **_opcoes_execucao(config)
+                    )
+                if casamento is None:
+                    _registrar_consulta(contexto, user_message, consulta_sql, resultado["df"], history)
+                _verificar_cancelamento(cancelamento)
+                df_resultado = resultado["df"]
+                tarefas = [agerar_resposta_natural(df_resultado, user_message, consulta_sql, config, history)]
+                if (prefetch_grafico and df_resultado is not None and not df_resultado.empty
+                        and not usar_grafico_local(config, df_resultado.dropna())):
+                    tarefas.append(agerar_codigo_grafico_llm(df_resultado.dropna(), user_message, config))
+                with medir("resposta_natural"):
+                    respostas = await asyncio.gather(*tarefas)
+                resultado["resposta"] = respostas[0]
+                if len(respostas) > 1:
+                    resultado["codigo_grafico"] = respostas[1]
+            except ConsultaCancelada:
+                resultado["resposta"] = MENSAGEM_CANCELADA
+            except Exception as e:
+                resultado["resposta"] = f"Desculpe, não pude processar seu pedido. Error: {str(e)}"
+        else:
+            resultado["resposta"] = MENSAGEM_NAO_ENTENDIDA
+    finally:
+        resultado["tempos"]["total"] = time.perf_counter() - inicio_turno
+        _registrar_tempos(modo, resultado["tempos"])
+    return resultado
+
+def _registrar_tempos(modo, tempos):
+    for etapa, segundos in tempos.items():
+        registrar_metrica(f"pipeline.{modo}.{etapa}", segundos)
+
+def obter_estatisticas_pipeline():
+    """
+    Retorna, por modo e etapa, o número de turnos, a média e o p95 dos tempos (em segundos).
+    """
+    resumo = {}
+    for nome, estatisticas in resumo_metricas("pipeline.").items():
+        _, modo, etapa = nome.split(".", 2)
+        resumo.setdefault(modo, {})[etapa] = {
+            "n": estatisticas["n"], "media": estatisticas["media"], "p95": estatisticas["p95"]
+        }
+    return resumo
+
+def formatar_tempos(resultado):
+    """
+    Formata os tempos do turno em uma linha, por exemplo: "classic | classificacao 0.41s | total 2.10s".
+    """
+    partes = [f"{etapa} {segundos:.2f}s" for etapa, segundos in resultado["tempos"].items()]
+    return " | ".join([resultado["modo"]] + partes)
@@ -1,7 +1,41 @@
+import functools
 
 def load_resource(path):
     """
     Responsável por carregar o conteúdo de um arquivo de texto, como o sintax.txt e o data_dictionary.txt
     """
     with open(path, encoding="utf-8") as f:
-        return f.read()
\ No newline at end of file
+        return f.read()
+
+@functools.lru_cache(maxsize=1)
+def _obter_codificador():
+    """
+    Retorna o codificador do tiktoken, ou None se não estiver disponível (por exemplo, sem rede para baixar o vocabulário).
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+def contar_tokens(texto):
+    """
+    Conta os tokens do texto com o tiktoken; sem ele, estima em ~4 caracteres por token.
+    """
+    if not texto:
+        return 0
+    codificador = _obter_codificador()
+    if codificador is not None:
+        return len(codificador.encode(texto))
+    return (len(texto) + 3) // 4
+
+def truncar_para_tokens(texto, max_tokens, sufixo=" [...]"):
+    """
+    Corta o texto para caber em `max_tokens`, acrescentando `sufixo` quando houver corte.
+    """
+    if contar_tokens(texto) <= max_tokens:
+        return texto
+    codificador = _obter_codificador()
+    if codificador is not None:
+        return codificador.decode(codificador.encode(texto)[:max(max_tokens, 0)]) + sufixo
+    return texto[:max(max_tokens, 0) * 4] + sufixo
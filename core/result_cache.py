@@ -0,0 +1,213 @@
+"""
+Cache dos resultados das consultas executadas no banco.
+
+A chave é o SQL canonicalizado (sem comentários, com espaços, caixa das palavras-chave
+e aliases de tabela normalizados). Os DataFrames ficam serializados em Parquet (ou pickle,
+se o pyarrow não estiver instalado), com orçamento de memória e descarte LRU.
+Cada entrada é invalidada por TTL ou quando a versão de uma das tabelas consultadas muda.
+"""
+
+import io
+import re
+import time
+import threading
+from collections import OrderedDict
+import pandas as pd
+from config import get_setting
+from core.sql_utils import PALAVRAS_CHAVE, tokenizar_sql, nome_identificador
+
+def _aliases_de_tabela(tokens):
+    """
+    Retorna {alias: tabela} para as tabelas declaradas após FROM/JOIN com alias
+    e as posições dos AS opcionais que precedem esses aliases.
+    """
+    aliases = {}
+    posicoes_as = set()
+    for i, (tipo, valor, _) in enumerate(tokens):
+        if tipo != "palavra" or valor.lower() not in ("from", "join"):
+            continue
+        j = i + 1
+        partes = []
+        while j < len(tokens) and tokens[j][0] in ("palavra", "literal"):
+            partes.append(tokens[j][1])
+            if j + 1 < len(tokens) and tokens[j + 1][1] == ".":
+                j += 2
+                continue
+            j += 1
+            break
+        if not partes or partes[0].lower() in PALAVRAS_CHAVE:
+            continue
+        posicao_as = None
+        if j < len(tokens) and tokens[j][1].lower() == "as":
+            posicao_as = j
+            j += 1
+        if j < len(tokens) and tokens[j][0] in ("palavra", "literal") and tokens[j][1].lower() not in PALAVRAS_CHAVE:
+            aliases[nome_identificador(tokens[j][1])] = nome_identificador(partes[-1])
+            if posicao_as is not None:
+                posicoes_as.add(posicao_as)
+    return aliases, posicoes_as
+
+def tabelas_referenciadas(sql):
+    """
+    Retorna o conjunto de tabelas (sem schema, em minúsculas) referenciadas após FROM/JOIN.
+    """
+    tokens = tokenizar_sql(sql)
+    tabelas = set()
+    for i, (tipo, valor, _) in enumerate(tokens):
+        if tipo == "palavra" and valor.lower() in ("from", "join"):
+            j = i + 1
+            nome = None
+            while j < len(tokens) and tokens[j][0] in ("palavra", "literal"):
+                nome = tokens[j][1]
+                if j + 1 < len(tokens) and tokens[j + 1][1] == ".":
+                    j += 2
+                    continue
+                break
+            if nome and nome.lower() not in PALAVRAS_CHAVE:
+                tabelas.add(nome_identificador(nome))
+    return tabelas
+
+def canonicalizar_sql(sql):
+    """
+    Retorna a forma canônica do SQL: sem comentários nem ponto e vírgula final, espaços únicos,
+    palavras-chave em maiúsculas e aliases de tabela renomeados para t1, t2, ... na ordem em que aparecem.
+    Literais e nomes de colunas mantêm a grafia original, pois definem os valores e os nomes do resultado.
+    """
+    tokens = tokenizar_sql(sql)
+    while tokens and tokens[-1][1] == ";":
+        tokens.pop()
+    aliases, posicoes_as = _aliases_de_tabela(tokens)
+    novos_nomes = {alias: f"t{i}" for i, alias in enumerate(aliases, start=1)}
+    partes = []
+    for i, (tipo, valor, _) in enumerate(tokens):
+        if i in posicoes_as:
+            continue
+        nome = nome_identificador(valor) if tipo in ("palavra", "literal") else None
+        if nome in novos_nomes and not valor.startswith("'"):
+            partes.append(novos_nomes[nome])
+        elif tipo == "palavra" and valor.lower() in PALAVRAS_CHAVE:
+            partes.append(valor.upper())
+        else:
+            partes.append(valor)
+    canonico = re.sub(r"\s*([.(])\s*", r"\1", " ".join(partes))
+    return re.sub(r"\s+([),])", r"\1", canonico)
+
+def _serializar(df):
+    buffer = io.BytesIO()
+    try:
+        df.to_parquet(buffer, index=True)
+        return "parquet", buffer.getvalue()
+    except Exception:
+        # Sem pyarrow, ou com colunas que o Parquet não representa (objetos mistos)
+        buffer = io.BytesIO()
+        df.to_pickle(buffer)
+        return "pickle", buffer.getvalue()
+
+def _desserializar(formato, dados):
+    buffer = io.BytesIO(dados)
+    if formato == "parquet":
+        return pd.read_parquet(buffer)
+    return pd.read_pickle(buffer)
+
+class CacheResultados:
+    """
+    Cache LRU em memória de DataFrames serializados, limitado por `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, ttl_segundos=900):
+        self.max_bytes = max_bytes
+        self.ttl_segundos = ttl_segundos
+        self.bytes_em_uso = 0
+        self.hits = 0
+        self.misses = 0
+        self._entradas = OrderedDict()
+        self._versoes = {}
+        self._lock = threading.Lock()
+
+    def chave(self, sql, namespace=""):
+        """
+        Retorna a chave do cache para o SQL, isolada por `namespace` (por exemplo, a URL do banco).
+        """
+        return (namespace, canonicalizar_sql(sql))
+
+    def buscar(self, chave):
+        """
+        Retorna uma cópia do DataFrame em cache ou None se não houver entrada válida.
+        """
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None and not self._entrada_valida(entrada):
+                self._remover(chave)
+                entrada = None
+            if entrada is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.hits += 1
+            formato, dados = entrada["formato"], entrada["dados"]
+        return _desserializar(formato, dados)
+
+    def armazenar(self, chave, df, tabelas=None):
+        """
+        Armazena o DataFrame, registrando a versão atual das tabelas de que ele depende.
+        Resultados maiores que o orçamento inteiro não são armazenados.
+        """
+        formato, dados = _serializar(df)
+        if len(dados) > self.max_bytes:
+            return
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+            self._entradas[chave] = {
+                "formato": formato,
+                "dados": dados,
+                "criado_em": time.time(),
+                "versoes": {tabela: self._versoes.get(tabela, 0) for tabela in (tabelas or ())},
+            }
+            self.bytes_em_uso += len(dados)
+            while self.bytes_em_uso > self.max_bytes:
+                self._remover(next(iter(self._entradas)))
+
+    def invalidar_tabela(self, tabela):
+        """
+        Incrementa a versão da tabela, invalidando todos os resultados que dependem dela.
+        """
+        with self._lock:
+            nome = nome_identificador(tabela.split(".")[-1])
+            self._versoes[nome] = self._versoes.get(nome, 0) + 1
+
+    def limpar(self):
+        """
+        Remove todas as entradas do cache.
+        """
+        with self._lock:
+            self._entradas.clear()
+            self.bytes_em_uso = 0
+
+    def _entrada_valida(self, entrada):
+        if self.ttl_segundos and time.time() - entrada["criado_em"] > self.ttl_segundos:
+            return False
+        return all(self._versoes.get(tabela, 0) == versao for tabela, versao in entrada["versoes"].items())
+
+    def _remover(self, chave):
+        entrada = self._entradas.pop(chave)
+        self.bytes_em_uso -= len(entrada["dados"])
+
+_cache_resultados = None
+_cache_resultados_lock = threading.Lock()
+
+def obter_cache_resultados(config):
+    """
+    Retorna o cache de resultados compartilhado pelo processo, configurado a partir do .env.
+    Retorna None se o cache estiver desabilitado (RESULT_CACHE_ENABLED=false).
+    """
+    global _cache_resultados
+    if not get_setting(config, "RESULT_CACHE_ENABLED", True, bool):
+        return None
+    with _cache_resultados_lock:
+        if _cache_resultados is None:
+            _cache_resultados = CacheResultados(
+                max_bytes=int(get_setting(config, "RESULT_CACHE_MAX_MB", 256, float) * 1024 * 1024),
+                ttl_segundos=get_setting(config, "RESULT_CACHE_TTL_SECONDS", 900, int),
+            )
+        return _cache_resultados
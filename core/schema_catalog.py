@@ -0,0 +1,264 @@
+"""
+Catálogo do schema do banco, compartilhado pelo processo.
+
+Em vez de uma chamada ao inspector por tabela, o schema é lido com uma única consulta
+(INFORMATION_SCHEMA, ou sqlite_master + pragma_table_info no SQLite) e salvo em disco junto
+com a versão do DDL. Na próxima inicialização o snapshot é usado imediatamente; uma thread de
+fundo compara a versão do DDL com o banco e relê o catálogo apenas quando ele mudou.
+
+Além do texto usado nos prompts, o catálogo expõe o schema estruturado ({tabela: [(coluna, tipo)]}).
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from sqlalchemy import inspect, text
+from config import get_setting
+
+_CONSULTA_INFORMATION_SCHEMA = """
+SELECT c.TABLE_NAME, c.COLUMN_NAME, c.DATA_TYPE, c.CHARACTER_MAXIMUM_LENGTH, c.NUMERIC_PRECISION, c.NUMERIC_SCALE
+FROM INFORMATION_SCHEMA.COLUMNS c
+JOIN INFORMATION_SCHEMA.TABLES t ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+WHERE t.TABLE_TYPE = 'BASE TABLE' AND c.TABLE_SCHEMA = :schema
+ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION
+"""
+
+_CONSULTA_SQLITE = """
+SELECT m.name, p.name, p.type, NULL, NULL, NULL
+FROM sqlite_master m JOIN pragma_table_info(m.name) p
+WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+ORDER BY m.name, p.cid
+"""
+
+_VERSAO_DDL = {
+    "sqlite": "PRAGMA schema_version",
+    "mssql": (
+        "SELECT COUNT(*), MAX(t.modify_date) FROM sys.tables t "
+        "JOIN sys.schemas s ON s.schema_id = t.schema_id WHERE s.name = :schema"
+    ),
+}
+
+_TIPOS_COM_TAMANHO = {"char", "varchar", "nchar", "nvarchar", "binary", "varbinary", "character varying", "character"}
+_TIPOS_COM_PRECISAO = {"decimal", "numeric"}
+
+def _formatar_tipo(tipo, tamanho, precisao, escala):
+    tipo = (tipo or "").strip()
+    if tipo.lower() in _TIPOS_COM_TAMANHO and tamanho is not None:
+        return f"{tipo.upper()}({'max' if int(tamanho) == -1 else int(tamanho)})"
+    if tipo.lower() in _TIPOS_COM_PRECISAO and precisao is not None:
+        return f"{tipo.upper()}({int(precisao)}, {int(escala or 0)})"
+    return tipo.upper()
+
+def consultar_catalogo(engine, schema_name="dbo"):
+    """
+    Lê todas as tabelas e colunas do schema com uma única consulta.
+    Retorna {tabela: [(coluna, tipo), ...]} na ordem das colunas.
+    """
+    dialeto = engine.dialect.name
+    with engine.connect() as conexao:
+        if dialeto == "sqlite":
+            linhas = conexao.execute(text(_CONSULTA_SQLITE)).fetchall()
+        else:
+            if schema_name is None:
+                schema_name = inspect(conexao).default_schema_name
+            linhas = conexao.execute(text(_CONSULTA_INFORMATION_SCHEMA), {"schema": schema_name}).fetchall()
+    tabelas = {}
+    for tabela, coluna, tipo, tamanho, precisao, escala in linhas:
+        tabelas.setdefault(tabela, []).append((coluna, _formatar_tipo(tipo, tamanho, precisao, escala)))
+    return tabelas
+
+def consultar_versao_ddl(engine, schema_name="dbo"):
+    """
+    Retorna um identificador barato da versão do DDL (PRAGMA schema_version no SQLite,
+    número de tabelas e última modify_date no SQL Server). Nos demais bancos retorna None,
+    e a mudança é detectada pelo fingerprint do catálogo completo.
+    """
+    consulta = _VERSAO_DDL.get(engine.dialect.name)
+    if consulta is None:
+        return None
+    with engine.connect() as conexao:
+        linha = conexao.execute(text(consulta), {"schema": schema_name}).fetchone()
+    return "|".join(str(valor) for valor in linha)
+
+def fingerprint_catalogo(tabelas):
+    """
+    Hash do catálogo estruturado; muda sempre que uma tabela, coluna ou tipo muda.
+    """
+    return hashlib.sha256(json.dumps(tabelas, sort_keys=True).encode("utf-8")).hexdigest()
+
+def formatar_schema(tabelas):
+    """
+    Texto do schema no formato usado nos prompts: "Tabela nome: coluna (TIPO), ...".
+    """
+    return "".join(
+        f"Tabela {tabela}: {', '.join(f'{coluna} ({tipo})' for coluna, tipo in colunas)}\n"
+        for tabela, colunas in tabelas.items()
+    )
+
+class CatalogoSchema:
+    """
+    Schema de um banco, carregado do snapshot em disco (se houver) e mantido atualizado
+    por uma thread de fundo que verifica a versão do DDL a cada `intervalo_verificacao` segundos
+    (0 desativa a verificação).
+    """
+
+    def __init__(self, engine, schema_name="dbo", caminho_snapshot=None, intervalo_verificacao=300):
+        self.engine = engine
+        self.schema_name = schema_name
+        self.caminho_snapshot = caminho_snapshot
+        self.intervalo_verificacao = intervalo_verificacao
+        self.tabelas = {}
+        self.versao_ddl = None
+        self.fingerprint = None
+        self.atualizado_em = None
+        self._texto = ""
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+        self._ouvintes = []
+        self._chave = hashlib.sha256(
+            f"{engine.url.render_as_string(hide_password=True)}|{schema_name}".encode("utf-8")
+        ).hexdigest()
+
+        if not self._carregar_snapshot():
+            self.atualizar()
+        if self.intervalo_verificacao:
+            self._thread = threading.Thread(target=self._verificar_periodicamente, name="schema-catalog", daemon=True)
+            self._thread.start()
+
+    def texto(self):
+        """
+        Retorna o schema formatado para os prompts.
+        """
+        with self._lock:
+            return self._texto
+
+    def ao_alterar_tabela(self, funcao):
+        """
+        Registra uma função `funcao(tabela)` chamada para cada tabela criada, removida ou com colunas
+        alteradas quando o catálogo é relido (por exemplo, CacheResultados.invalidar_tabela).
+        """
+        with self._lock:
+            if funcao not in self._ouvintes:
+                self._ouvintes.append(funcao)
+
+    def atualizar(self, forcar=True):
+        """
+        Relê o catálogo do banco. Com forcar=False, só relê se a versão do DDL mudou.
+        Retorna True se o catálogo foi alterado.
+        """
+        versao_ddl = consultar_versao_ddl(self.engine, self.schema_name)
+        if not forcar and versao_ddl is not None and versao_ddl == self.versao_ddl:
+            return False
+        tabelas = consultar_catalogo(self.engine, self.schema_name)
+        fingerprint = fingerprint_catalogo(tabelas)
+        with self._lock:
+            alterado = fingerprint != self.fingerprint
+            alteradas = {nome for nome in set(tabelas) | set(self.tabelas) if tabelas.get(nome) != self.tabelas.get(nome)}
+            ouvintes = list(self._ouvintes)
+            self.tabelas = tabelas
+            self.versao_ddl = versao_ddl
+            self.fingerprint = fingerprint
+            self.atualizado_em = time.time()
+            self._texto = formatar_schema(tabelas)
+        self._salvar_snapshot()
+        if alterado:
+            self._notificar(ouvintes, alteradas)
+        return alterado
+
+    def _notificar(self, ouvintes, tabelas):
+        for funcao in ouvintes:
+            for tabela in sorted(tabelas):
+                try:
+                    funcao(tabela)
+                except Exception as e:
+                    print("Erro ao notificar a alteração da tabela no catálogo do schema:", str(e))
+
+    def parar(self):
+        """
+        Encerra a thread de verificação.
+        """
+        self._parar.set()
+
+    def _verificar_periodicamente(self):
+        # A primeira verificação é imediata: o snapshot pode estar desatualizado
+        while True:
+            try:
+                self.atualizar(forcar=False)
+            except Exception as e:
+                print("Erro ao atualizar o catálogo do schema:", str(e))
+            if self._parar.wait(self.intervalo_verificacao):
+                return
+
+    def _ler_arquivo(self):
+        if not self.caminho_snapshot or not os.path.exists(self.caminho_snapshot):
+            return {}
+        try:
+            with open(self.caminho_snapshot, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print("Erro ao ler o snapshot do schema:", str(e))
+            return {}
+
+    def _carregar_snapshot(self):
+        snapshot = self._ler_arquivo().get(self._chave)
+        if not snapshot:
+            return False
+        tabelas = {tabela: [tuple(coluna) for coluna in colunas] for tabela, colunas in snapshot["tabelas"].items()}
+        with self._lock:
+            self.tabelas = tabelas
+            self.versao_ddl = snapshot.get("versao_ddl")
+            self.fingerprint = snapshot.get("fingerprint")
+            self.atualizado_em = snapshot.get("atualizado_em")
+            self._texto = formatar_schema(tabelas)
+        return True
+
+    def _salvar_snapshot(self):
+        if not self.caminho_snapshot:
+            return
+        try:
+            dados = self._ler_arquivo()
+            with self._lock:
+                dados[self._chave] = {
+                    "tabelas": self.tabelas,
+                    "versao_ddl": self.versao_ddl,
+                    "fingerprint": self.fingerprint,
+                    "atualizado_em": self.atualizado_em,
+                }
+            os.makedirs(os.path.dirname(self.caminho_snapshot) or ".", exist_ok=True)
+            temporario = f"{self.caminho_snapshot}.{os.getpid()}.tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(dados, f, ensure_ascii=False)
+            os.replace(temporario, self.caminho_snapshot)
+        except OSError as e:
+            print("Erro ao salvar o snapshot do schema:", str(e))
+
+_catalogos = {}
+_catalogos_lock = threading.Lock()
+
+def obter_catalogo_schema(config, engine, schema_name="dbo"):
+    """
+    Retorna o catálogo do schema compartilhado pelo processo para o banco e schema informados,
+    configurado a partir do .env (SCHEMA_CACHE_PATH e SCHEMA_REFRESH_SECONDS).
+    """
+    chave = (engine.url.render_as_string(hide_password=True), schema_name)
+    with _catalogos_lock:
+        if chave not in _catalogos:
+            _catalogos[chave] = CatalogoSchema(
+                engine,
+                schema_name=schema_name,
+                caminho_snapshot=get_setting(config, "SCHEMA_CACHE_PATH", ".cache/schema_catalog.json") or None,
+                intervalo_verificacao=get_setting(config, "SCHEMA_REFRESH_SECONDS", 300, float),
+            )
+        return _catalogos[chave]
+
+def limpar_catalogos():
+    """
+    Encerra e descarta os catálogos compartilhados.
+    """
+    with _catalogos_lock:
+        for catalogo in _catalogos.values():
+            catalogo.parar()
+        _catalogos.clear()
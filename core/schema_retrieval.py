@@ -0,0 +1,297 @@
+"""
+Seleção das partes relevantes do schema e do dicionário de dados para o prompt de SQL.
+
+Cada tabela e cada coluna (junto com a entrada do dicionário de dados correspondente) vira um documento
+de um índice BM25. Para cada pergunta, entram no prompt apenas as tabelas mais relevantes (com as colunas
+mais relevantes, se a tabela for larga) e as entradas do dicionário dessas colunas; entradas que não
+correspondem a nenhuma coluna (observações gerais) são sempre mantidas. Opcionalmente, a pontuação BM25 é combinada com
+a similaridade de embeddings; os vetores dos documentos são calculados uma vez e salvos em disco,
+indexados pelo fingerprint do catálogo.
+
+Schemas pequenos (abaixo de `min_tokens`) vão inteiros: a poda só compensa quando o schema é grande.
+Cada seleção registra as métricas retrieval.tokens_completos, retrieval.tokens_selecionados
+e retrieval.reducao, e pode ser gravada em um log JSONL.
+"""
+
+import os
+import re
+import json
+import math
+import hashlib
+import time
+import threading
+from collections import Counter
+from config import get_setting
+from core.intent_router import normalizar_texto
+from core.metrics import registrar_metrica
+from core.prompt_utils import contar_tokens
+from core.schema_catalog import formatar_schema
+
+_STOPWORDS = {
+    "qual", "quais", "quanto", "quantos", "quantas", "como", "onde", "quando", "que", "por", "para", "com",
+    "sem", "das", "dos", "uma", "um", "de", "da", "do", "em", "no", "na", "nos", "nas", "os", "as", "e", "o", "a",
+    "the", "of", "by", "and", "what", "how", "many", "is", "are", "per", "me", "mostre", "liste",
+}
+
+def termos(texto):
+    """
+    Termos de busca: identificadores quebrados em partes (snake_case e camelCase), sem acentos,
+    em minúsculas e reduzidos a um radical de 6 letras.
+    """
+    texto = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(texto or "")).replace("_", " ")
+    return [
+        palavra[:6]
+        for palavra in normalizar_texto(texto).split()
+        if len(palavra) >= 2 and palavra not in _STOPWORDS
+    ]
+
+class IndiceBM25:
+    """
+    Índice BM25 em memória sobre uma lista de textos.
+    """
+
+    def __init__(self, textos, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.documentos = [Counter(termos(texto)) for texto in textos]
+        self.tamanhos = [sum(doc.values()) for doc in self.documentos]
+        self.tamanho_medio = (sum(self.tamanhos) / len(self.tamanhos)) if self.tamanhos else 0
+        frequencia = Counter(termo for doc in self.documentos for termo in doc)
+        total = len(self.documentos)
+        self.idf = {termo: math.log(1 + (total - n + 0.5) / (n + 0.5)) for termo, n in frequencia.items()}
+
+    def pontuar(self, consulta):
+        """
+        Retorna a pontuação BM25 de cada documento para a consulta.
+        """
+        termos_consulta = set(termos(consulta))
+        pontuacoes = []
+        for doc, tamanho in zip(self.documentos, self.tamanhos):
+            pontuacao = 0.0
+            for termo in termos_consulta:
+                frequencia = doc.get(termo)
+                if not frequencia:
+                    continue
+                normalizacao = self.k1 * (1 - self.b + self.b * tamanho / (self.tamanho_medio or 1))
+                pontuacao += self.idf[termo] * frequencia * (self.k1 + 1) / (frequencia + normalizacao)
+            pontuacoes.append(pontuacao)
+        return pontuacoes
+
+def separar_dicionario(data_dictionary):
+    """
+    Divide o dicionário de dados em entradas (blocos separados por linha em branco).
+    Retorna (cabecalho, {nome: bloco}); o nome é o identificador antes do primeiro ':' do bloco.
+    """
+    cabecalho = ""
+    entradas = {}
+    for bloco in re.split(r"\n\s*\n", data_dictionary or ""):
+        linhas = [linha for linha in bloco.splitlines() if linha.strip()]
+        if linhas and re.fullmatch(r"\s*[\w ]+:\s*", linhas[0]) and len(linhas) > 1:
+            cabecalho = linhas.pop(0).strip()
+        if not linhas:
+            continue
+        match = re.match(r"\s*(\w+)\s*:", linhas[0])
+        nome = match.group(1) if match else linhas[0].strip()
+        entradas[nome] = "\n".join(linhas)
+    return cabecalho, entradas
+
+def _cosseno(a, b):
+    produto = sum(x * y for x, y in zip(a, b))
+    norma = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return produto / norma if norma else 0.0
+
+def _normalizar(pontuacoes):
+    maximo = max(pontuacoes, default=0)
+    return [p / maximo for p in pontuacoes] if maximo > 0 else list(pontuacoes)
+
+class RecuperadorSchema:
+    """
+    Seleciona, para cada pergunta, o trecho do schema e do dicionário de dados enviado no prompt de SQL.
+    `catalogo` é um CatalogoSchema (ou qualquer objeto com `tabelas` e `fingerprint`); o índice é
+    reconstruído quando o fingerprint do catálogo muda.
+    """
+
+    def __init__(self, catalogo, data_dictionary, top_k_tabelas=5, max_colunas=40, min_tokens=1500,
+                 funcao_embedding=None, peso_embedding=0.5, caminho_indice=None, caminho_log=None):
+        self.catalogo = catalogo
+        self.data_dictionary = data_dictionary or ""
+        self.top_k_tabelas = top_k_tabelas
+        self.max_colunas = max_colunas
+        self.min_tokens = min_tokens
+        self.funcao_embedding = funcao_embedding
+        self.peso_embedding = peso_embedding
+        self.caminho_indice = caminho_indice
+        self.caminho_log = caminho_log
+        self._indice = None
+        self._lock = threading.Lock()
+
+    def selecionar(self, pergunta):
+        """
+        Retorna (schema, data_dictionary) reduzidos às partes relevantes para a pergunta.
+        """
+        with self._lock:
+            if self._indice is None or self._indice["fingerprint"] != self.catalogo.fingerprint:
+                self._indice = self._indexar()
+            # Um reindex em outra thread troca o objeto inteiro; esta chamada pontua só contra a cópia
+            indice = self._indice
+        if indice["tokens_completos"] <= self.min_tokens or not indice["tabelas"]:
+            return indice["schema_completo"], self.data_dictionary
+
+        vetor_pergunta = self._embedding_pergunta(pergunta, indice)
+        pontuacao_tabelas = self._pontuar(indice["bm25_tabelas"], indice["vetores_tabelas"], pergunta, vetor_pergunta)
+        if not any(pontuacao_tabelas):
+            # Nenhum termo em comum: melhor mandar o schema inteiro do que adivinhar
+            return indice["schema_completo"], self.data_dictionary
+        pontuacao_colunas = self._pontuar(indice["bm25_colunas"], indice["vetores_colunas"], pergunta, vetor_pergunta)
+
+        nomes_tabelas = list(indice["tabelas"])
+        ordem = sorted(range(len(nomes_tabelas)), key=lambda i: pontuacao_tabelas[i], reverse=True)
+        selecionadas = {}
+        for i in ordem[: self.top_k_tabelas]:
+            if pontuacao_tabelas[i] <= 0:
+                break
+            tabela = nomes_tabelas[i]
+            colunas = indice["tabelas"][tabela]
+            if len(colunas) > self.max_colunas:
+                posicoes = [j for j, (t, _) in enumerate(indice["colunas"]) if t == tabela]
+                relevantes = set(sorted(posicoes, key=lambda j: pontuacao_colunas[j], reverse=True)[: self.max_colunas])
+                colunas = [coluna for j, coluna in zip(posicoes, colunas) if j in relevantes]
+            selecionadas[tabela] = colunas
+
+        nomes_colunas = {coluna.lower() for colunas in selecionadas.values() for coluna, _ in colunas}
+        entradas = [
+            bloco for nome, bloco in indice["entradas"].items()
+            if nome.lower() in nomes_colunas or nome.lower() not in indice["todas_colunas"]
+        ]
+        cabecalho = indice["cabecalho"]
+        schema = formatar_schema(selecionadas)
+        dicionario = "\n\n".join(([cabecalho] if cabecalho and entradas else []) + entradas)
+        self._registrar(pergunta, selecionadas, schema, dicionario, indice["tokens_completos"])
+        return schema, dicionario
+
+    def _indexar(self):
+        """
+        Constrói o índice do catálogo atual. O dicionário retornado não é alterado depois de criado:
+        reindexar cria outro, para que chamadas em andamento continuem vendo uma versão consistente.
+        """
+        fingerprint = self.catalogo.fingerprint
+        tabelas = {tabela: list(colunas) for tabela, colunas in self.catalogo.tabelas.items()}
+        cabecalho, entradas = separar_dicionario(self.data_dictionary)
+        entradas_por_nome = {nome.lower(): bloco for nome, bloco in entradas.items()}
+        colunas = [(tabela, coluna) for tabela, colunas_tabela in tabelas.items() for coluna, _ in colunas_tabela]
+        textos_colunas = [
+            f"{tabela} {coluna} {entradas_por_nome.get(coluna.lower(), '')}" for tabela, coluna in colunas
+        ]
+        textos_tabelas = [
+            f"{tabela} {tabela} " + " ".join(
+                f"{coluna} {entradas_por_nome.get(coluna.lower(), '')}" for coluna, _ in colunas_tabela
+            )
+            for tabela, colunas_tabela in tabelas.items()
+        ]
+        vetores_tabelas, vetores_colunas = self._carregar_vetores(fingerprint, textos_tabelas, textos_colunas)
+        schema_completo = formatar_schema(tabelas)
+        return {
+            "fingerprint": fingerprint,
+            "tabelas": tabelas,
+            "colunas": colunas,
+            "todas_colunas": {coluna.lower() for _, coluna in colunas},
+            "cabecalho": cabecalho,
+            "entradas": entradas,
+            "bm25_tabelas": IndiceBM25(textos_tabelas),
+            "bm25_colunas": IndiceBM25(textos_colunas),
+            "vetores_tabelas": vetores_tabelas,
+            "vetores_colunas": vetores_colunas,
+            "schema_completo": schema_completo,
+            "tokens_completos": contar_tokens(schema_completo) + contar_tokens(self.data_dictionary),
+        }
+
+    def _carregar_vetores(self, fingerprint, textos_tabelas, textos_colunas):
+        """
+        Vetores de embedding dos documentos, lidos do índice em disco ou calculados e salvos nele.
+        """
+        if self.funcao_embedding is None:
+            return None, None
+        indice = {}
+        if self.caminho_indice and os.path.exists(self.caminho_indice):
+            try:
+                with open(self.caminho_indice, "r", encoding="utf-8") as f:
+                    indice = json.load(f)
+            except (OSError, ValueError) as e:
+                print("Erro ao ler o índice de embeddings do schema:", str(e))
+        chave = f"{fingerprint}|{hashlib.sha256(self.data_dictionary.encode('utf-8')).hexdigest()}"
+        if chave not in indice:
+            try:
+                indice = {chave: {
+                    "tabelas": [self.funcao_embedding(texto) for texto in textos_tabelas],
+                    "colunas": [self.funcao_embedding(texto) for texto in textos_colunas],
+                }}
+            except Exception as e:
+                print("Erro ao calcular os embeddings do schema:", str(e))
+                return None, None
+            if self.caminho_indice:
+                try:
+                    os.makedirs(os.path.dirname(self.caminho_indice) or ".", exist_ok=True)
+                    with open(self.caminho_indice, "w", encoding="utf-8") as f:
+                        json.dump(indice, f)
+                except OSError as e:
+                    print("Erro ao salvar o índice de embeddings do schema:", str(e))
+        return indice[chave]["tabelas"], indice[chave]["colunas"]
+
+    def _embedding_pergunta(self, pergunta, indice):
+        if indice["vetores_tabelas"] is None:
+            return None
+        try:
+            return self.funcao_embedding(pergunta)
+        except Exception as e:
+            print("Erro ao calcular o embedding da pergunta:", str(e))
+            return None
+
+    def _pontuar(self, indice, vetores, pergunta, vetor_pergunta):
+        pontuacoes = _normalizar(indice.pontuar(pergunta))
+        if vetores is None or vetor_pergunta is None:
+            return pontuacoes
+        similaridades = [_cosseno(vetor_pergunta, vetor) for vetor in vetores]
+        return [
+            (1 - self.peso_embedding) * p + self.peso_embedding * max(s, 0)
+            for p, s in zip(pontuacoes, similaridades)
+        ]
+
+    def _registrar(self, pergunta, selecionadas, schema, dicionario, tokens_completos):
+        tokens_selecionados = contar_tokens(schema) + contar_tokens(dicionario)
+        reducao = 1 - tokens_selecionados / tokens_completos if tokens_completos else 0
+        registrar_metrica("retrieval.tokens_completos", tokens_completos)
+        registrar_metrica("retrieval.tokens_selecionados", tokens_selecionados)
+        registrar_metrica("retrieval.reducao", reducao)
+        if not self.caminho_log:
+            return
+        registro = {
+            "ts": time.time(),
+            "pergunta": pergunta,
+            "tabelas": {tabela: len(colunas) for tabela, colunas in selecionadas.items()},
+            "tokens_completos": tokens_completos,
+            "tokens_selecionados": tokens_selecionados,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.caminho_log) or ".", exist_ok=True)
+            with self._lock, open(self.caminho_log, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print("Erro ao registrar a seleção do schema:", str(e))
+
+def criar_recuperador_schema(config, catalogo, data_dictionary, funcao_embedding=None):
+    """
+    Cria o recuperador a partir do .env (SCHEMA_RETRIEVAL_*). Retorna None se estiver desabilitado.
+    """
+    if not get_setting(config, "SCHEMA_RETRIEVAL_ENABLED", True, bool):
+        return None
+    usar_embeddings = get_setting(config, "SCHEMA_RETRIEVAL_USE_EMBEDDINGS", False, bool)
+    return RecuperadorSchema(
+        catalogo,
+        data_dictionary,
+        top_k_tabelas=get_setting(config, "SCHEMA_RETRIEVAL_TOP_TABLES", 5, int),
+        max_colunas=get_setting(config, "SCHEMA_RETRIEVAL_MAX_COLUMNS", 40, int),
+        min_tokens=get_setting(config, "SCHEMA_RETRIEVAL_MIN_TOKENS", 1500, int),
+        funcao_embedding=funcao_embedding if usar_embeddings else None,
+        caminho_indice=get_setting(config, "SCHEMA_RETRIEVAL_INDEX_PATH", ".cache/schema_index.json") or None,
+        caminho_log=get_setting(config, "SCHEMA_RETRIEVAL_LOG_PATH", "") or None,
+    )
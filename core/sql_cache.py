@@ -0,0 +1,213 @@
+"""
+Cache de consultas SQL geradas pela LLM.
+
+A chave combina a pergunta normalizada com um fingerprint do contexto (schema, sintaxe,
+dicionário de dados e as últimas perguntas do histórico). Opcionalmente, quando não há
+acerto exato, procura a pergunta mais parecida por similaridade de embeddings.
+As entradas ficam em SQLite (em disco ou em memória), com expiração por TTL e descarte LRU.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import numpy as np
+from config import get_setting
+
+# Operadores viram palavras antes de remover a pontuação: "idade > 30" e "idade < 30" não podem
+# ter a mesma chave no cache nem casar com o mesmo template de SQL
+_OPERADORES = {
+    ">=": "maior_ou_igual", "≥": "maior_ou_igual", "<=": "menor_ou_igual", "≤": "menor_ou_igual",
+    "<>": "diferente_de", "!=": "diferente_de", "≠": "diferente_de", ">": "maior_que", "<": "menor_que",
+    "=": "igual_a", "%": "por_cento",
+}
+_REGEX_OPERADORES = re.compile("|".join(re.escape(op) for op in sorted(_OPERADORES, key=len, reverse=True)))
+
+def normalizar_pergunta(pergunta):
+    """
+    Normaliza a pergunta para comparação exata: minúsculas, sem acentos, operadores de comparação
+    como palavras (veja _OPERADORES), sem pontuação e com espaços simples.
+    """
+    # Antes da decomposição NFKD, que transforma "≠" em "=" seguido de um caractere combinante
+    texto = _REGEX_OPERADORES.sub(lambda match: f" {_OPERADORES[match.group(0)]} ", str(pergunta or ""))
+    texto = unicodedata.normalize("NFKD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return re.sub(r"\s+", " ", texto).strip()
+
+def fingerprint_contexto(schema, sintax, data_dictionary, history=None, user_question=None, turnos_historico=1):
+    """
+    Gera o hash do contexto da pergunta: schema, sintaxe, dicionário de dados e as
+    últimas `turnos_historico` perguntas do usuário anteriores à pergunta atual.
+    """
+    anteriores = list(history or [])
+    if anteriores and user_question is not None and anteriores[-1] == ("user", user_question):
+        anteriores = anteriores[:-1]
+    perguntas_anteriores = [normalizar_pergunta(msg) for role, msg in anteriores if role == "user"]
+    perguntas_anteriores = perguntas_anteriores[-turnos_historico:] if turnos_historico > 0 else []
+    conteudo = json.dumps([schema, sintax, data_dictionary, perguntas_anteriores], ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+class CacheSQL:
+    """
+    Cache de SQL gerado, persistido em SQLite.
+    Use caminho=":memory:" para um cache apenas em memória.
+    """
+
+    def __init__(self, caminho=":memory:", max_entradas=500, ttl_segundos=7 * 24 * 3600,
+                 turnos_historico=1, funcao_embedding=None, limiar_similaridade=0.95):
+        if caminho != ":memory:" and os.path.dirname(caminho):
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        self.caminho = caminho
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self.turnos_historico = turnos_historico
+        self.funcao_embedding = funcao_embedding
+        self.limiar_similaridade = limiar_similaridade
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sql_cache (
+                contexto TEXT NOT NULL,
+                pergunta TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                embedding TEXT,
+                criado_em REAL NOT NULL,
+                ultimo_acesso REAL NOT NULL,
+                PRIMARY KEY (contexto, pergunta)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def chave_contexto(self, schema, sintax, data_dictionary, history=None, user_question=None):
+        """
+        Retorna o fingerprint de contexto usando a janela de histórico configurada no cache.
+        """
+        return fingerprint_contexto(schema, sintax, data_dictionary, history, user_question, self.turnos_historico)
+
+    def buscar(self, pergunta, contexto):
+        """
+        Retorna o SQL em cache para a pergunta e o contexto, ou None se não houver.
+        Tenta primeiro o acerto exato e depois, se configurado, a similaridade por embeddings.
+        """
+        pergunta_norm = normalizar_pergunta(pergunta)
+        agora = time.time()
+        with self._lock:
+            self._remover_expirados(agora)
+            linha = self._conn.execute(
+                "SELECT sql FROM sql_cache WHERE contexto = ? AND pergunta = ?",
+                (contexto, pergunta_norm),
+            ).fetchone()
+        if linha is None and self.funcao_embedding is not None:
+            # O embedding é uma chamada de rede: fica fora do lock para não bloquear as outras sessões
+            linha = self._buscar_similar(pergunta_norm, contexto)
+        with self._lock:
+            if linha is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE sql_cache SET ultimo_acesso = ? WHERE contexto = ? AND sql = ?",
+                (agora, contexto, linha[0]),
+            )
+            self._conn.commit()
+            self.hits += 1
+            return linha[0]
+
+    def armazenar(self, pergunta, contexto, sql):
+        """
+        Armazena o SQL gerado para a pergunta e o contexto, descartando as entradas
+        menos usadas recentemente quando o limite de entradas é atingido.
+        """
+        pergunta_norm = normalizar_pergunta(pergunta)
+        embedding = None
+        if self.funcao_embedding is not None:
+            try:
+                embedding = json.dumps([float(v) for v in self.funcao_embedding(pergunta_norm)])
+            except Exception as e:
+                print("Erro ao gerar embedding para o cache de SQL:", str(e))
+        agora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sql_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (contexto, pergunta_norm, sql, embedding, agora, agora),
+            )
+            excedente = self._conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0] - self.max_entradas
+            if excedente > 0:
+                self._conn.execute(
+                    "DELETE FROM sql_cache WHERE rowid IN "
+                    "(SELECT rowid FROM sql_cache ORDER BY ultimo_acesso ASC LIMIT ?)",
+                    (excedente,),
+                )
+            self._conn.commit()
+
+    def entradas(self):
+        """
+        Retorna a lista de (pergunta normalizada, sql) válidas no cache.
+        """
+        with self._lock:
+            self._remover_expirados(time.time())
+            return self._conn.execute("SELECT pergunta, sql FROM sql_cache").fetchall()
+
+    def limpar(self):
+        """
+        Remove todas as entradas do cache.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM sql_cache")
+            self._conn.commit()
+
+    def _remover_expirados(self, agora):
+        if self.ttl_segundos:
+            self._conn.execute("DELETE FROM sql_cache WHERE criado_em < ?", (agora - self.ttl_segundos,))
+
+    def _buscar_similar(self, pergunta_norm, contexto):
+        with self._lock:
+            candidatos = self._conn.execute(
+                "SELECT sql, embedding FROM sql_cache WHERE contexto = ? AND embedding IS NOT NULL",
+                (contexto,),
+            ).fetchall()
+        if not candidatos:
+            return None
+        try:
+            consulta = np.asarray(self.funcao_embedding(pergunta_norm), dtype=float)
+        except Exception as e:
+            print("Erro ao gerar embedding para o cache de SQL:", str(e))
+            return None
+        matriz = np.asarray([json.loads(emb) for _, emb in candidatos], dtype=float)
+        normas = np.linalg.norm(matriz, axis=1) * np.linalg.norm(consulta)
+        similaridades = np.divide(matriz @ consulta, normas, out=np.zeros(len(candidatos)), where=normas > 0)
+        melhor = int(np.argmax(similaridades))
+        if similaridades[melhor] >= self.limiar_similaridade:
+            return (candidatos[melhor][0],)
+        return None
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def obter_cache_sql(config, funcao_embedding=None):
+    """
+    Retorna o cache de SQL compartilhado pelo processo, configurado a partir do .env.
+    Retorna None se o cache estiver desabilitado (SQL_CACHE_ENABLED=false).
+    """
+    if not get_setting(config, "SQL_CACHE_ENABLED", True, bool):
+        return None
+    caminho = get_setting(config, "SQL_CACHE_PATH", os.path.join(".cache", "sql_cache.sqlite3"))
+    with _caches_lock:
+        if caminho not in _caches:
+            _caches[caminho] = CacheSQL(
+                caminho=caminho,
+                max_entradas=get_setting(config, "SQL_CACHE_MAX_ENTRIES", 500, int),
+                ttl_segundos=get_setting(config, "SQL_CACHE_TTL_SECONDS", 7 * 24 * 3600, int),
+                turnos_historico=get_setting(config, "SQL_CACHE_HISTORY_TURNS", 1, int),
+                funcao_embedding=funcao_embedding,
+                limiar_similaridade=get_setting(config, "SQL_CACHE_SIMILARITY_THRESHOLD", 0.95, float),
+            )
+        return _caches[caminho]
@@ -0,0 +1,243 @@
+"""
+Templates de SQL parametrizados, minerados do cache de SQL (core/sql_cache.py) e das consultas
+geradas na sessão.
+
+Muitas perguntas são a mesma consulta com outro parâmetro ("quantos clientes inadimplentes em SP",
+"... em RJ"). minerar_templates procura, em cada par (pergunta, SQL), as palavras da pergunta que
+aparecem no SQL como literal (texto entre aspas simples ou número) e as troca por slots: na pergunta
+por um grupo da expressão regular, no SQL por um parâmetro nomeado (:p0, :p1...). Formatos que se
+repetem com valores diferentes viram templates.
+
+Uma pergunta que casa com um template é respondida sem chamada à LLM para classificar nem gerar o SQL:
+os slots são extraídos localmente e a consulta roda com text() e parâmetros ligados
+(db_utils.executar_sql(parametros=...)), o que também permite ao banco reaproveitar o plano.
+Slots de texto só aceitam valores já vistos na mineração: "quantos clientes inadimplentes em janeiro"
+não casa com o template de "... em SP/RJ" (rodaria VAR5 = 'JANEIRO'); a pergunta vai para a LLM e,
+depois de executada, o novo valor entra no template na próxima mineração.
+
+Só são minerados pares cujo SQL foi executado com sucesso: o cache de SQL só recebe consultas depois
+da execução (veja pipeline._registrar_consulta), assim como os pares registrados na sessão.
+"""
+
+import re
+import time
+import threading
+from collections import deque, defaultdict
+from config import get_setting
+from core.sql_cache import normalizar_pergunta
+from core.sql_utils import tokenizar_sql
+from core.metrics import registrar_metrica
+
+MIN_PALAVRAS_FIXAS = 3
+MAX_PARES_SESSAO = 500
+
+_MARCADOR_SLOT = "\x00{}\x00"
+
+# Operadores (já como palavras, veja sql_cache.normalizar_pergunta) e negações ficam sempre fixos no
+# formato: "idade > 30" e "idade < 50" não podem casar com o mesmo template
+PALAVRAS_FIXAS = set(normalizar_pergunta("> < >= <= <> = %").split()) | {
+    "nao", "sem", "exceto", "menos", "mais", "maior", "menor", "acima", "abaixo", "antes", "depois", "entre",
+}
+
+def _literal(tipo, valor):
+    """
+    Valor de um token literal do SQL (texto entre aspas simples ou número), ou None.
+    """
+    if tipo == "literal" and valor.startswith("'"):
+        return valor[1:-1].replace("''", "'")
+    if tipo == "numero":
+        return valor
+    return None
+
+def extrair_formato(pergunta, sql):
+    """
+    Separa o par (pergunta, SQL) em formato e parâmetros. Retorna (palavras da pergunta com
+    marcadores de slot, SQL com parâmetros nomeados, [(tipo, valor no SQL)]) ou None quando
+    nenhuma palavra da pergunta aparece como literal no SQL ou a correspondência é ambígua.
+    """
+    palavras = normalizar_pergunta(pergunta).split()
+    tokens = tokenizar_sql(sql)
+    slots = {}
+    substituicoes = []
+    for i, (tipo, valor, inicio) in enumerate(tokens):
+        literal = _literal(tipo, valor)
+        if literal is None:
+            continue
+        anteriores = [t[1].lower() for t in tokens[max(i - 2, 0):i]]
+        # O número de linhas de TOP/LIMIT fica fixo: não é um parâmetro da pergunta
+        if tipo == "numero" and anteriores and (anteriores[-1] in ("top", "limit") or anteriores == ["top", "("]):
+            continue
+        palavra = normalizar_pergunta(literal)
+        # Valores com acentos, pontuação ou várias palavras não podem ser reconstruídos da pergunta normalizada
+        if palavra != literal.lower() or palavras.count(palavra) != 1 or palavra in PALAVRAS_FIXAS:
+            continue
+        if palavra in slots and slots[palavra][1] != literal:
+            return None
+        slots.setdefault(palavra, ("numero" if tipo == "numero" else "texto", literal))
+        substituicoes.append((inicio, inicio + len(valor), palavra))
+    if not slots:
+        return None
+    nomes = {palavra: f"p{n}" for n, palavra in enumerate(sorted(slots, key=palavras.index))}
+    sql_template = sql
+    for inicio, fim, palavra in sorted(substituicoes, reverse=True):
+        sql_template = sql_template[:inicio] + f":{nomes[palavra]}" + sql_template[fim:]
+    formato = tuple(_MARCADOR_SLOT.format(nomes[p]) if p in nomes else p for p in palavras)
+    return formato, sql_template.strip().rstrip(";").strip(), [slots[p] for p in sorted(slots, key=palavras.index)]
+
+class TemplateSQL:
+    """
+    Consulta parametrizada e o extrator de slots da pergunta correspondente.
+    """
+
+    def __init__(self, formato, sql, exemplos):
+        self.formato = formato
+        self.sql = sql
+        self.ocorrencias = len(exemplos)
+        self.slots = []
+        partes = []
+        for palavra in formato:
+            if palavra.startswith("\x00"):
+                indice = len(self.slots)
+                tipos = {exemplo[indice][0] for exemplo in exemplos}
+                self.slots.append({
+                    "nome": palavra.strip("\x00"),
+                    "tipo": tipos.pop() if len(tipos) == 1 else "texto",
+                    # Valor na pergunta normalizada -> valor no SQL (com a caixa original)
+                    "valores": {exemplo[indice][1].lower(): exemplo[indice][1] for exemplo in exemplos},
+                })
+                partes.append(r"(\S+)")
+            else:
+                partes.append(re.escape(palavra))
+        self._regex = re.compile(" ".join(partes))
+
+    def casar(self, pergunta):
+        """
+        Extrai os slots da pergunta. Retorna o dicionário de parâmetros ou None se ela não casa com o
+        template ou se um slot de texto traz um valor que não apareceu nos exemplos minerados.
+        """
+        match = self._regex.fullmatch(normalizar_pergunta(pergunta))
+        if match is None:
+            return None
+        parametros = {}
+        for slot, valor in zip(self.slots, match.groups()):
+            if slot["tipo"] == "numero":
+                if not valor.isdigit():
+                    return None
+                parametros[slot["nome"]] = int(valor)
+                continue
+            if valor not in slot["valores"]:
+                return None
+            parametros[slot["nome"]] = slot["valores"][valor]
+        return parametros
+
+    def sql_preenchido(self, parametros):
+        """
+        SQL com os valores no lugar dos parâmetros, para exibição e para o prompt da resposta.
+        """
+        def literal(match):
+            valor = parametros[match.group(1)]
+            return str(valor) if isinstance(valor, int) else "'" + str(valor).replace("'", "''") + "'"
+        return re.sub(r":(p\d+)\b", literal, self.sql)
+
+def minerar_templates(pares, min_ocorrencias=2):
+    """
+    Agrupa os pares (pergunta, SQL) por formato e retorna os templates dos formatos que aparecem
+    em pelo menos `min_ocorrencias` pares com valores diferentes. Formatos de pergunta com mais de
+    um SQL possível e perguntas com menos de MIN_PALAVRAS_FIXAS palavras fora dos slots (em geral
+    continuações que dependem do histórico, como "e em RJ?") são descartados.
+    """
+    grupos = defaultdict(lambda: defaultdict(list))
+    for pergunta, sql in pares:
+        resultado = extrair_formato(pergunta, sql)
+        if resultado is None:
+            continue
+        formato, sql_template, valores = resultado
+        grupos[formato][sql_template].append(valores)
+    templates = []
+    for formato, por_sql in grupos.items():
+        if len(por_sql) != 1 or sum(not p.startswith("\x00") for p in formato) < MIN_PALAVRAS_FIXAS:
+            continue
+        sql_template, exemplos = next(iter(por_sql.items()))
+        distintos = {tuple(valor for _, valor in exemplo) for exemplo in exemplos}
+        if len(exemplos) >= min_ocorrencias and len(distintos) >= 2:
+            templates.append(TemplateSQL(formato, sql_template, exemplos))
+    return sorted(templates, key=lambda t: -t.ocorrencias)
+
+class BibliotecaTemplatesSQL:
+    """
+    Templates minerados do cache de SQL e dos pares (pergunta, SQL) registrados na sessão,
+    reminerados sob demanda a cada `intervalo_atualizacao` segundos.
+    """
+
+    def __init__(self, cache_sql=None, min_ocorrencias=2, intervalo_atualizacao=300):
+        self.cache_sql = cache_sql
+        self.min_ocorrencias = min_ocorrencias
+        self.intervalo_atualizacao = intervalo_atualizacao
+        self.templates = []
+        self.hits = 0
+        self.misses = 0
+        self._pares_sessao = deque(maxlen=MAX_PARES_SESSAO)
+        self._ultima_atualizacao = None
+        self._lock = threading.Lock()
+
+    def registrar(self, pergunta, sql):
+        """
+        Registra uma consulta gerada pela LLM. Chame só depois que ela for executada com sucesso.
+        """
+        with self._lock:
+            self._pares_sessao.append((pergunta, sql))
+
+    def atualizar(self):
+        """
+        Minera os templates de novo a partir do cache de SQL e dos pares da sessão.
+        """
+        pares = list(self.cache_sql.entradas()) if self.cache_sql is not None else []
+        with self._lock:
+            pares += list(self._pares_sessao)
+        templates = minerar_templates(pares, self.min_ocorrencias)
+        with self._lock:
+            self.templates = templates
+            self._ultima_atualizacao = time.monotonic()
+        registrar_metrica("sql_templates.quantidade", len(templates))
+
+    def casar(self, pergunta):
+        """
+        Retorna (template, parâmetros) do primeiro template que casa com a pergunta, ou None.
+        """
+        if (self._ultima_atualizacao is None
+                or time.monotonic() - self._ultima_atualizacao >= self.intervalo_atualizacao):
+            self.atualizar()
+        for template in self.templates:
+            parametros = template.casar(pergunta)
+            if parametros is not None:
+                self.hits += 1
+                return template, parametros
+        self.misses += 1
+        return None
+
+_bibliotecas = {}
+_bibliotecas_lock = threading.Lock()
+
+def obter_templates_sql(config, cache_sql=None):
+    """
+    Retorna a biblioteca de templates compartilhada pelo processo, ou None se
+    SQL_TEMPLATES_ENABLED=false.
+    """
+    if not get_setting(config, "SQL_TEMPLATES_ENABLED", True, bool):
+        return None
+    with _bibliotecas_lock:
+        chave = id(cache_sql)
+        if chave not in _bibliotecas:
+            _bibliotecas[chave] = BibliotecaTemplatesSQL(
+                cache_sql=cache_sql,
+                min_ocorrencias=get_setting(config, "SQL_TEMPLATES_MIN_OCCURRENCES", 2, int),
+                intervalo_atualizacao=get_setting(config, "SQL_TEMPLATES_REFRESH_SECONDS", 300, float),
+            )
+        return _bibliotecas[chave]
+
+def limpar_templates_sql():
+    """
+    Descarta as bibliotecas de templates compartilhadas.
+    """
+    with _bibliotecas_lock:
+        _bibliotecas.clear()
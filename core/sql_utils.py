@@ -0,0 +1,121 @@
+"""
+Utilitários de análise léxica de SQL, compartilhados pelos caches e pela execução protegida.
+
+O tokenizador é propositalmente simples (sem parser completo): reconhece comentários, literais,
+identificadores entre colchetes/aspas, palavras, números e símbolos, o suficiente para
+canonicalizar consultas e localizar as cláusulas de nível superior (SELECT, TOP, LIMIT, UNION...).
+"""
+
+import re
+
+PALAVRAS_CHAVE = {
+    "select", "distinct", "top", "percent", "from", "where", "and", "or", "not", "in", "is", "null",
+    "like", "between", "exists", "join", "inner", "left", "right", "full", "outer", "cross", "on",
+    "group", "by", "order", "asc", "desc", "having", "as", "union", "all", "case", "when", "then",
+    "else", "end", "with", "nolock", "offset", "rows", "fetch", "next", "only", "limit", "over",
+    "partition", "cast", "try_cast", "convert", "try_convert", "count", "sum", "avg", "min", "max",
+    "isnull", "coalesce", "iif", "round", "len", "upper", "lower", "getdate", "year", "month", "day",
+}
+
+DIALETO_MSSQL = "mssql"
+
+_REGEX_TOKENS = re.compile(
+    r"(?P<comentario>--[^\n]*|/\*.*?\*/)"
+    r"|(?P<literal>'(?:[^']|'')*'|\[[^\]]*\]|\"[^\"]*\")"
+    r"|(?P<palavra>[A-Za-z_@#][\w@#$]*)"
+    r"|(?P<numero>\d+(?:\.\d+)?)"
+    r"|(?P<espaco>\s+)"
+    r"|(?P<outro>.)",
+    re.DOTALL,
+)
+
+def tokenizar_sql(sql):
+    """
+    Retorna a lista de tokens (tipo, valor, posição inicial) do SQL, sem comentários nem espaços.
+    """
+    tokens = []
+    for match in _REGEX_TOKENS.finditer(sql):
+        tipo = match.lastgroup
+        if tipo in ("comentario", "espaco"):
+            continue
+        tokens.append((tipo, match.group(), match.start()))
+    return tokens
+
+def nome_identificador(token):
+    return token.strip('[]"').lower()
+
+def _nivel_superior(tokens):
+    """
+    Retorna os índices dos tokens que estão fora de parênteses.
+    """
+    nivel = 0
+    indices = []
+    for i, (_, valor, _) in enumerate(tokens):
+        if valor == "(":
+            nivel += 1
+        elif valor == ")":
+            nivel = max(nivel - 1, 0)
+        elif nivel == 0:
+            indices.append(i)
+    return indices
+
+def dialeto_da_sintaxe(sintax):
+    """
+    Identifica o dialeto descrito em resources/sintax.txt ("mssql" para T-SQL/SQL Server).
+    """
+    texto = (sintax or "").lower()
+    if "t-sql" in texto or "transact-sql" in texto or "sql server" in texto:
+        return DIALETO_MSSQL
+    return None
+
+def aplicar_limite_linhas(sql, limite, dialeto=DIALETO_MSSQL):
+    """
+    Limita no servidor o número de linhas da consulta, respeitando o dialeto:
+    - mssql: injeta TOP (limite) no SELECT principal, ou reduz um TOP maior já existente;
+    - demais: acrescenta LIMIT limite, ou reduz um LIMIT maior já existente.
+    Consultas em que o limite não pode ser aplicado com segurança (UNION/INTERSECT/EXCEPT,
+    OFFSET-FETCH, TOP PERCENT, limites parametrizados) são devolvidas sem alteração;
+    nesses casos vale apenas o limite aplicado na leitura das linhas.
+    """
+    tokens = tokenizar_sql(sql)
+    while tokens and tokens[-1][1] == ";":
+        tokens.pop()
+    if not tokens:
+        return sql
+    fim = tokens[-1][2] + len(tokens[-1][1])
+    superiores = _nivel_superior(tokens)
+    palavras = {tokens[i][1].lower(): i for i in reversed(superiores) if tokens[i][0] == "palavra"}
+    if palavras.keys() & {"union", "intersect", "except", "offset", "fetch", "into"}:
+        return sql
+    if "select" not in palavras:
+        return sql
+
+    if dialeto == DIALETO_MSSQL:
+        i = palavras["select"] + 1
+        if i < len(tokens) and tokens[i][1].lower() in ("distinct", "all"):
+            i += 1
+        if i < len(tokens) and tokens[i][1].lower() == "top":
+            return _reduzir_limite_existente(sql, tokens, i + 1, limite, fim)
+        posicao = tokens[i - 1][2] + len(tokens[i - 1][1])
+        return f"{sql[:posicao]} TOP ({limite}){sql[posicao:fim]}"
+
+    if "limit" in palavras:
+        indice_limit = max(i for i in superiores if tokens[i][1].lower() == "limit")
+        return _reduzir_limite_existente(sql, tokens, indice_limit + 1, limite, fim)
+    return f"{sql[:fim]} LIMIT {limite}"
+
+def _reduzir_limite_existente(sql, tokens, i, limite, fim):
+    """
+    Substitui o valor de um TOP/LIMIT existente (com ou sem parênteses) por `limite`, se for maior.
+    """
+    com_parenteses = i < len(tokens) and tokens[i][1] == "("
+    indice_valor = i + 1 if com_parenteses else i
+    if indice_valor >= len(tokens) or tokens[indice_valor][0] != "numero" or "." in tokens[indice_valor][1]:
+        return sql
+    seguinte = tokens[indice_valor + 1][1].lower() if indice_valor + 1 < len(tokens) else ""
+    if seguinte == "percent" or (com_parenteses and seguinte != ")"):
+        return sql
+    if int(tokens[indice_valor][1]) <= limite:
+        return sql[:fim]
+    _, valor, inicio = tokens[indice_valor]
+    return f"{sql[:inicio]}{limite}{sql[inicio + len(valor):fim]}"
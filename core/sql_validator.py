@@ -0,0 +1,177 @@
+"""
+Validação local do SQL gerado pela LLM, antes de ir ao banco.
+
+1. Correções automáticas de dialeto no T-SQL (resources/sintax.txt): LIMIT N vira TOP (N),
+   identificadores entre aspas duplas viram colchetes e funções de outros dialetos
+   (LENGTH, IFNULL, SUBSTR, NOW) são trocadas pelas equivalentes.
+2. Análise sintática com o sqlglot (dialeto tsql), se estiver instalado.
+3. Conferência de tabelas e colunas com o catálogo do schema ({tabela: [(coluna, tipo)]}):
+   pela árvore do sqlglot ou, sem ele, por uma análise léxica conservadora.
+
+O resultado traz o SQL corrigido, as correções aplicadas e os erros que sobraram; com erros,
+o pipeline faz uma única chamada de reparo à LLM com as mensagens exatas.
+"""
+
+from core.sql_utils import PALAVRAS_CHAVE, DIALETO_MSSQL, tokenizar_sql, nome_identificador, aplicar_limite_linhas, _nivel_superior
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:
+    sqlglot = None
+
+_FUNCOES_EQUIVALENTES = {"length": "LEN", "ifnull": "ISNULL", "substr": "SUBSTRING", "now": "GETDATE"}
+
+# Palavras que aparecem como identificadores soltos no T-SQL sem serem colunas
+_PALAVRAS_NAO_COLUNA = PALAVRAS_CHAVE | {
+    "ties", "nulls", "first", "last", "top", "set", "values", "into", "intersect", "except", "row", "current",
+    "preceding", "following", "unbounded", "range", "within", "collate", "escape", "some", "any",
+    "int", "bigint", "smallint", "tinyint", "bit", "decimal", "numeric", "float", "real", "date", "datetime",
+    "datetime2", "smalldatetime", "time", "char", "varchar", "nchar", "nvarchar", "text", "money", "max",
+    "quarter", "dayofyear", "week", "weekday", "hour", "minute", "second", "yy", "yyyy", "qq", "mm", "dd",
+    "wk", "ww", "dw", "hh", "mi", "ss",
+}
+
+def _aplicar_substituicoes(sql, substituicoes):
+    for inicio, fim, texto in sorted(substituicoes, reverse=True):
+        sql = sql[:inicio] + texto + sql[fim:]
+    return sql
+
+def corrigir_dialeto(sql, dialeto=DIALETO_MSSQL):
+    """
+    Aplica as correções triviais de dialeto. Retorna (sql, [descrições das correções]).
+    """
+    if dialeto != DIALETO_MSSQL:
+        return sql, []
+    tokens = tokenizar_sql(sql)
+    correcoes = []
+    substituicoes = []
+    for i, (tipo, valor, inicio) in enumerate(tokens):
+        seguinte = tokens[i + 1][1] if i + 1 < len(tokens) else ""
+        if tipo == "literal" and valor.startswith('"'):
+            substituicoes.append((inicio, inicio + len(valor), f"[{valor[1:-1]}]"))
+            correcoes.append(f'Identificador {valor} trocado por [{valor[1:-1]}]')
+        elif tipo == "palavra" and seguinte == "(" and valor.lower() in _FUNCOES_EQUIVALENTES:
+            substituicoes.append((inicio, inicio + len(valor), _FUNCOES_EQUIVALENTES[valor.lower()]))
+            correcoes.append(f"Função {valor.upper()} trocada por {_FUNCOES_EQUIVALENTES[valor.lower()]}")
+    sql = _aplicar_substituicoes(sql, substituicoes)
+    return _trocar_limit_por_top(sql, correcoes)
+
+def _trocar_limit_por_top(sql, correcoes):
+    tokens = tokenizar_sql(sql)
+    while tokens and tokens[-1][1] == ";":
+        tokens.pop()
+    superiores = _nivel_superior(tokens)
+    indices_limit = [i for i in superiores if tokens[i][0] == "palavra" and tokens[i][1].lower() == "limit"]
+    if not indices_limit:
+        return sql, correcoes
+    i = indices_limit[-1]
+    # Apenas "LIMIT N" no fim da consulta; LIMIT com OFFSET ou parâmetros não é uma correção trivial
+    if i + 2 != len(tokens) or tokens[i + 1][0] != "numero" or "." in tokens[i + 1][1]:
+        return sql, correcoes
+    palavras = {tokens[j][1].lower() for j in superiores if tokens[j][0] == "palavra"}
+    if "top" in palavras:
+        return sql, correcoes
+    limite = int(tokens[i + 1][1])
+    sem_limit = sql[:tokens[i][2]].rstrip()
+    corrigido = aplicar_limite_linhas(sem_limit, limite, DIALETO_MSSQL)
+    if corrigido == sem_limit:
+        return sql, correcoes
+    correcoes.append(f"LIMIT {limite} trocado por TOP ({limite})")
+    return corrigido, correcoes
+
+def _indice_catalogo(tabelas):
+    return {nome.lower(): {coluna.lower() for coluna, _ in colunas} for nome, colunas in tabelas.items()}
+
+def _conferir_com_sqlglot(sql, catalogo, dialeto):
+    try:
+        arvore = sqlglot.parse_one(sql, read="tsql" if dialeto == DIALETO_MSSQL else None)
+    except sqlglot.errors.ParseError as e:
+        detalhe = e.errors[0] if e.errors else {}
+        return [f"Erro de sintaxe: {detalhe.get('description', str(e))} "
+                f"(linha {detalhe.get('line', '?')}, coluna {detalhe.get('col', '?')})"]
+    if not catalogo:
+        return []
+    ctes = {cte.alias_or_name.lower() for cte in arvore.find_all(exp.CTE)}
+    apelidos_colunas = {alias.alias.lower() for alias in arvore.find_all(exp.Alias) if alias.alias}
+    derivadas = {sub.alias.lower() for sub in arvore.find_all(exp.Subquery) if sub.alias}
+    erros = []
+    tabelas_consulta = {}
+    for tabela in arvore.find_all(exp.Table):
+        nome = tabela.name.lower()
+        if nome in ctes:
+            continue
+        if nome not in catalogo:
+            erros.append(f"Tabela inexistente: {tabela.name}")
+            derivadas.add(nome)
+            continue
+        tabelas_consulta[nome] = nome
+        if tabela.alias:
+            tabelas_consulta[tabela.alias.lower()] = nome
+    colunas_consultadas = set().union(*(catalogo[nome] for nome in set(tabelas_consulta.values()))) if tabelas_consulta else set()
+    for coluna in arvore.find_all(exp.Column):
+        nome = coluna.name.lower()
+        if not nome or isinstance(coluna.this, exp.Star):
+            continue
+        qualificador = coluna.table.lower()
+        if qualificador:
+            if qualificador in tabelas_consulta and nome not in catalogo[tabelas_consulta[qualificador]]:
+                erros.append(f"Coluna inexistente: {coluna.table}.{coluna.name}")
+        elif nome not in colunas_consultadas and nome not in apelidos_colunas and not (ctes or derivadas):
+            erros.append(f"Coluna inexistente: {coluna.name}")
+    return _sem_repeticoes(erros)
+
+def _conferir_por_tokens(sql, catalogo):
+    """
+    Conferência sem o sqlglot: tabelas após FROM/JOIN e identificadores soltos que não são
+    palavras-chave, funções, qualificadores, apelidos nem nomes de CTE.
+    """
+    tokens = tokenizar_sql(sql)
+    declarados = set()
+    tabelas_consulta = set()
+    for i, (tipo, valor, _) in enumerate(tokens):
+        anterior = tokens[i - 1][1].lower() if i else ""
+        if tipo not in ("palavra", "literal") or valor.startswith("'"):
+            continue
+        nome = nome_identificador(valor)
+        seguinte = tokens[i + 1][1].lower() if i + 1 < len(tokens) else ""
+        if anterior == "as" or seguinte == "as" and i + 2 < len(tokens) and tokens[i + 2][1] == "(":
+            declarados.add(nome)
+        if anterior in ("from", "join", "."):
+            if anterior != "." and seguinte != ".":
+                tabelas_consulta.add(nome)
+            # Apelido da tabela logo após o nome (FROM credito c)
+            if i + 1 < len(tokens) and tokens[i + 1][0] in ("palavra", "literal") and seguinte not in _PALAVRAS_NAO_COLUNA:
+                declarados.add(nome_identificador(tokens[i + 1][1]))
+    erros = [f"Tabela inexistente: {tabela}" for tabela in sorted(tabelas_consulta - set(catalogo) - declarados)]
+    colunas = set().union(*catalogo.values())
+    for i, (tipo, valor, _) in enumerate(tokens):
+        if tipo not in ("palavra", "literal") or valor.startswith(("'", "@", "#")):
+            continue
+        nome = nome_identificador(valor)
+        anterior = tokens[i - 1][1] if i else ""
+        seguinte = tokens[i + 1][1] if i + 1 < len(tokens) else ""
+        if (tipo == "palavra" and nome in _PALAVRAS_NAO_COLUNA) or seguinte in ("(", ".") or anterior.lower() == "as":
+            continue
+        if nome in declarados or nome in catalogo or nome in tabelas_consulta or nome in colunas:
+            continue
+        erros.append(f"Coluna inexistente: {valor}")
+    return _sem_repeticoes(erros)
+
+def _sem_repeticoes(erros):
+    return list(dict.fromkeys(erros))
+
+def validar_sql(sql, tabelas=None, dialeto=DIALETO_MSSQL):
+    """
+    Corrige e valida o SQL. `tabelas` é o catálogo do schema ({tabela: [(coluna, tipo)]});
+    sem catálogo, só a sintaxe é conferida. Retorna {'sql', 'correcoes', 'erros'}.
+    """
+    sql, correcoes = corrigir_dialeto(sql, dialeto)
+    catalogo = _indice_catalogo(tabelas or {})
+    if sqlglot is not None:
+        erros = _conferir_com_sqlglot(sql, catalogo, dialeto)
+    elif catalogo:
+        erros = _conferir_por_tokens(sql, catalogo)
+    else:
+        erros = []
+    return {"sql": sql, "correcoes": correcoes, "erros": erros}
@@ -0,0 +1,318 @@
+"""
+Rastreamento (tracing) das etapas de cada turno: chamadas à LLM, execução do SQL e o turno inteiro.
+
+Cada etapa abre um span com nome, duração, span pai e atributos (tokens do prompt e da resposta,
+linhas, bytes...). Os spans terminados ficam:
+- agregados em memória por nome (contagem, soma, histograma da duração e soma dos atributos numéricos),
+  exportáveis no formato texto do Prometheus (exportar_prometheus ou o endpoint HTTP opcional);
+- nos últimos spans em memória (spans_recentes), usados pelo painel de latência do Streamlit;
+- opcionalmente, em um arquivo JSONL (um span por linha).
+"""
+
+import os
+import json
+import time
+import uuid
+import inspect
+import functools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import get_setting
+
+LIMITES_HISTOGRAMA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+MAX_SPANS_RECENTES = 1000
+
+_span_atual = contextvars.ContextVar("span_atual", default=None)
+_lock = threading.Lock()
+_agregados = {}
+_recentes = deque(maxlen=MAX_SPANS_RECENTES)
+_configuracao = {"caminho_jsonl": None}
+_servidor = None
+# O arquivo JSONL tem lock próprio: a gravação não segura o lock dos agregados
+_lock_arquivo = threading.Lock()
+_arquivos = {}
+
+class Span:
+    """
+    Uma etapa rastreada. Os atributos podem ser definidos (definir) ou acumulados (somar) até o fim do span.
+    `erros_no_trace` é a lista, compartilhada por todos os spans do trace, dos erros dos spans já terminados.
+    """
+
+    def __init__(self, nome, pai=None, **atributos):
+        self.nome = nome
+        self.trace_id = pai.trace_id if pai is not None else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.pai_id = pai.span_id if pai is not None else None
+        self.erros_no_trace = pai.erros_no_trace if pai is not None else []
+        self.atributos = dict(atributos)
+        self.erro = None
+        self.inicio = time.time()
+        self.duracao = None
+        self._inicio_relogio = time.perf_counter()
+        self._adiado = False
+
+    def concluir(self):
+        """
+        Registra o span (chamado ao sair do bloco, ou por quem adiou o fim; veja adiar_fim_do_span).
+        """
+        self.duracao = time.perf_counter() - self._inicio_relogio
+        if self.erro:
+            self.erros_no_trace.append(self.erro)
+        _finalizar(self)
+
+    def definir(self, **atributos):
+        self.atributos.update(atributos)
+
+    def somar(self, **valores):
+        for chave, valor in valores.items():
+            self.atributos[chave] = self.atributos.get(chave, 0) + valor
+
+    def como_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "pai_id": self.pai_id,
+            "nome": self.nome,
+            "inicio": self.inicio,
+            "duracao": self.duracao,
+            "atributos": self.atributos,
+            "erro": self.erro,
+        }
+
+_SEM_PAI_EXPLICITO = object()
+
+@contextmanager
+def span(nome, pai=_SEM_PAI_EXPLICITO, **atributos):
+    """
+    Abre um span filho do span atual (ou de `pai`, se informado) e o registra ao sair.
+    Exceções são anotadas no span e propagadas.
+    """
+    atual = Span(nome, pai=_span_atual.get() if pai is _SEM_PAI_EXPLICITO else pai, **atributos)
+    token = _span_atual.set(atual)
+    try:
+        yield atual
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            atual.erro = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        try:
+            _span_atual.reset(token)
+        except ValueError:
+            # Geradores podem ser consumidos em outro contexto (por exemplo, outra thread)
+            _span_atual.set(None)
+        if not atual._adiado:
+            atual.concluir()
+
+def span_atual():
+    """
+    Retorna o span em andamento no contexto atual, ou None.
+    """
+    return _span_atual.get()
+
+def adiar_fim_do_span():
+    """
+    Faz o span atual continuar aberto depois do fim do bloco (por exemplo, enquanto uma resposta em
+    streaming é consumida). Retorna a função que o conclui; sem span atual, retorna uma função vazia.
+    """
+    atual = _span_atual.get()
+    if atual is None:
+        return lambda: None
+    atual._adiado = True
+    return atual.concluir
+
+def somar_no_span(**valores):
+    """
+    Acumula valores numéricos (por exemplo, prompt_tokens) no span atual, se houver.
+    """
+    atual = _span_atual.get()
+    if atual is not None:
+        atual.somar(**valores)
+
+def registrar_erro_no_span(erro):
+    """
+    Anota um erro tratado (que não propaga até o fim do span) no span atual, se houver.
+    """
+    atual = _span_atual.get()
+    if atual is not None:
+        atual.erro = f"{type(erro).__name__}: {erro}"
+
+def rastrear(nome):
+    """
+    Decorador que executa a função dentro de um span. Funciona com funções comuns, corrotinas
+    e geradores; no caso de geradores, o span cobre todo o consumo e é filho do span
+    em que o gerador foi criado.
+    """
+    def decorador(funcao):
+        if inspect.iscoroutinefunction(funcao):
+            @functools.wraps(funcao)
+            async def envoltorio_async(*args, **kwargs):
+                with span(nome):
+                    return await funcao(*args, **kwargs)
+            return envoltorio_async
+        if inspect.isgeneratorfunction(funcao):
+            @functools.wraps(funcao)
+            def envoltorio_gerador(*args, **kwargs):
+                pai = _span_atual.get()
+                def gerar():
+                    with span(nome, pai=pai):
+                        yield from funcao(*args, **kwargs)
+                return gerar()
+            return envoltorio_gerador
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            with span(nome):
+                return funcao(*args, **kwargs)
+        return envoltorio
+    return decorador
+
+def _finalizar(registro):
+    dados = registro.como_dict()
+    with _lock:
+        agregado = _agregados.setdefault(registro.nome, {
+            "n": 0, "soma": 0.0, "erros": 0, "buckets": [0] * len(LIMITES_HISTOGRAMA), "atributos": {},
+        })
+        agregado["n"] += 1
+        agregado["soma"] += registro.duracao
+        agregado["erros"] += 1 if registro.erro else 0
+        for i, limite in enumerate(LIMITES_HISTOGRAMA):
+            if registro.duracao <= limite:
+                agregado["buckets"][i] += 1
+        for chave, valor in registro.atributos.items():
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                agregado["atributos"][chave] = agregado["atributos"].get(chave, 0) + valor
+        _recentes.append(dados)
+    caminho = _configuracao["caminho_jsonl"]
+    if caminho:
+        _gravar_jsonl(caminho, json.dumps(dados, ensure_ascii=False, default=str) + "\n")
+
+def _gravar_jsonl(caminho, linha):
+    # O arquivo fica aberto entre os spans; cada linha é enviada ao sistema operacional ao ser gravada
+    with _lock_arquivo:
+        try:
+            if caminho not in _arquivos:
+                _arquivos[caminho] = open(caminho, "a", encoding="utf-8")
+            _arquivos[caminho].write(linha)
+            _arquivos[caminho].flush()
+        except OSError as e:
+            print("Erro ao gravar o span no arquivo de tracing:", str(e))
+
+def spans_recentes(nome=None):
+    """
+    Retorna os últimos spans terminados (como dicionários), opcionalmente filtrados pelo nome.
+    """
+    with _lock:
+        return [dados for dados in _recentes if nome is None or dados["nome"] == nome]
+
+def resumo_spans():
+    """
+    Retorna {nome: {'n', 'media', 'p50', 'p95', 'erros'}} a partir dos spans recentes.
+    """
+    duracoes = {}
+    erros = {}
+    for dados in spans_recentes():
+        duracoes.setdefault(dados["nome"], []).append(dados["duracao"])
+        erros[dados["nome"]] = erros.get(dados["nome"], 0) + (1 if dados["erro"] else 0)
+    resumo = {}
+    for nome, valores in sorted(duracoes.items()):
+        valores.sort()
+        resumo[nome] = {
+            "n": len(valores),
+            "media": sum(valores) / len(valores),
+            "p50": valores[min(len(valores) - 1, int(0.5 * len(valores)))],
+            "p95": valores[min(len(valores) - 1, int(0.95 * len(valores)))],
+            "erros": erros[nome],
+        }
+    return resumo
+
+def _rotulo(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"')
+
+def exportar_prometheus():
+    """
+    Retorna os agregados no formato texto de exposição do Prometheus.
+    """
+    with _lock:
+        agregados = {nome: json.loads(json.dumps(agregado)) for nome, agregado in _agregados.items()}
+    linhas = [
+        "# HELP chatbot_span_duration_seconds Duração das etapas rastreadas.",
+        "# TYPE chatbot_span_duration_seconds histogram",
+    ]
+    for nome, agregado in sorted(agregados.items()):
+        for limite, quantidade in zip(LIMITES_HISTOGRAMA, agregado["buckets"]):
+            linhas.append(f'chatbot_span_duration_seconds_bucket{{span="{_rotulo(nome)}",le="{limite}"}} {quantidade}')
+        linhas.append(f'chatbot_span_duration_seconds_bucket{{span="{_rotulo(nome)}",le="+Inf"}} {agregado["n"]}')
+        linhas.append(f'chatbot_span_duration_seconds_sum{{span="{_rotulo(nome)}"}} {agregado["soma"]}')
+        linhas.append(f'chatbot_span_duration_seconds_count{{span="{_rotulo(nome)}"}} {agregado["n"]}')
+    linhas += ["# HELP chatbot_span_errors_total Etapas terminadas com erro.", "# TYPE chatbot_span_errors_total counter"]
+    for nome, agregado in sorted(agregados.items()):
+        linhas.append(f'chatbot_span_errors_total{{span="{_rotulo(nome)}"}} {agregado["erros"]}')
+    linhas += [
+        "# HELP chatbot_span_attribute_total Soma dos atributos numéricos (tokens, linhas, bytes).",
+        "# TYPE chatbot_span_attribute_total counter",
+    ]
+    for nome, agregado in sorted(agregados.items()):
+        for atributo, valor in sorted(agregado["atributos"].items()):
+            linhas.append(
+                f'chatbot_span_attribute_total{{span="{_rotulo(nome)}",attribute="{_rotulo(atributo)}"}} {valor}'
+            )
+    return "\n".join(linhas) + "\n"
+
+class _HandlerPrometheus(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        corpo = exportar_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *args):
+        pass
+
+def iniciar_servidor_prometheus(porta, host="127.0.0.1"):
+    """
+    Inicia (uma vez por processo) o endpoint HTTP /metrics em uma thread de fundo.
+    """
+    global _servidor
+    with _lock:
+        if _servidor is not None:
+            return _servidor
+        try:
+            _servidor = ThreadingHTTPServer((host, porta), _HandlerPrometheus)
+        except OSError as e:
+            print("Erro ao iniciar o endpoint de métricas:", str(e))
+            return None
+        threading.Thread(target=_servidor.serve_forever, name="tracing-prometheus", daemon=True).start()
+        return _servidor
+
+def configurar_tracing(config):
+    """
+    Aplica a configuração do .env: TRACING_JSONL_PATH (arquivo de spans) e
+    TRACING_PROMETHEUS_PORT (endpoint /metrics; 0 desativa).
+    """
+    caminho = get_setting(config, "TRACING_JSONL_PATH", "") or None
+    if caminho and os.path.dirname(caminho):
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    _configuracao["caminho_jsonl"] = caminho
+    porta = get_setting(config, "TRACING_PROMETHEUS_PORT", 0, int)
+    if porta:
+        iniciar_servidor_prometheus(porta, get_setting(config, "TRACING_PROMETHEUS_HOST", "127.0.0.1"))
+
+def limpar_tracing():
+    """
+    Descarta os agregados e os spans recentes.
+    """
+    with _lock:
+        _agregados.clear()
+        _recentes.clear()
+    with _lock_arquivo:
+        for arquivo in _arquivos.values():
+            arquivo.close()
+        _arquivos.clear()
@@ -12,68 +12,79 @@ Funcionalidades:
 - Histórico de conversa mantido durante a sessão
 """
 
-from config import load_config
-from core.db_utils import create_db_engine, get_schema, executar_sql
-from core.llm_utils import (
-    gerar_sql_llm_chat,
-    extrair_sql_da_resposta,
-    gerar_resposta_natural,
-    classificar_mensagem,
-    responder_casual_interaction
-)
-from core.prompt_utils import load_resource
+from concurrent.futures import ThreadPoolExecutor
+from config import load_config, get_setting
+
+def _carregar_pipeline(config):
+    """
+    Importa o pipeline (pandas, SQLAlchemy, sqlglot), carrega o contexto (engine, catálogo do
+    schema, caches) e o cliente da LLM. Roda em segundo plano enquanto o usuário digita.
+    Retorna (módulo do pipeline, contexto).
+    """
+    from core import pipeline
+    from core.llm_utils import precarregar_cliente_llm
+    contexto = pipeline.carregar_contexto(config)
+    precarregar_cliente_llm()
+    return pipeline, contexto
 
 def main():
     """
     Função principal que executa o loop de interação com o usuário no terminal.
     """
-    # Carrega configurações e recursos
+    # Carrega configurações; o pipeline e os recursos carregam em segundo plano
     config = load_config()
-    engine = create_db_engine(config["SQLALCHEMY_DATABASE_URI"])
-    schema = get_schema(engine, schema_name="dbo")
-    sintax = load_resource("resources/sintax.txt")
-    data_dictionary = load_resource("resources/data_dictionary.txt")
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="carregamento")
+    carregamento = executor.submit(_carregar_pipeline, config)
+    mostrar_tempos = get_setting(config, "PIPELINE_SHOW_TIMINGS", False, bool)
+    streaming = get_setting(config, "STREAMING_ENABLED", True, bool)
+    usar_async = get_setting(config, "PIPELINE_ASYNC", False, bool)
 
     print("Bem-vindo(a) ao LLM Data Analyzer Terminal!")
     print("Digite 'exit' ou 'quit' para sair a qualquer momento.\n")
 
-    # Inicia o histórico de mensagens
-    history = [] 
+    history = None
     while True:
         user_message = input("\nUser: ")
         if user_message.lower() in ["exit", "quit"]:
             print("Até a próxima!")
             break
 
+        # Na primeira pergunta, espera o carregamento (em geral já concluído enquanto o usuário digitava).
+        # Se ele falhou (por exemplo, banco inacessível), tenta de novo a cada pergunta
+        if carregamento.exception() is not None:
+            print("Erro ao carregar os recursos:", str(carregamento.exception()))
+            carregamento = executor.submit(_carregar_pipeline, config)
+            if carregamento.exception() is not None:
+                print("Assistant: Desculpe, não foi possível carregar os recursos (banco de dados ou LLM). "
+                      "Tente novamente em instantes.")
+                continue
+        pipeline, contexto = carregamento.result()
+        if history is None:
+            # Inicia o histórico de mensagens (limitado por tokens, com resumo das mensagens antigas)
+            history = pipeline.criar_historico(config)
         history.append(("user", user_message))
 
-        # Classifica o tipo de mensagem do usuário
-        tipo = classificar_mensagem(user_message, config, history)
-
-        if tipo == "casual_interaction":
-            # Responde perguntas casuais ou de interação
-            resposta = responder_casual_interaction(history, user_message, config)
-            print("Assistant:", resposta)
-            history.append(("assistant", resposta)) 
-        elif tipo == "sql_request":
-            # Gera SQL, executa consulta e responde com base nos dados
-            resposta_llm = gerar_sql_llm_chat(user_message, schema, config, sintax, data_dictionary, history)
-            try:
-                consulta_sql = extrair_sql_da_resposta(resposta_llm)
-                df_resultado = executar_sql(engine, consulta_sql)
-                resposta = gerar_resposta_natural(df_resultado, user_message, consulta_sql, config, history)
-                print("Assistant:", resposta)
-                history.append(("assistant", resposta))  # Adiciona resposta do assistente
-            except Exception as e:
-                erro_msg = f"Desculpe, não pude processar seu pedido. Error: {str(e)}"
-                print("Assistant:", erro_msg)
-                history.append(("assistant", erro_msg))
+        # Classifica a mensagem, gera e executa o SQL (se for o caso) e responde
+        if usar_async:
+            resultado = pipeline.executar_assincrono(pipeline.aprocessar_mensagem(user_message, history, contexto))
+        else:
+            resultado = pipeline.processar_mensagem(user_message, history, contexto, stream=streaming)
+        if not isinstance(resultado["resposta"], str):
+            # Imprime a resposta à medida que os trechos chegam da LLM
+            print("Assistant: ", end="", flush=True)
+            trechos = []
+            for trecho in resultado["resposta"]:
+                print(trecho, end="", flush=True)
+                trechos.append(trecho)
+            print()
+            resposta = "".join(trechos).strip()
         else:
-            # Se a classificação não for reconhecida, retorna uma mensagem de erro
-            erro_msg = "Desculpe, não pude entender sua mensagem. Por favor, tente novamente."
-            print("Assistant:", erro_msg)
-            history.append(("assistant", erro_msg))
+            resposta = resultado["resposta"]
+            print("Assistant:", resposta)
+        history.append(("assistant", resposta))
+        if mostrar_tempos:
+            print(f"[{pipeline.formatar_tempos(resultado)}]")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,9 @@
+import pytest
+from core import llm_utils
+
+@pytest.fixture(autouse=True)
+def limpar_registro_llm():
+    # Garante que cada teste comece sem clientes LLM reaproveitados de outros testes
+    llm_utils.limpar_pool_llm()
+    yield
+    llm_utils.limpar_pool_llm()
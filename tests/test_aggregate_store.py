@@ -0,0 +1,90 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+from core.aggregate_store import CuboAgregados
+from core.db_utils import executar_sql
+
+def criar_engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE credito (REF_DATE TEXT, TARGET INTEGER, VAR2 TEXT, IDADE INTEGER, VAR5 TEXT, VAR8 TEXT);"
+        ))
+        conn.execute(text(
+            "INSERT INTO credito VALUES ('2023-01-01', 1, 'F', 30, 'SP', 'A'), ('2023-01-01', 0, 'M', 41, 'SP', 'B'),"
+            " ('2023-02-01', 0, 'M', NULL, 'RJ', 'B'), ('2024-02-01', 1, NULL, 50, 'RJ', NULL);"
+        ))
+    return engine
+
+def criar_cubo(engine):
+    cubo = CuboAgregados(
+        engine, "credito", ["VAR2", "VAR5", "VAR8", "TARGET", "REF_DATE"], ["IDADE"],
+        tipos={"IDADE": "INT", "REF_DATE": "DATE"}, intervalo_atualizacao=0,
+    )
+    assert cubo.atualizar()
+    return cubo
+
+def test_reescrever_agregados_para_o_cubo():
+    cubo = criar_cubo(criar_engine())
+    sql = cubo.reescrever("SELECT TOP 5 VAR5, COUNT(*) AS n FROM dbo.credito c WHERE c.TARGET = 1 GROUP BY VAR5")
+    assert sql == "SELECT VAR5, SUM(n) AS n FROM cubo AS c WHERE c.TARGET = 1 GROUP BY VAR5 LIMIT 5"
+    # Filtros por medidas, linhas sem agregação e outras tabelas ficam com o banco
+    assert cubo.reescrever("SELECT VAR5, COUNT(*) FROM credito WHERE IDADE > 30 GROUP BY VAR5") is None
+    assert cubo.reescrever("SELECT IDADE FROM credito") is None
+    assert cubo.reescrever("SELECT COUNT(*) FROM clientes") is None
+
+def test_consultar_responde_como_o_banco():
+    engine = criar_engine()
+    cubo = criar_cubo(engine)
+    consultas = [
+        "SELECT VAR5, AVG(CAST(IDADE AS FLOAT)) AS media, COUNT(IDADE) AS n FROM credito GROUP BY VAR5 ORDER BY VAR5",
+        "SELECT VAR5, SUM(IDADE) AS s, MIN(IDADE) AS mi, MAX(IDADE) AS ma FROM credito GROUP BY VAR5 ORDER BY VAR5",
+        "SELECT VAR5, COUNT(DISTINCT VAR8) AS d FROM credito GROUP BY VAR5 HAVING COUNT(*) > 1 ORDER BY VAR5",
+    ]
+    for consulta in consultas:
+        assert cubo.consultar(consulta).to_dict("records") == executar_sql(engine, consulta).to_dict("records")
+    # A média de uma coluna inteira é truncada, como no T-SQL
+    assert cubo.consultar("SELECT AVG(IDADE) AS m FROM credito WHERE VAR5 = 'SP'")["m"].iloc[0] == 35
+
+def test_atualizacao_incremental_e_executar_sql_com_cubo():
+    engine = criar_engine()
+    cubo = criar_cubo(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO credito VALUES ('2024-02-01', 0, 'F', 20, 'MG', 'C'), ('2024-03-01', 0, 'F', 22, 'MG', 'C');"))
+    assert cubo.atualizar()
+    df = executar_sql(engine, "SELECT COUNT(*) AS n FROM credito WHERE VAR5 = :p0", parametros={"p0": "MG"}, cubo=cubo)
+    assert df["n"].iloc[0] == 2
+    assert cubo.hits == 1
+    assert executar_sql(engine, "SELECT COUNT(*) AS n FROM credito", cubo=cubo)["n"].iloc[0] == 6
+
+def test_datas_do_driver_como_date_respondem_como_o_banco():
+    # Testa uma coluna DATE devolvida pelo driver como datetime.date (como o pyodbc): o cubo guarda
+    # texto ISO e converte os literais, em vez de gravar '2023-01-01 00:00:00'
+    import sqlite3
+    engine = create_engine("sqlite://", poolclass=StaticPool,
+                           connect_args={"check_same_thread": False, "detect_types": sqlite3.PARSE_DECLTYPES})
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE credito (REF_DATE DATE, VAR5 TEXT, IDADE INTEGER);"))
+        conn.execute(text("INSERT INTO credito VALUES ('2023-01-01', 'SP', 30), ('2023-02-01', 'RJ', 40), ('2023-03-01', 'RJ', 50);"))
+    assert str(executar_sql(engine, "SELECT REF_DATE FROM credito")["REF_DATE"].dtype).startswith("datetime64")
+    cubo = CuboAgregados(engine, "credito", ["VAR5", "REF_DATE"], ["IDADE"], tipos={"IDADE": "INT", "REF_DATE": "date"},
+                         intervalo_atualizacao=0)
+    assert cubo.atualizar()
+    # Os dois primeiros casos do SQL Server também valem no SQLite de origem; os demais seguem a semântica do
+    # SQL Server (o literal com horário e o CAST AS DATE são comparados como datas)
+    consultas = {
+        "SELECT COUNT(*) AS n FROM credito WHERE REF_DATE = '2023-01-01'": 1,
+        "SELECT COUNT(*) AS n FROM credito WHERE REF_DATE BETWEEN '2023-01-01' AND '2023-02-01'": 2,
+        "SELECT COUNT(*) AS n FROM credito WHERE REF_DATE IN ('2023-02-01 00:00:00', '2023-03-01')": 2,
+        "SELECT COUNT(*) AS n FROM credito WHERE REF_DATE >= CAST('2023-02-01' AS DATE)": 2,
+    }
+    for consulta, esperado in consultas.items():
+        assert cubo.consultar(consulta)["n"].iloc[0] == esperado
+    for consulta in list(consultas)[:2]:
+        assert executar_sql(engine, consulta)["n"].iloc[0] == consultas[consulta]
+    anos = cubo.consultar("SELECT YEAR(REF_DATE) AS ano, COUNT(*) AS n FROM credito GROUP BY YEAR(REF_DATE)")
+    assert anos.to_dict("records") == [{"ano": 2023, "n": 3}]
+    # A atualização incremental continua a partir da maior data, no mesmo formato
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO credito VALUES ('2023-03-01', 'SP', 60);"))
+    assert cubo.atualizar()
+    assert cubo.consultar("SELECT COUNT(*) AS n FROM credito WHERE REF_DATE = '2023-03-01'")["n"].iloc[0] == 2
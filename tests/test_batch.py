@@ -0,0 +1,80 @@
+import io
+import json
+import threading
+import pandas as pd
+import batch
+from core.tracing import span
+
+def test_ler_perguntas_jsonl_e_csv():
+    # Testa a leitura de JSONL e CSV, com id explícito ou pelo número da linha
+    jsonl = io.StringIO('{"id": "a", "pergunta": "Qual a média de idade?"}\n\n{"pergunta": "Quantos clientes?"}\n')
+    assert batch.ler_perguntas(jsonl) == [
+        {"id": "a", "pergunta": "Qual a média de idade?"},
+        {"id": "linha-2", "pergunta": "Quantos clientes?"},
+    ]
+    csv_texto = io.StringIO("pergunta\nQual a média de idade?\n")
+    assert batch.ler_perguntas(csv_texto, "csv") == [{"id": "linha-1", "pergunta": "Qual a média de idade?"}]
+
+def test_limite_concorrencia_reduz_com_limite_de_taxa_e_se_recupera():
+    # Testa a redução à metade após um 429 e o crescimento gradual após sucessos
+    limite = batch.LimiteConcorrencia(8)
+    limite.adquirir()
+    limite.liberar(limitado=True)
+    assert limite.limite == 4
+    for _ in range(4):
+        limite.adquirir()
+        limite.liberar()
+    assert limite.limite == 5
+
+def test_executar_batch_grava_resultados_e_retoma(tmp_path):
+    # Testa a gravação incremental, a retomada (pulando as concluídas) e a repetição após limite de taxa
+    saida = tmp_path / "respostas.jsonl"
+    saida.write_text(json.dumps({"id": "1", "pergunta": "p1", "erro": None}) + "\n" + '{"id": "2", "perg', encoding="utf-8")
+    chamadas = []
+    lock = threading.Lock()
+
+    def processar(pergunta, history, contexto):
+        with lock:
+            chamadas.append(pergunta)
+            primeira_p3 = pergunta == "p3" and chamadas.count("p3") == 1
+        if primeira_p3:
+            # Erro da API tratado dentro do pipeline, visível apenas no span da chamada
+            with span("llm.gerar_sql") as atual:
+                atual.erro = "RateLimitError: Error code: 429"
+        df = pd.DataFrame({"n": [1, 2]})
+        return {"tipo": "sql_request", "sql": "SELECT 1", "resposta": f"r-{pergunta}", "df": df, "tempos": {"total": 0.1}}
+
+    perguntas = [{"id": str(i), "pergunta": f"p{i}"} for i in (1, 2, 3)]
+    resumo = batch.executar_batch(perguntas, {}, str(saida), workers=2, espera_base=0, dir_dados=str(tmp_path / "dados"),
+                                  processar=processar)
+    assert resumo == {"total": 3, "puladas": 1, "respondidas": 2, "erros": 0}
+    assert sorted(chamadas) == ["p2", "p3", "p3"]
+    registros = {r["id"]: r for r in map(json.loads, saida.read_text(encoding="utf-8").splitlines()[2:])}
+    assert registros["3"]["tentativas"] == 2 and registros["3"]["resposta"] == "r-p3"
+    assert registros["2"]["linhas"] == 2 and registros["2"]["sql"] == "SELECT 1"
+    assert (tmp_path / "dados" / "2.csv").exists()
+    assert batch.executar_batch(perguntas, {}, str(saida), processar=processar)["puladas"] == 3
+
+def test_falhas_e_respostas_degradadas_ficam_com_erro(tmp_path):
+    # Testa se falha no banco e erro da API tratado pelo pipeline contam como erro e são repetidos na retomada
+    saida = tmp_path / "respostas.jsonl"
+    falhar = {"ativo": True}
+
+    def processar(pergunta, history, contexto):
+        if falhar["ativo"] and pergunta == "p2":
+            with span("llm.resposta_natural") as atual:
+                atual.erro = "APIConnectionError: Connection error."
+            return {"tipo": "sql_request", "sql": "SELECT 1", "resposta": "Desculpe...", "df": pd.DataFrame({"n": [1]}), "tempos": {}}
+        df = None if falhar["ativo"] and pergunta == "p1" else pd.DataFrame({"n": [1]})
+        return {"tipo": "sql_request", "sql": "SELECT 1", "resposta": "r", "df": df, "tempos": {}}
+
+    perguntas = [{"id": str(i), "pergunta": f"p{i}"} for i in (1, 2, 3)]
+    resumo = batch.executar_batch(perguntas, {}, str(saida), workers=1, espera_base=0, processar=processar)
+    assert resumo == {"total": 3, "puladas": 0, "respondidas": 1, "erros": 2}
+    registros = {r["id"]: r for r in map(json.loads, saida.read_text(encoding="utf-8").splitlines())}
+    assert registros["1"]["erro"] == "A consulta SQL falhou."
+    assert registros["2"]["erro"].endswith("APIConnectionError: Connection error.") and registros["2"]["tentativas"] == 3
+    falhar["ativo"] = False
+    assert batch.executar_batch(perguntas, {}, str(saida), processar=processar) == {
+        "total": 3, "puladas": 1, "respondidas": 2, "erros": 0
+    }
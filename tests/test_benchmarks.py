@@ -0,0 +1,40 @@
+from benchmarks.run_benchmark import executar_benchmark, comparar_com_baseline, carregar_corpus
+from benchmarks.startup import (
+    executar_benchmark as executar_benchmark_inicializacao,
+    comparar_com_baseline as comparar_inicializacao,
+    medir_importacao,
+)
+from core import llm_utils
+
+def test_benchmark_executa_corpus_com_llm_falsa(tmp_path):
+    # Testa se o benchmark roda o pipeline inteiro sem rede e reporta etapas, tokens e banco
+    corpus = carregar_corpus()[:3]
+    relatorio = executar_benchmark(
+        repeticoes=1, linhas=200, corpus=corpus, caminho_banco=str(tmp_path / "credito.sqlite3")
+    )
+    assert relatorio["etapas"]["total"]["n"] == 3
+    assert "execucao_sql" in relatorio["etapas"]
+    assert relatorio["prompt_tokens"]["sql"]["media"] > 0
+    assert relatorio["banco"]["sql.linhas"]["n"] == 2
+    assert llm_utils._fabrica_llm is None
+
+def test_comparar_com_baseline_detecta_regressao():
+    baseline = {"etapas": {"total": {"p50": 0.1, "p95": 0.2}}, "prompt_tokens": {"sql": {"media": 1000}}}
+    relatorio = {"etapas": {"total": {"p50": 0.1, "p95": 0.5}}, "prompt_tokens": {"sql": {"media": 1500}}}
+    regressoes = comparar_com_baseline(relatorio, baseline)
+    assert len(regressoes) == 2
+    assert comparar_com_baseline(baseline, baseline) == []
+
+def test_inicializacao_nao_importa_bibliotecas_pesadas():
+    # Testa se main.py e o pipeline não importam a LLM nem as bibliotecas de gráficos na inicialização
+    relatorio = executar_benchmark_inicializacao(repeticoes=1)
+    for modulo, dados in relatorio["alvos"].items():
+        assert dados["proibidos"] == [], modulo
+        assert dados["total"] > 0
+    assert "pandas" not in medir_importacao("main")
+
+def test_comparar_inicializacao_com_baseline():
+    baseline = {"alvos": {"main": {"total": 0.02, "proibidos": []}}}
+    relatorio = {"alvos": {"main": {"total": 0.5, "proibidos": ["pandas"]}}}
+    assert len(comparar_inicializacao(relatorio, baseline)) == 2
+    assert comparar_inicializacao(baseline, baseline) == []
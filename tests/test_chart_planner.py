@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+from core.chart_planner import planejar_grafico, gerar_codigo_grafico_local, MAX_CATEGORIAS, MAX_PONTOS
+from core.chart_renderer import validar_codigo_grafico
+
+@pytest.mark.parametrize("df, tipo", [
+    (pd.DataFrame({"UF": ["SP", "RJ", "MG"], "media_idade": [40.1, 38.2, 41.0]}), "barra"),
+    (pd.DataFrame({"CLASSE_SOCIAL": list("ABCDEABCDE")}), "contagem"),
+    (pd.DataFrame({"REF_DATE": pd.date_range("2024-01-01", periods=12, freq="MS"), "inadimplencia": np.arange(12.0)}), "linha"),
+    (pd.DataFrame({"UF": ["SP", "SP", "RJ"], "CLASSE": ["A", "B", "A"], "TARGET": [0.1, 0.2, 0.3]}), "heatmap"),
+    (pd.DataFrame({"IDADE": np.arange(18, 68)}), "histograma"),
+    (pd.DataFrame({"ano": [2022, 2023, 2024], "media_renda": [1.0, 2.0, 1.5]}), "barra"),
+    (pd.DataFrame({"n": [42]}), None),
+    (pd.DataFrame({"a": np.arange(20.0), "b": np.arange(20.0)}), None),
+])
+def test_planejar_grafico_por_formato(df, tipo):
+    # Testa a escolha do gráfico pelos tipos e pela cardinalidade das colunas; formatos desconhecidos vão para a LLM
+    plano = planejar_grafico(df)
+    assert (plano["tipo"] if plano else None) == tipo
+    if plano:
+        assert validar_codigo_grafico(gerar_codigo_grafico_local(df)) == (True, None)
+
+def test_codigo_local_limita_categorias_e_reduz_series_longas():
+    # Testa se o código mostra só as maiores categorias e reduz séries longas por média em blocos
+    muitas = pd.DataFrame({"cidade": [f"c{i}" for i in range(100)], "qtd_clientes": np.arange(100)})
+    codigo = gerar_codigo_grafico_local(muitas)
+    assert f"head({MAX_CATEGORIAS})" in codigo and "'sum'" in codigo
+
+    serie = pd.DataFrame({"REF_DATE": pd.date_range("2020-01-01", periods=10000, freq="h"), "taxa": np.random.rand(10000)})
+    namespace = {"df": serie, "plt": None}
+    codigo = gerar_codigo_grafico_local(serie)
+    # Executa só a preparação dos dados (sem a plotagem)
+    preparacao = "\n".join(linha for linha in codigo.splitlines() if not linha.startswith(("ax", "plt")))
+    exec(preparacao, namespace)
+    assert len(namespace["dados"]) == MAX_PONTOS
+
+def test_serie_temporal_com_inteiro_e_datas_em_texto_vira_linha():
+    # Testa se a coluna inteira não vira categoria quando há data, e se datas ISO em texto (SQLite) contam como data
+    meses = pd.date_range("2023-01-01", periods=12, freq="MS")
+    df = pd.DataFrame({"REF_DATE": meses, "taxa": np.linspace(0.1, 0.2, 12), "clientes": np.arange(100, 112, dtype="int32")})
+    plano = planejar_grafico(df)
+    assert plano["tipo"] == "linha" and plano["y"] == ["taxa", "clientes"]
+
+    texto = df.assign(REF_DATE=meses.strftime("%Y-%m-%d")).sample(frac=1, random_state=0)
+    plano = planejar_grafico(texto)
+    assert plano["tipo"] == "linha" and plano["x"] == "REF_DATE"
+    codigo = gerar_codigo_grafico_local(texto)
+    assert "pd.to_datetime" in codigo and validar_codigo_grafico(codigo) == (True, None)
+    namespace = {"df": texto, "pd": pd}
+    exec("\n".join(linha for linha in codigo.splitlines() if not linha.startswith(("ax", "plt"))), namespace)
+    assert namespace["dados"]["REF_DATE"].is_monotonic_increasing
+    assert pd.api.types.is_datetime64_any_dtype(namespace["dados"]["REF_DATE"])
@@ -0,0 +1,105 @@
+import pytest
+import pandas as pd
+from core import llm_utils
+from core.chart_renderer import validar_codigo_grafico, CacheGraficos, PoolGraficos, renderizar_grafico
+from core.df_utils import fingerprint_dataframe
+
+@pytest.mark.parametrize("codigo", [
+    "import os\nos.remove('x')",
+    "from subprocess import run",
+    "open('dados.csv', 'w')",
+    "df.__class__.__mro__",
+    "df.to_csv('saida.csv')",
+    "def f():\n    pass",
+    "getattr(df, 'to_csv')('x.csv')",
+])
+def test_validar_codigo_grafico_rejeita_codigo_perigoso(codigo):
+    # Testa se a validação pela AST rejeita importações, builtins, atributos privados e gravações em arquivo
+    valido, motivo = validar_codigo_grafico(codigo)
+    assert not valido
+    assert motivo
+
+def test_validar_codigo_grafico_aceita_plotagem():
+    # Testa se o código típico de plotagem é aceito (também por is_safe_plot_code)
+    codigo = "import matplotlib.pyplot as plt\nimport seaborn as sns\nsns.barplot(data=df, x='uf', y='n')\nplt.title('Clientes')"
+    assert validar_codigo_grafico(codigo) == (True, None)
+    assert llm_utils.is_safe_plot_code(codigo)
+
+def test_cache_graficos_por_codigo_e_dataframe():
+    # Testa se o gráfico é reaproveitado para o mesmo código e dados, e não para dados diferentes
+    cache = CacheGraficos(max_bytes=30)
+    df = pd.DataFrame({"uf": ["SP", "RJ"], "n": [3, 4]})
+    fingerprint = fingerprint_dataframe(df)
+    cache.armazenar_render("plt.bar(df.uf, df.n)", fingerprint, {"tipo": "png", "conteudo": b"12345"})
+    cache.armazenar_codigo("Clientes por UF?", fingerprint, "plt.bar(df.uf, df.n)")
+    assert cache.buscar_render("plt.bar(df.uf, df.n)\n", fingerprint)["conteudo"] == b"12345"
+    assert cache.buscar_codigo("clientes por uf", fingerprint) == "plt.bar(df.uf, df.n)"
+    assert cache.buscar_render("plt.bar(df.uf, df.n)", fingerprint_dataframe(df.assign(n=[3, 5]))) is None
+    # Orçamento de 30 bytes: a próxima entrada descarta a menos usada
+    cache.armazenar_render("plt.plot(df.n)", fingerprint, {"tipo": "png", "conteudo": b"123456"})
+    assert cache.buscar_render("plt.bar(df.uf, df.n)", fingerprint) is None
+
+def test_pool_graficos_renderiza_em_outro_processo_e_aplica_timeout():
+    # Testa a renderização no processo separado e a substituição do processo após estourar o tempo
+    pytest.importorskip("matplotlib")
+    pytest.importorskip("plotly")
+    df = pd.DataFrame({"uf": ["SP", "RJ"], "n": [3, 4]})
+    pool = PoolGraficos(timeout_segundos=5)
+    try:
+        png = renderizar_grafico("plt.bar(df['uf'], df['n'])", df, pool)
+        assert png["tipo"] == "png" and png["conteudo"].startswith(b"\x89PNG")
+        plotly = renderizar_grafico("fig = px.bar(df, x='uf', y='n')\nfig.show()", df, pool)
+        assert plotly["tipo"] == "plotly"
+        pool.timeout_segundos = 0.5
+        lento = renderizar_grafico("x = 0\nfor i in range(10 ** 10):\n    x += i", df, pool)
+        assert "excedeu" in lento["erro"]
+        pool.timeout_segundos = 5
+        assert renderizar_grafico("plt.plot(df['n'])", df, pool)["tipo"] == "png"
+        # np e go são aceitos pela validação sem importação, então precisam existir no processo
+        assert renderizar_grafico("x = np.arange(2)\nplt.bar(x, df['n'])", df, pool)["tipo"] == "png"
+        assert renderizar_grafico("fig = go.Figure(go.Bar(x=df['uf'], y=df['n']))", df, pool)["tipo"] == "plotly"
+    finally:
+        pool.encerrar()
+
+@pytest.mark.parametrize("codigo", [
+    "import matplotlib.pyplot as plt\nplt.matplotlib.subprocess.run(['id'], capture_output=True)",
+    "import numpy as np\nnp.savetxt('/tmp/grafico.txt', [1, 2])",
+    "pd.read_table('/etc/hostname')",
+    "import numpy\nnumpy.lib.npyio.savetxt('/tmp/grafico.txt', [1])",
+    "modulo = plt\nmodulo.savefig('grafico.png')",
+    "'{0.__class__}'.format(df)",
+])
+def test_validar_codigo_grafico_aceita_so_atributos_conhecidos(codigo):
+    # Testa se a lista de atributos permitidos barra cadeias a partir dos módulos e funções de E/S
+    valido, motivo = validar_codigo_grafico(codigo)
+    assert not valido
+    assert "não permitid" in motivo
+
+def test_codigo_dos_graficos_locais_passa_na_validacao():
+    # Testa se o código gerado pelos templates locais usa apenas atributos permitidos
+    from core.chart_planner import codigo_do_plano
+    planos = [
+        {"tipo": "barra", "x": "uf", "y": ["n"], "agregacao": "sum", "limitar": True, "horizontal": True},
+        {"tipo": "contagem", "x": "uf", "limitar": False, "horizontal": False},
+        {"tipo": "linha", "x": "mes", "y": ["n"], "reduzir": True},
+        {"tipo": "heatmap", "linhas": "uf", "colunas": "mes", "valor": "n", "agregacao": "sum"},
+        {"tipo": "histograma", "x": "n"},
+    ]
+    for plano in planos:
+        assert validar_codigo_grafico(codigo_do_plano(plano)) == (True, None)
+
+@pytest.mark.parametrize("codigo", [
+    "plt.matplotlib.subprocess.run(['id'])",
+    "import numpy as np\nnp.savetxt('/tmp/grafico-worker.txt', [1])",
+    "pd.read_table('/etc/hostname')",
+])
+def test_worker_bloqueia_arquivos_e_subprocessos(codigo):
+    # Testa se o processo de renderização bloqueia E/S mesmo para código que não passou pela validação
+    pytest.importorskip("matplotlib")
+    pytest.importorskip("plotly")
+    pool = PoolGraficos(timeout_segundos=30)
+    try:
+        resposta = pool.renderizar(codigo, pd.DataFrame({"n": [1]}))
+    finally:
+        pool.encerrar()
+    assert "PermissionError" in resposta["erro"]
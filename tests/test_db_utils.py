@@ -39,4 +39,116 @@ def test_executar_sql_invalid():
     # Testa execução de SQL inválido
     engine = create_engine("sqlite:///:memory:")
     df = db_utils.executar_sql(engine, "SELECT * FROM non_existing_table;")
-    assert df is None
\ No newline at end of file
+    assert df is None
+
+def test_executar_sql_com_cache_de_resultados():
+    # Testa se consultas equivalentes reaproveitam o resultado e se a invalidação da tabela força nova execução
+    from sqlalchemy import text
+    from core.result_cache import CacheResultados
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE credito (IDADE INTEGER, VAR5 TEXT);"))
+        conn.execute(text("INSERT INTO credito VALUES (30, 'SP'), (40, 'RJ');"))
+    cache = CacheResultados()
+    df = db_utils.executar_sql(engine, "SELECT c.VAR5, c.IDADE FROM credito c ORDER BY c.IDADE;", cache=cache)
+    df_cache = db_utils.executar_sql(engine, "select  t.VAR5, t.IDADE from credito as t order by t.IDADE", cache=cache)
+    assert cache.hits == 1
+    assert df_cache.equals(df)
+    cache.invalidar_tabela("dbo.credito")
+    db_utils.executar_sql(engine, "SELECT c.VAR5, c.IDADE FROM credito c ORDER BY c.IDADE;", cache=cache)
+    assert cache.hits == 1
+
+def _engine_com_linhas(n):
+    from sqlalchemy import text
+    from sqlalchemy.pool import StaticPool
+    engine = create_engine("sqlite:///:memory:", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER)"))
+        conn.execute(text("INSERT INTO t (id) VALUES (:id)"), [{"id": i} for i in range(n)])
+    return engine
+
+def test_executar_sql_protegido_limita_linhas():
+    # Testa se o limite de linhas corta o resultado e marca df.attrs['truncado']
+    engine = _engine_com_linhas(50)
+    df = db_utils.executar_sql(engine, "SELECT id FROM t ORDER BY id;", max_linhas=10)
+    assert len(df) == 10
+    assert df.attrs["truncado"] is True
+    df = db_utils.executar_sql(engine, "SELECT id FROM t WHERE id < 5", max_linhas=10)
+    assert len(df) == 5
+    assert df.attrs["truncado"] is False
+
+def test_executar_sql_protegido_timeout_e_cancelamento():
+    # Testa se o timeout e o cancelamento interrompem a consulta sem inutilizar a conexão
+    engine = _engine_com_linhas(1)
+    consulta_lenta = (
+        "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 100000000) "
+        "SELECT COUNT(*) FROM c"
+    )
+    assert db_utils.executar_sql(engine, consulta_lenta, timeout_segundos=0.2) is None
+
+    cancelamento = db_utils.Cancelamento()
+    cancelamento.cancelar()
+    assert db_utils.executar_sql(engine, consulta_lenta, cancelamento=cancelamento) is None
+    # A conexão continua utilizável depois da interrupção
+    assert len(db_utils.executar_sql(engine, "SELECT id FROM t", timeout_segundos=5)) == 1
+
+def test_executar_sql_le_em_lotes_e_registra_metricas():
+    # Testa se a leitura em lotes respeita o limite de linhas e registra as métricas da consulta
+    from core.metrics import limpar_metricas, resumo_metricas
+    limpar_metricas()
+    engine = _engine_com_linhas(25)
+    df = db_utils.executar_sql(engine, "SELECT id FROM t ORDER BY id", max_linhas=20, tamanho_lote=7)
+    assert df["id"].tolist() == list(range(20))
+    assert df.attrs["truncado"] is True
+    df = db_utils.executar_sql(engine, "SELECT id FROM t", tamanho_lote=7)
+    assert len(df) == 25 and df.attrs["truncado"] is False
+    metricas = resumo_metricas("sql.")
+    assert metricas["sql.linhas"]["n"] == 2
+    assert {"sql.linhas_por_segundo", "sql.pico_memoria_mb"} <= metricas.keys()
+
+def test_pool_medido_registra_espera_e_timeout(tmp_path):
+    from sqlalchemy.exc import TimeoutError as SQLAlchemyTimeoutError
+    from core.metrics import limpar_metricas
+    limpar_metricas()
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", poolclass=db_utils.PoolMedido,
+        pool_size=1, max_overflow=0, pool_timeout=0.1,
+    )
+    conexao = engine.connect()
+    with pytest.raises(SQLAlchemyTimeoutError):
+        engine.connect()
+    conexao.close()
+    estatisticas = db_utils.obter_estatisticas_pool_db(engine)
+    assert estatisticas["tamanho"] == 1 and estatisticas["em_uso"] == 0
+    assert estatisticas["db.pool.timeouts"]["n"] == 1
+    assert estatisticas["db.pool.espera_checkout"]["max"] >= 0.1
+    engine.dispose()
+
+def test_obter_engine_compartilhada():
+    config = {"SQLALCHEMY_DATABASE_URI": "sqlite://", "DB_POOL_SIZE": "3"}
+    try:
+        assert db_utils.obter_engine(config) is db_utils.obter_engine(dict(config))
+    finally:
+        db_utils.limpar_engines()
+
+def test_timeout_postgres_vale_so_na_transacao():
+    # Testa se o timeout no PostgreSQL usa SET LOCAL e não fica na conexão devolvida ao pool
+    class ConexaoFalsa:
+        def __init__(self):
+            self.comandos = []
+        def cursor(self):
+            conexao = self
+            class Cursor:
+                def execute(self, sql):
+                    conexao.comandos.append(sql)
+                def close(self):
+                    pass
+            return Cursor()
+    conexao = ConexaoFalsa()
+    db_utils._configurar_interrupcao(conexao, "postgresql", 2, None)
+    db_utils._restaurar_conexao(conexao, "postgresql", 2)
+    assert conexao.comandos == ["SET LOCAL statement_timeout = 2000"]
+    conexao = ConexaoFalsa()
+    db_utils._configurar_interrupcao(conexao, "mysql", 2, None)
+    db_utils._restaurar_conexao(conexao, "mysql", 2)
+    assert conexao.comandos == ["SET SESSION MAX_EXECUTION_TIME = 2000", "SET SESSION MAX_EXECUTION_TIME = DEFAULT"]
@@ -0,0 +1,59 @@
+import datetime
+import pandas as pd
+import decimal
+from core.df_utils import resumir_dataframe, otimizar_tipos, SEM_RESULTADOS
+from core.prompt_utils import contar_tokens
+
+def test_resumir_dataframe_pequeno_vai_inteiro():
+    # Testa se resultados pequenos são enviados como tabela completa
+    df = pd.DataFrame({"VAR5": ["SP", "RJ"], "media": [35.5, 40.1]})
+    assert resumir_dataframe(df) == df.to_markdown(index=False)
+    assert resumir_dataframe(pd.DataFrame()) == SEM_RESULTADOS
+
+def test_resumir_dataframe_grande_respeita_orcamento():
+    # Testa se o tamanho do texto não cresce com o número de linhas
+    df = pd.DataFrame({"IDADE": range(50000), "VAR5": ["SP", "RJ"] * 25000})
+    texto = resumir_dataframe(df, max_linhas=20, max_tokens=600)
+    assert contar_tokens(texto) <= 610
+    assert "50000 rows" in texto
+    assert "IDADE" in texto and "distinct=2" in texto
+
+def test_resumir_dataframe_modo_schema():
+    # Testa se o modo schema não inclui linhas, apenas colunas e estatísticas
+    df = pd.DataFrame({"IDADE": [10, 20, 30], "VAR5": ["SP", "RJ", "SP"]})
+    texto = resumir_dataframe(df, modo="schema")
+    assert "3 rows and 2 columns" in texto
+    assert "|" not in texto
+
+def test_otimizar_tipos_reduz_memoria():
+    # Testa se textos, decimais e inteiros pequenos passam para tipos compactos
+    df = pd.DataFrame({
+        "VAR5": pd.Series(["SP", "RJ"] * 500, dtype=object),
+        "renda": pd.Series([decimal.Decimal("1.5")] * 1000, dtype=object),
+        "idade": range(1000),
+        "grande": [2 ** 40] * 1000,
+    })
+    antes = df.memory_usage(deep=True).sum()
+    df = otimizar_tipos(df)
+    assert df["renda"].dtype == "float64"
+    assert df["idade"].dtype == "int32"
+    assert df["grande"].dtype == "int64"
+    assert df["VAR5"].dtype != object
+    assert df.memory_usage(deep=True).sum() < antes
+
+def test_otimizar_tipos_mantem_o_tipo_entre_lotes():
+    # Testa se o tipo decidido no primeiro lote com valores é reaplicado aos lotes seguintes
+    tipos = {}
+    lotes = [
+        otimizar_tipos(pd.DataFrame({"VAR5": pd.Series([None, None], dtype=object),
+                                     "data": pd.Series([datetime.date(2023, 1, 1), None], dtype=object)}), tipos),
+        otimizar_tipos(pd.DataFrame({"VAR5": pd.Series(["SP", None], dtype=object),
+                                     "data": pd.Series([None, None], dtype=object)}), tipos),
+        otimizar_tipos(pd.DataFrame({"VAR5": pd.Series([None, "RJ"], dtype=object),
+                                     "data": pd.Series([None, datetime.date(2023, 2, 1)], dtype=object)}), tipos),
+    ]
+    assert lotes[1]["data"].dtype == lotes[0]["data"].dtype
+    df = otimizar_tipos(pd.concat(lotes, ignore_index=True), tipos)
+    assert str(df["data"].dtype).startswith("datetime64")
+    assert df["VAR5"].dtype != object
+    assert df["VAR5"].dropna().tolist() == ["SP", "RJ"]
@@ -0,0 +1,45 @@
+import threading
+from core.history_utils import GerenciadorHistorico, formatar_historico
+
+def test_formatar_historico_lista_e_texto():
+    # Testa a compatibilidade com a lista de (role, msg) e com texto já formatado
+    assert formatar_historico([("user", "oi")]) == "<|user|>\noi\n"
+    assert formatar_historico("pronto") == "pronto"
+
+def test_gerenciador_resume_mensagens_antigas():
+    # Testa se apenas as últimas mensagens ficam literais e as antigas vão para o resumo
+    historico = GerenciadorHistorico(max_mensagens_literais=2)
+    for i in range(5):
+        historico.append(("user", f"pergunta {i}"))
+    assert list(historico) == [("user", "pergunta 3"), ("user", "pergunta 4")]
+    assert "pergunta 0" in historico.resumo
+    texto = historico.formatar("sql")
+    assert texto.startswith("<|summary|>")
+    assert texto.endswith("<|user|>\npergunta 4\n")
+
+def test_gerenciador_respeita_orcamento_e_reaproveita_formatacao():
+    # Testa se o texto formatado cabe no orçamento e é calculado uma vez por turno
+    historico = GerenciadorHistorico(max_mensagens_literais=10, orcamentos={"classificacao": 50})
+    for i in range(10):
+        historico.append(("assistant", "resposta longa " * 20))
+    texto = historico.formatar("classificacao")
+    assert len(texto) < 50 * 4 + 40
+    assert historico.formatar("classificacao") is texto
+    historico.append(("user", "nova"))
+    assert historico.formatar("classificacao") is not texto
+
+def test_resumidor_roda_em_segundo_plano_sem_bloquear():
+    # Testa se o resumo pela LLM não bloqueia adicionar() e substitui o resumo extrativo ao terminar
+    liberar = threading.Event()
+    def resumidor(resumo, mensagens):
+        liberar.wait(5)
+        return "resumo da LLM"
+    historico = GerenciadorHistorico(max_mensagens_literais=1, resumidor=resumidor)
+    historico.append(("user", "pergunta 0"))
+    historico.append(("user", "pergunta 1"))
+    historico.append(("user", "pergunta 2"))
+    assert "pergunta 0" in historico.formatar("sql")
+    liberar.set()
+    historico.aguardar_resumo(5)
+    assert historico.resumo == "resumo da LLM"
+    assert "resumo da LLM" in historico.formatar("sql")
@@ -0,0 +1,58 @@
+from unittest.mock import patch
+from core import llm_utils
+from core.intent_router import RoteadorIntencao, ClassificadorNaiveBayes, treinar_classificador
+from core.prompt_utils import load_resource
+
+SCHEMA = "Tabela credito: REF_DATE (DATE), TARGET (INTEGER), VAR2 (VARCHAR), IDADE (FLOAT), VAR5 (VARCHAR)\n"
+FAKE_CONFIG = {"AZURE_OPENAI_API_KEY": "fake", "AZURE_OPENAI_ENDPOINT": "fake", "AZURE_OPENAI_DEPLOYMENT_NAME": "fake", "AZURE_OPENAI_API_VERSION": "fake"}
+
+def criar_roteador(**kwargs):
+    return RoteadorIntencao(SCHEMA, load_resource("resources/data_dictionary.txt"), **kwargs)
+
+def test_roteador_casos_obvios():
+    # Testa saudações, agradecimentos e perguntas que citam termos do schema ou do dicionário
+    roteador = criar_roteador()
+    assert roteador.decidir("Olá!") == "casual_interaction"
+    assert roteador.decidir("Muito obrigada") == "casual_interaction"
+    assert roteador.decidir("Qual a média de idade por UF?") == "sql_request"
+    assert roteador.decidir("Quantos clientes estão inadimplentes?") == "sql_request"
+    assert roteador.decidir("Como você funciona?") is None
+
+def test_roteador_nao_decide_pedidos_de_explicacao():
+    # Testa se perguntas sobre o significado dos dados, que citam colunas, ficam com a LLM
+    roteador = criar_roteador()
+    assert roteador.decidir("Explique o que significa a variavel TARGET") is None
+    assert roteador.decidir("me ajude a entender os dados") is None
+    assert roteador.decidir("O que é a coluna VAR5?") is None
+    assert roteador.decidir("Quantos clientes têm TARGET igual a 1?") == "sql_request"
+
+def test_roteador_exige_pista_de_consulta_e_coluna():
+    # Testa agradecimentos e perguntas sobre o assistente que citam palavras genéricas, e palavras
+    # do dicionário sem relação com a consulta: nenhum deles vai direto para a geração de SQL
+    roteador = criar_roteador()
+    assert roteador.decidir("Obrigado pelos dados!") == "casual_interaction"
+    assert roteador.decidir("valeu pela tabela") == "casual_interaction"
+    assert roteador.decidir("Que dados você tem disponíveis?") is None
+    assert roteador.decidir("Qual o melhor time de futebol do estado?") is None
+    assert roteador.decidir("clientes") is None
+    assert roteador.decidir("Obrigado! Agora quantos clientes são do sexo feminino?") == "sql_request"
+    assert roteador.decidir("Liste a IDADE dos clientes acima de 60 anos") == "sql_request"
+
+def test_classificador_treinado_do_log(tmp_path):
+    # Testa o treino do classificador a partir do log de tráfego registrado
+    caminho_log = str(tmp_path / "log.jsonl")
+    roteador = criar_roteador(caminho_log=caminho_log)
+    for _ in range(3):
+        roteador.registrar_exemplo("me conta uma piada", "casual_interaction")
+        roteador.registrar_exemplo("qual foi o mês com mais registros", "sql_request")
+    modelo = treinar_classificador(caminho_log, str(tmp_path / "modelo.json"))
+    assert isinstance(modelo, ClassificadorNaiveBayes)
+    roteador = criar_roteador(caminho_modelo=str(tmp_path / "modelo.json"), limiar=0.7)
+    assert roteador.decidir("me conta outra piada") == "casual_interaction"
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_classificar_mensagem_sem_llm_quando_roteador_decide(mock_llm):
+    # Testa se a LLM não é chamada quando o roteador local tem confiança suficiente
+    result = llm_utils.classificar_mensagem("Qual a média de idade?", FAKE_CONFIG, [], roteador=criar_roteador())
+    assert result == "sql_request"
+    mock_llm.return_value.invoke.assert_not_called()
@@ -0,0 +1,121 @@
+import time
+import asyncio
+import threading
+import pytest
+from core.llm_scheduler import (
+    AgendadorLLM,
+    PrazoExcedido,
+    PRIORIDADE_BATCH,
+    erro_transitorio,
+    prazo_llm,
+    prioridade_llm,
+    sem_novas_tentativas_llm,
+)
+
+class ErroAPI(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+
+def test_repete_erros_transitorios_e_propaga_os_demais():
+    # Testa a nova tentativa em um 429 e a falha imediata em um erro que não é transitório
+    agendador = AgendadorLLM(espera_base=0)
+    respostas = iter([ErroAPI(429), "ok"])
+
+    def chamada():
+        resposta = next(respostas)
+        if isinstance(resposta, Exception):
+            raise resposta
+        return resposta
+
+    assert agendador.executar(chamada) == "ok"
+    with pytest.raises(ErroAPI):
+        agendador.executar(lambda: (_ for _ in ()).throw(ErroAPI(400)))
+    assert erro_transitorio(ErroAPI(503)) and not erro_transitorio(ValueError("coluna inválida"))
+
+def test_versao_assincrona_repete_e_desiste_apos_max_tentativas():
+    # Testa as tentativas da versão assíncrona até o limite configurado
+    agendador = AgendadorLLM(max_tentativas=3, espera_base=0)
+    chamadas = []
+
+    async def chamada():
+        chamadas.append(1)
+        raise ErroAPI(429)
+
+    with pytest.raises(ErroAPI):
+        asyncio.run(agendador.aexecutar(chamada))
+    assert len(chamadas) == 3
+
+def test_chamadas_interativas_passam_na_frente_do_batch():
+    # Testa a prioridade: com a única vaga ocupada, a chamada interativa pendente é atendida antes do batch
+    agendador = AgendadorLLM(max_concorrencia=1)
+    liberar = threading.Event()
+    ordem = []
+
+    def enfileirar(nome, prioridade=None):
+        def executar():
+            if prioridade is not None:
+                with prioridade_llm(prioridade):
+                    agendador.executar(lambda: ordem.append(nome))
+            else:
+                agendador.executar(lambda: ordem.append(nome))
+        thread = threading.Thread(target=executar)
+        thread.start()
+        return thread
+
+    ocupante = threading.Thread(target=lambda: agendador.executar(liberar.wait))
+    ocupante.start()
+    while agendador.em_andamento == 0:
+        time.sleep(0.01)
+    batch = enfileirar("batch", PRIORIDADE_BATCH)
+    time.sleep(0.05)
+    interativa = enfileirar("interativa")
+    time.sleep(0.05)
+    liberar.set()
+    for thread in (ocupante, batch, interativa):
+        thread.join(timeout=5)
+    assert ordem == ["interativa", "batch"]
+
+def test_prazo_excedido_quando_a_cota_esta_esgotada():
+    # Testa a desistência imediata quando a espera pela cota de RPM passaria do prazo
+    agendador = AgendadorLLM(rpm=6)
+    assert agendador.executar(lambda: "primeira") == "primeira"
+    inicio = time.monotonic()
+    with prazo_llm(0.5), pytest.raises(PrazoExcedido):
+        agendador.executar(lambda: "segunda")
+    assert time.monotonic() - inicio < 0.5
+    assert not agendador._pendentes
+
+def test_espera_cancelada_tira_o_bilhete_da_fila():
+    # Testa se uma tarefa cancelada enquanto espera a vez não deixa o bilhete travando a fila
+    agendador = AgendadorLLM(max_concorrencia=1)
+
+    async def cenario():
+        liberar = asyncio.Event()
+        ocupante = asyncio.create_task(agendador.aexecutar(liberar.wait))
+        await asyncio.sleep(0.01)
+        esperando = asyncio.create_task(agendador.aexecutar(lambda: asyncio.sleep(0)))
+        await asyncio.sleep(0.1)
+        esperando.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await esperando
+        assert not agendador._pendentes
+        liberar.set()
+        await ocupante
+        return await asyncio.wait_for(agendador.aexecutar(lambda: asyncio.sleep(0, "ok")), timeout=1)
+
+    assert asyncio.run(cenario()) == "ok"
+
+def test_sem_novas_tentativas_deixa_a_repeticao_para_quem_chama():
+    # Testa se, no bloco sem novas tentativas (modo batch), o erro transitório propaga na primeira falha
+    agendador = AgendadorLLM(espera_base=0)
+    chamadas = []
+
+    def chamada():
+        chamadas.append(1)
+        raise ErroAPI(429)
+
+    with sem_novas_tentativas_llm(), pytest.raises(ErroAPI):
+        agendador.executar(chamada)
+    assert len(chamadas) == 1
+    assert erro_transitorio("RateLimitError: Error code: 429") and not erro_transitorio("OperationalError: no such table")
@@ -24,4 +24,28 @@ def test_classificar_mensagem_sql_request(mock_llm):
     # Testa se a função classifica corretamente uma mensagem como sql_request
     mock_llm.return_value.invoke.return_value.content = "sql_request"
     result = llm_utils.classificar_mensagem("Qual a média de idade?", {"AZURE_OPENAI_API_KEY": "fake", "AZURE_OPENAI_ENDPOINT": "fake", "AZURE_OPENAI_DEPLOYMENT_NAME": "fake", "AZURE_OPENAI_API_VERSION": "fake"}, [])
-    assert result == "sql_request"
\ No newline at end of file
+    assert result == "sql_request"
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_obter_cliente_llm_reaproveita_cliente(mock_llm):
+    # Testa se o registro reaproveita o mesmo cliente para a mesma configuração e temperatura
+    config = {"AZURE_OPENAI_API_KEY": "fake", "AZURE_OPENAI_ENDPOINT": "fake", "AZURE_OPENAI_DEPLOYMENT_NAME": "fake", "AZURE_OPENAI_API_VERSION": "fake"}
+    primeiro = llm_utils.obter_cliente_llm(config, temperature=0)
+    segundo = llm_utils.obter_cliente_llm(config, temperature=0)
+    llm_utils.obter_cliente_llm(config, temperature=0.2)
+    assert primeiro is segundo
+    assert mock_llm.call_count == 2
+    estatisticas = llm_utils.obter_estatisticas_pool_llm()
+    assert estatisticas["hits"] == 1
+    assert estatisticas["misses"] == 2
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_responder_casual_interaction_stream(mock_llm):
+    # Testa se a versão em streaming gera os trechos e registra o tempo até o primeiro token
+    from core.metrics import resumo_metricas, limpar_metricas
+    limpar_metricas()
+    mock_llm.return_value.stream.return_value = iter([MagicMock(content="Olá"), MagicMock(content=""), MagicMock(content="!")])
+    config = {"AZURE_OPENAI_API_KEY": "fake", "AZURE_OPENAI_ENDPOINT": "fake", "AZURE_OPENAI_DEPLOYMENT_NAME": "fake", "AZURE_OPENAI_API_VERSION": "fake"}
+    trechos = list(llm_utils.responder_casual_interaction_stream([], "oi", config))
+    assert trechos == ["Olá", "!"]
+    assert resumo_metricas("llm.resposta_casual.ttft")["llm.resposta_casual.ttft"]["n"] == 1
@@ -0,0 +1,157 @@
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+from core import pipeline
+from core.sql_cache import CacheSQL
+from core.db_utils import Cancelamento
+
+FAKE_CONFIG = {"AZURE_OPENAI_API_KEY": "fake", "AZURE_OPENAI_ENDPOINT": "fake", "AZURE_OPENAI_DEPLOYMENT_NAME": "fake", "AZURE_OPENAI_API_VERSION": "fake"}
+
+def criar_contexto(modo):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE credito (IDADE INTEGER, VAR5 TEXT);"))
+        conn.execute(text("INSERT INTO credito VALUES (30, 'SP'), (40, 'RJ');"))
+    return {
+        "config": FAKE_CONFIG,
+        "engine": engine,
+        "schema": "Tabela credito: IDADE (INTEGER), VAR5 (TEXT)\n",
+        "sintax": "",
+        "data_dictionary": "",
+        "modo": modo,
+    }
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_processar_mensagem_modo_classico(mock_llm):
+    # Testa o fluxo em três chamadas: classificação, geração de SQL e resposta
+    respostas = iter(["sql_request", "```sql\nSELECT AVG(IDADE) AS media FROM credito;\n```", "A média é 35."])
+    mock_llm.return_value.invoke.side_effect = lambda prompt: type("R", (), {"content": next(respostas)})()
+    pergunta = "Qual a média de idade?"
+    resultado = pipeline.processar_mensagem(pergunta, [("user", pergunta)], criar_contexto("classic"))
+    assert resultado["tipo"] == "sql_request"
+    assert resultado["df"]["media"].iloc[0] == 35
+    assert resultado["resposta"] == "A média é 35."
+    assert mock_llm.return_value.invoke.call_count == 3
+    assert "classificacao" in resultado["tempos"]
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_processar_mensagem_modo_combinado(mock_llm):
+    # Testa se o modo combinado classifica e gera o SQL na mesma chamada
+    mock_llm.return_value.bind.return_value.invoke.return_value.content = '{"intent": "sql_request", "sql": "SELECT COUNT(*) AS n FROM credito;", "reply": null}'
+    mock_llm.return_value.invoke.return_value.content = "Há 2 clientes."
+    pergunta = "Quantos clientes existem?"
+    resultado = pipeline.processar_mensagem(pergunta, [("user", pergunta)], criar_contexto("combined"))
+    assert resultado["sql"] == "SELECT COUNT(*) AS n FROM credito;"
+    assert resultado["resposta"] == "Há 2 clientes."
+    assert mock_llm.return_value.bind.return_value.invoke.call_count == 1
+    assert mock_llm.return_value.invoke.call_count == 1
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_processar_mensagem_combinado_casual(mock_llm):
+    # Testa se a resposta casual do modo combinado dispensa a segunda chamada
+    mock_llm.return_value.bind.return_value.invoke.return_value.content = '{"intent": "casual_interaction", "sql": null, "reply": "Olá!"}'
+    resultado = pipeline.processar_mensagem("oi", [("user", "oi")], criar_contexto("combined"))
+    assert resultado["resposta"] == "Olá!"
+    mock_llm.return_value.invoke.assert_not_called()
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_processar_mensagem_stream(mock_llm):
+    # Testa se, em streaming, a resposta é um iterador e os tempos são completados ao consumi-lo
+    respostas = iter(["sql_request", "```sql\nSELECT COUNT(*) AS n FROM credito;\n```"])
+    mock_llm.return_value.invoke.side_effect = lambda prompt: type("R", (), {"content": next(respostas)})()
+    mock_llm.return_value.stream.return_value = iter([type("C", (), {"content": "Há "})(), type("C", (), {"content": "2."})()])
+    pergunta = "Quantos clientes existem?"
+    resultado = pipeline.processar_mensagem(pergunta, [("user", pergunta)], criar_contexto("classic"), stream=True)
+    assert "total" not in resultado["tempos"]
+    assert "".join(resultado["resposta"]) == "Há 2."
+    assert "primeiro_token" in resultado["tempos"]
+    assert "total" in resultado["tempos"]
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_aprocessar_mensagem_gera_resposta_e_grafico_em_paralelo(mock_llm):
+    # Testa se a versão assíncrona gera a resposta e o código do gráfico concorrentemente
+    import asyncio
+    from unittest.mock import AsyncMock
+    em_andamento = {"atual": 0, "maximo": 0}
+
+    async def ainvoke(prompt):
+        if "SQL query result" in prompt or "Python data assistant" in prompt:
+            em_andamento["atual"] += 1
+            em_andamento["maximo"] = max(em_andamento["maximo"], em_andamento["atual"])
+            await asyncio.sleep(0.05)
+            em_andamento["atual"] -= 1
+            conteudo = "Há 2 clientes." if "SQL query result" in prompt else "```python\nplt.bar(df['n'], df['n'])\n```"
+        elif "data request or a casual interaction" in prompt:
+            conteudo = "sql_request"
+        else:
+            conteudo = "```sql\nSELECT COUNT(*) AS n FROM credito;\n```"
+        return type("R", (), {"content": conteudo})()
+
+    mock_llm.return_value.ainvoke = AsyncMock(side_effect=ainvoke)
+    pergunta = "Quantos clientes existem?"
+    resultado = pipeline.executar_assincrono(
+        pipeline.aprocessar_mensagem(pergunta, [("user", pergunta)], criar_contexto("classic"), prefetch_grafico=True)
+    )
+    assert resultado["resposta"] == "Há 2 clientes."
+    assert "plt.bar" in resultado["codigo_grafico"]
+    assert em_andamento["maximo"] == 2
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_processar_mensagem_repara_sql_invalido_uma_vez(mock_llm):
+    # Uma coluna inexistente gera uma única chamada de reparo, com o erro exato no prompt
+    from types import SimpleNamespace
+    prompts = []
+    respostas = iter([
+        "sql_request",
+        "```sql\nSELECT AVG(IDADES) AS media FROM credito;\n```",
+        "```sql\nSELECT AVG(IDADE) AS media FROM credito;\n```",
+        "A média é 35.",
+    ])
+
+    def invoke(prompt):
+        prompts.append(prompt)
+        return type("R", (), {"content": next(respostas)})()
+
+    mock_llm.return_value.invoke.side_effect = invoke
+    contexto = criar_contexto("classic")
+    contexto["catalogo"] = SimpleNamespace(
+        tabelas={"credito": [("IDADE", "INTEGER"), ("VAR5", "TEXT")]}, texto=lambda: contexto["schema"]
+    )
+    pergunta = "Qual a média de idade?"
+    resultado = pipeline.processar_mensagem(pergunta, [("user", pergunta)], contexto)
+    assert "Coluna inexistente: IDADES" in prompts[2]
+    assert resultado["sql"] == "SELECT AVG(IDADE) AS media FROM credito;"
+    assert resultado["df"]["media"].iloc[0] == 35
+    assert resultado["validacao_sql"]["erros"] == []
+    assert mock_llm.return_value.invoke.call_count == 4
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_sql_so_entra_no_cache_depois_de_executado(mock_llm):
+    # Testa se o SQL que falha no banco não é armazenado e o que executa com sucesso é
+    contexto = criar_contexto("classic")
+    contexto["cache_sql"] = CacheSQL()
+    contexto["config"] = {**FAKE_CONFIG, "SQL_VALIDATION_ENABLED": "false"}
+    respostas = iter([
+        "sql_request", "```sql\nSELECT IDADE FROM tabela_inexistente;\n```", "Erro.",
+        "sql_request", "```sql\nSELECT COUNT(*) AS n FROM credito;\n```", "Há 2 clientes.",
+    ])
+    mock_llm.return_value.invoke.side_effect = lambda prompt: type("R", (), {"content": next(respostas)})()
+    pergunta = "Quantos clientes existem?"
+    resultado = pipeline.processar_mensagem(pergunta, [("user", pergunta)], contexto)
+    assert resultado["df"] is None
+    assert contexto["cache_sql"].entradas() == []
+    pipeline.processar_mensagem(pergunta, [("user", pergunta)], contexto)
+    assert contexto["cache_sql"].entradas() == [("quantos clientes existem", "SELECT COUNT(*) AS n FROM credito;")]
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_cancelamento_interrompe_as_etapas_seguintes(mock_llm):
+    # Testa se, cancelado durante a classificação, o turno não gera o SQL nem a resposta
+    cancelamento = Cancelamento()
+    def classificar(prompt):
+        cancelamento.cancelar()
+        return type("R", (), {"content": "sql_request"})()
+    mock_llm.return_value.invoke.side_effect = classificar
+    pergunta = "Qual a média de idade?"
+    resultado = pipeline.processar_mensagem(pergunta, [("user", pergunta)], criar_contexto("classic"), cancelamento=cancelamento)
+    assert resultado["resposta"] == pipeline.MENSAGEM_CANCELADA
+    assert mock_llm.return_value.invoke.call_count == 1
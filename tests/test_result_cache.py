@@ -0,0 +1,33 @@
+import pandas as pd
+from core.result_cache import CacheResultados, canonicalizar_sql, tabelas_referenciadas
+
+def test_canonicalizar_sql_normaliza_espacos_caixa_e_aliases():
+    # Testa se consultas equivalentes geram a mesma forma canônica
+    a = "select  c.VAR5, avg(c.IDADE) as media -- comentário\nfrom dbo.credito c group by c.VAR5;"
+    b = "SELECT t.VAR5, AVG(t.IDADE) AS media FROM dbo.credito AS t GROUP BY t.VAR5"
+    assert canonicalizar_sql(a) == canonicalizar_sql(b)
+    assert canonicalizar_sql("SELECT 'sp' AS uf") != canonicalizar_sql("SELECT 'SP' AS uf")
+
+def test_tabelas_referenciadas():
+    # Testa a extração das tabelas usadas em FROM e JOIN
+    sql = "SELECT * FROM [dbo].[credito] c INNER JOIN dbo.uf u ON c.VAR5 = u.sigla"
+    assert tabelas_referenciadas(sql) == {"credito", "uf"}
+
+def test_cache_resultados_respeita_orcamento_lru():
+    # Testa se o orçamento de memória descarta a entrada menos usada recentemente
+    df = pd.DataFrame({"x": range(1000)})
+    cache = CacheResultados()
+    cache.armazenar("a", df)
+    cache.max_bytes = cache.bytes_em_uso * 2
+    cache.armazenar("b", df)
+    cache.buscar("a")
+    cache.armazenar("c", df)
+    assert cache.buscar("b") is None
+    assert cache.buscar("a").equals(df)
+    assert cache.bytes_em_uso <= cache.max_bytes
+
+def test_cache_resultados_ttl():
+    # Testa a expiração por TTL
+    cache = CacheResultados(ttl_segundos=1e-9)
+    cache.armazenar("a", pd.DataFrame({"x": [1]}))
+    assert cache.buscar("a") is None
@@ -0,0 +1,55 @@
+import pandas as pd
+from sqlalchemy import create_engine, text
+from core.schema_catalog import CatalogoSchema, consultar_catalogo, formatar_schema, _formatar_tipo
+from core.result_cache import CacheResultados
+
+def criar_banco(caminho):
+    engine = create_engine(f"sqlite:///{caminho}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE credito (IDADE INTEGER, VAR5 VARCHAR(2));"))
+    return engine
+
+def test_consultar_catalogo_sqlite(tmp_path):
+    # Testa se uma única consulta retorna tabelas e colunas na ordem
+    engine = criar_banco(tmp_path / "banco.db")
+    tabelas = consultar_catalogo(engine)
+    assert tabelas == {"credito": [("IDADE", "INTEGER"), ("VAR5", "VARCHAR(2)")]}
+    assert formatar_schema(tabelas) == "Tabela credito: IDADE (INTEGER), VAR5 (VARCHAR(2))\n"
+
+def test_formatar_tipo_information_schema():
+    assert _formatar_tipo("varchar", 50, None, None) == "VARCHAR(50)"
+    assert _formatar_tipo("nvarchar", -1, None, None) == "NVARCHAR(max)"
+    assert _formatar_tipo("decimal", None, 10, 2) == "DECIMAL(10, 2)"
+    assert _formatar_tipo("int", None, 10, 0) == "INT"
+
+def test_catalogo_usa_snapshot_e_detecta_mudanca_de_ddl(tmp_path):
+    # Testa se o snapshot é reaproveitado e o catálogo só é relido quando o DDL muda
+    engine = criar_banco(tmp_path / "banco.db")
+    snapshot = tmp_path / "schema.json"
+    catalogo = CatalogoSchema(engine, caminho_snapshot=str(snapshot), intervalo_verificacao=0)
+    assert snapshot.exists()
+    assert catalogo.atualizar(forcar=False) is False
+
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE credito ADD COLUMN TARGET INTEGER;"))
+    # Um novo processo parte do snapshot antigo, sem consultar o banco
+    reaberto = CatalogoSchema(engine, caminho_snapshot=str(snapshot), intervalo_verificacao=0)
+    assert "TARGET" not in reaberto.texto()
+    assert reaberto.atualizar(forcar=False) is True
+    assert "TARGET (INTEGER)" in reaberto.texto()
+    assert reaberto.tabelas["credito"][-1] == ("TARGET", "INTEGER")
+    engine.dispose()
+
+def test_mudanca_de_ddl_invalida_resultados_da_tabela(tmp_path):
+    # Testa se a mudança de DDL detectada pelo catálogo invalida os resultados em cache da tabela
+    engine = criar_banco(tmp_path / "banco.db")
+    catalogo = CatalogoSchema(engine, intervalo_verificacao=0)
+    cache = CacheResultados()
+    catalogo.ao_alterar_tabela(cache.invalidar_tabela)
+    cache.armazenar("consulta", pd.DataFrame({"n": [1]}), tabelas=["credito"])
+    assert cache.buscar("consulta") is not None
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE credito ADD COLUMN TARGET INTEGER;"))
+    assert catalogo.atualizar(forcar=False) is True
+    assert cache.buscar("consulta") is None
+    engine.dispose()
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+from core.schema_retrieval import RecuperadorSchema, separar_dicionario, termos
+from core.metrics import limpar_metricas, resumo_metricas
+
+DICIONARIO = """Data Dictionary:
+IDADE: Idade do indivíduo.
+
+VAR5: Unidade da federação (estado brasileiro).
+
+Observação: valores monetários em reais.
+"""
+
+def criar_catalogo(n_tabelas=60):
+    tabelas = {
+        f"tabela_{i}": [(f"COL_{i}_{j}", "INTEGER") for j in range(8)]
+        for i in range(n_tabelas)
+    }
+    tabelas["credito"] = [("IDADE", "INTEGER"), ("VAR5", "VARCHAR(2)"), ("TARGET", "INTEGER")]
+    tabelas["pagamentos_cartao"] = [("VALOR_PAGO", "DECIMAL(10, 2)"), ("DATA_PAGAMENTO", "DATE")]
+    return SimpleNamespace(tabelas=tabelas, fingerprint="v1")
+
+def test_termos_quebra_identificadores():
+    assert termos("DATA_PAGAMENTO valorPago") == ["data", "pagame", "valor", "pago"]
+
+def test_separar_dicionario():
+    cabecalho, entradas = separar_dicionario(DICIONARIO)
+    assert cabecalho == "Data Dictionary:"
+    assert list(entradas) == ["IDADE", "VAR5", "Observação"]
+
+def test_recuperador_seleciona_tabelas_relevantes_e_registra_reducao(tmp_path):
+    limpar_metricas()
+    log = tmp_path / "selecao.jsonl"
+    recuperador = RecuperadorSchema(criar_catalogo(), DICIONARIO, top_k_tabelas=2, min_tokens=0, caminho_log=str(log))
+    schema, dicionario = recuperador.selecionar("Qual a média de idade por estado?")
+    assert schema.startswith("Tabela credito:")
+    assert "tabela_1:" not in schema
+    assert "VAR5:" in dicionario and "Observação" in dicionario
+    assert resumo_metricas("retrieval.")["retrieval.reducao"]["max"] > 0.5
+    assert log.read_text(encoding="utf-8").count("\n") == 1
+
+def test_recuperador_mantem_schema_pequeno_ou_sem_termos_em_comum():
+    catalogo = criar_catalogo(n_tabelas=1)
+    recuperador = RecuperadorSchema(catalogo, DICIONARIO)
+    schema, dicionario = recuperador.selecionar("Qual a média de idade?")
+    assert "tabela_0" in schema and dicionario == DICIONARIO
+    recuperador = RecuperadorSchema(criar_catalogo(), DICIONARIO, min_tokens=0)
+    schema, _ = recuperador.selecionar("xyz")
+    assert "tabela_59" in schema
+
+def test_recuperador_usa_embeddings_salvos(tmp_path):
+    chamadas = []
+    def embedding(texto):
+        chamadas.append(texto)
+        return [1.0, 0.0] if "pagame" in " ".join(termos(texto)) or "pagamento" in texto.lower() else [0.0, 1.0]
+    indice = tmp_path / "indice.json"
+    recuperador = RecuperadorSchema(
+        criar_catalogo(), DICIONARIO, top_k_tabelas=1, min_tokens=0,
+        funcao_embedding=embedding, caminho_indice=str(indice),
+    )
+    schema, _ = recuperador.selecionar("valor dos pagamentos")
+    assert schema.startswith("Tabela pagamentos_cartao:")
+    assert indice.exists()
+    chamadas.clear()
+    RecuperadorSchema(
+        criar_catalogo(), DICIONARIO, top_k_tabelas=1, min_tokens=0,
+        funcao_embedding=embedding, caminho_indice=str(indice),
+    ).selecionar("valor dos pagamentos")
+    # Com o índice em disco, só a pergunta precisa de embedding
+    assert len(chamadas) == 1
+
+def test_recuperador_pontua_contra_a_versao_do_indice_do_inicio_da_chamada():
+    catalogo = criar_catalogo()
+    def embedding(texto):
+        if texto == "valor dos pagamentos" and catalogo.fingerprint == "v1":
+            # DDL no meio da chamada: outra seleção reindexa com um catálogo menor
+            catalogo.tabelas = {"credito": catalogo.tabelas["credito"]}
+            catalogo.fingerprint = "v2"
+            assert recuperador.selecionar("idade")[0].startswith("Tabela credito:")
+        return [1.0]
+    recuperador = RecuperadorSchema(catalogo, DICIONARIO, top_k_tabelas=1, min_tokens=0, funcao_embedding=embedding)
+    schema, _ = recuperador.selecionar("valor dos pagamentos")
+    assert schema.startswith("Tabela pagamentos_cartao:")
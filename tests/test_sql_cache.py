@@ -0,0 +1,66 @@
+import time
+from unittest.mock import patch
+from core import llm_utils
+from core.sql_cache import CacheSQL, normalizar_pergunta
+
+FAKE_CONFIG = {"AZURE_OPENAI_API_KEY": "fake", "AZURE_OPENAI_ENDPOINT": "fake", "AZURE_OPENAI_DEPLOYMENT_NAME": "fake", "AZURE_OPENAI_API_VERSION": "fake"}
+
+def test_normalizar_pergunta():
+    # Testa se acentos, pontuação, caixa e espaços extras são ignorados
+    assert normalizar_pergunta("  Qual a MÉDIA de idade por UF? ") == "qual a media de idade por uf"
+
+def test_operadores_de_comparacao_nao_compartilham_a_chave():
+    # Testa se "idade > 30" e "idade < 30" (e as variações com = e ≠) ficam com chaves diferentes no cache
+    perguntas = ["Quantos clientes têm idade > 30?", "Quantos clientes têm idade < 30?",
+                 "Quantos clientes têm idade >= 30?", "Quantos clientes têm idade ≠ 30?"]
+    assert len({normalizar_pergunta(p) for p in perguntas}) == 4
+    assert normalizar_pergunta("idade>=30") == normalizar_pergunta("idade ≥ 30")
+    cache = CacheSQL()
+    cache.armazenar(perguntas[0], "ctx", "SELECT COUNT(*) FROM credito WHERE IDADE > 30")
+    assert cache.buscar(perguntas[1], "ctx") is None
+    assert cache.buscar(perguntas[0], "ctx") == "SELECT COUNT(*) FROM credito WHERE IDADE > 30"
+
+def test_cache_acerto_exato_e_persistencia(tmp_path):
+    # Testa se o SQL armazenado é encontrado por outra instância usando o mesmo arquivo
+    caminho = str(tmp_path / "cache.sqlite3")
+    cache = CacheSQL(caminho=caminho)
+    contexto = cache.chave_contexto("schema", "sintax", "dicionario")
+    cache.armazenar("Qual a média de idade por UF?", contexto, "SELECT 1;")
+    outro = CacheSQL(caminho=caminho)
+    assert outro.buscar("qual a media de idade por uf", contexto) == "SELECT 1;"
+    assert outro.buscar("qual a media de idade por uf", "outro-contexto") is None
+
+def test_cache_ttl_e_lru():
+    # Testa a expiração por TTL e o descarte da entrada menos usada recentemente
+    cache = CacheSQL(max_entradas=2, ttl_segundos=3600)
+    cache.armazenar("a", "ctx", "SELECT 1;")
+    cache.armazenar("b", "ctx", "SELECT 2;")
+    time.sleep(0.01)
+    cache.buscar("a", "ctx")
+    cache.armazenar("c", "ctx", "SELECT 3;")
+    assert cache.buscar("b", "ctx") is None
+    assert cache.buscar("a", "ctx") == "SELECT 1;"
+    cache.ttl_segundos = 1e-9
+    assert cache.buscar("a", "ctx") is None
+
+def test_cache_similaridade_embedding():
+    # Testa o acerto por similaridade quando não há acerto exato
+    vetores = {"quantos clientes existem": [1.0, 0.0], "qual o total de clientes": [0.99, 0.05], "media de idade": [0.0, 1.0]}
+    cache = CacheSQL(funcao_embedding=lambda texto: vetores[texto], limiar_similaridade=0.9)
+    cache.armazenar("Quantos clientes existem?", "ctx", "SELECT COUNT(*) FROM clientes;")
+    assert cache.buscar("Qual o total de clientes?", "ctx") == "SELECT COUNT(*) FROM clientes;"
+    assert cache.buscar("Média de idade", "ctx") is None
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_gerar_sql_llm_chat_usa_cache(mock_llm):
+    # Testa se a geração não armazena o SQL (só o pipeline, após executá-lo) e se um acerto não chama a LLM
+    mock_llm.return_value.invoke.return_value.content = "```sql\nSELECT AVG(IDADE) FROM credito;\n```"
+    cache = CacheSQL()
+    pergunta = "Qual a média de idade?"
+    history = [("user", pergunta)]
+    resposta = llm_utils.gerar_sql_llm_chat(pergunta, "schema", FAKE_CONFIG, "sintax", "dic", history, cache=cache)
+    assert cache.entradas() == []
+    cache.armazenar(pergunta, cache.chave_contexto("schema", "sintax", "dic", history, pergunta), llm_utils.extrair_sql_da_resposta(resposta))
+    resposta = llm_utils.gerar_sql_llm_chat(pergunta, "schema", FAKE_CONFIG, "sintax", "dic", history, cache=cache)
+    assert llm_utils.extrair_sql_da_resposta(resposta) == "SELECT AVG(IDADE) FROM credito;"
+    assert mock_llm.return_value.invoke.call_count == 1
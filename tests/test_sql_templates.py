@@ -0,0 +1,90 @@
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+from core import pipeline
+from core.db_utils import executar_sql
+from core.sql_cache import CacheSQL
+from core.sql_templates import extrair_formato, minerar_templates, BibliotecaTemplatesSQL
+
+FAKE_CONFIG = {"AZURE_OPENAI_API_KEY": "fake", "AZURE_OPENAI_ENDPOINT": "fake", "AZURE_OPENAI_DEPLOYMENT_NAME": "fake", "AZURE_OPENAI_API_VERSION": "fake"}
+
+PARES = [
+    ("Quantos clientes inadimplentes em SP?", "SELECT COUNT(*) AS n FROM credito WHERE TARGET = 1 AND VAR5 = 'SP';"),
+    ("quantos clientes inadimplentes em RJ", "SELECT COUNT(*) AS n FROM credito WHERE TARGET = 1 AND VAR5 = 'RJ'"),
+    ("Quantos clientes inadimplentes em MG", "SELECT COUNT(*) AS n FROM credito WHERE TARGET = 1 AND VAR5 = 'MG'"),
+]
+
+def criar_engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE credito (VAR5 TEXT, TARGET INTEGER);"))
+        conn.execute(text("INSERT INTO credito VALUES ('SP', 1), ('MG', 1), ('MG', 1), ('MG', 0);"))
+    return engine
+
+def test_extrair_formato_troca_literais_por_slots():
+    formato, sql, valores = extrair_formato(*PARES[0])
+    assert formato[:4] == ("quantos", "clientes", "inadimplentes", "em")
+    assert sql == "SELECT COUNT(*) AS n FROM credito WHERE TARGET = 1 AND VAR5 = :p0"
+    assert valores == [("texto", "SP")]
+    # O número de linhas do TOP não é parâmetro da pergunta
+    assert extrair_formato("top 10 idades", "SELECT TOP (10) IDADE FROM credito") is None
+
+def test_minerar_templates_exige_valores_diferentes_e_contexto_proprio():
+    assert minerar_templates(PARES[:1] * 3) == []
+    continuacoes = [("e em MG?", "SELECT COUNT(*) FROM credito WHERE VAR5 = 'MG'"),
+                    ("e em BA?", "SELECT COUNT(*) FROM credito WHERE VAR5 = 'BA'")]
+    assert minerar_templates(continuacoes) == []
+    templates = minerar_templates(PARES[:2])
+    assert len(templates) == 1
+    template = templates[0]
+    assert template.casar("quantos clientes inadimplentes em rj?") == {"p0": "RJ"}
+    assert template.casar("quantos clientes inadimplentes em 2023") is None
+    assert template.sql_preenchido({"p0": "MG"}).endswith("VAR5 = 'MG'")
+
+def test_template_so_aceita_valores_vistos_na_mineracao():
+    # Testa se valores fora dos exemplos ("janeiro", "geral", um UF novo) não casam e vão para a LLM
+    biblioteca = BibliotecaTemplatesSQL()
+    for pergunta, sql in PARES[:2]:
+        biblioteca.registrar(pergunta, sql)
+    for valor in ("janeiro", "geral", "total", "MG"):
+        assert biblioteca.casar(f"Quantos clientes inadimplentes em {valor}?") is None
+    biblioteca.registrar(*PARES[2])
+    biblioteca.atualizar()
+    template, parametros = biblioteca.casar("quantos clientes inadimplentes em mg")
+    assert parametros == {"p0": "MG"}
+
+def test_template_minerado_de_maior_que_nao_casa_com_menor_que():
+    # Testa se o operador fica fixo no formato: o template de "idade > X" não responde "idade < X"
+    templates = minerar_templates([
+        ("quantos clientes tem idade > 30", "SELECT COUNT(*) AS n FROM credito WHERE IDADE > 30"),
+        ("quantos clientes tem idade > 40", "SELECT COUNT(*) AS n FROM credito WHERE IDADE > 40"),
+    ])
+    assert len(templates) == 1
+    assert templates[0].casar("quantos clientes tem idade > 50") == {"p0": 50}
+    assert templates[0].casar("quantos clientes tem idade < 50") is None
+    assert templates[0].casar("quantos clientes tem idade >= 50") is None
+    assert templates[0].casar("quantos clientes tem idade maior que 50") is None
+
+def test_executar_sql_com_parametros_ligados():
+    df = executar_sql(criar_engine(), "SELECT COUNT(*) AS n FROM credito WHERE VAR5 = :p0", parametros={"p0": "MG"})
+    assert df["n"].iloc[0] == 3
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_processar_mensagem_usa_template_sem_gerar_sql(mock_llm):
+    # A pergunta casa com o template minerado do cache: só a resposta em linguagem natural chama a LLM
+    cache = CacheSQL()
+    for pergunta, sql in PARES:
+        cache.armazenar(pergunta, "ctx", sql)
+    mock_llm.return_value.invoke.side_effect = lambda prompt: type("R", (), {"content": "São 2."})()
+    contexto = {
+        "config": FAKE_CONFIG, "engine": criar_engine(), "schema": "", "sintax": "", "data_dictionary": "",
+        "modo": "classic", "templates_sql": BibliotecaTemplatesSQL(cache),
+    }
+    pergunta = "Quantos clientes inadimplentes em MG?"
+    resultado = pipeline.processar_mensagem(pergunta, [("user", pergunta)], contexto)
+    assert resultado["tipo"] == "sql_request"
+    assert resultado["df"]["n"].iloc[0] == 2
+    assert resultado["sql"] == "SELECT COUNT(*) AS n FROM credito WHERE TARGET = 1 AND VAR5 = 'MG'"
+    assert resultado["template_sql"].endswith("VAR5 = :p0")
+    assert mock_llm.return_value.invoke.call_count == 1
+    assert "geracao_sql" not in resultado["tempos"]
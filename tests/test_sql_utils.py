@@ -0,0 +1,41 @@
+from core.sql_utils import aplicar_limite_linhas, dialeto_da_sintaxe, tokenizar_sql
+
+def test_tokenizar_sql_ignora_comentarios():
+    # Testa se os comentários do SQL não viram tokens
+    tokens = tokenizar_sql("SELECT a -- comentário\nFROM t;")
+    assert [valor for _, valor, _ in tokens] == ["SELECT", "a", "FROM", "t", ";"]
+
+def test_limite_mssql_injeta_top():
+    # Testa se o limite de linhas entra como TOP (N) após o DISTINCT no T-SQL
+    sql = "SELECT DISTINCT uf, COUNT(*) AS n FROM credito GROUP BY uf;"
+    assert aplicar_limite_linhas(sql, 100, "mssql") == "SELECT DISTINCT TOP (100) uf, COUNT(*) AS n FROM credito GROUP BY uf"
+
+def test_limite_mssql_reduz_top_maior_e_mantem_menor():
+    # Testa se um TOP maior que o limite é reduzido e um menor é mantido
+    assert aplicar_limite_linhas("SELECT TOP 5000 * FROM t", 100, "mssql") == "SELECT TOP 100 * FROM t"
+    assert aplicar_limite_linhas("SELECT TOP (10) * FROM t;", 100, "mssql") == "SELECT TOP (10) * FROM t"
+
+def test_limite_mssql_usa_select_principal_da_cte():
+    # Testa se o TOP vai para o SELECT principal, e não para o da CTE
+    sql = "WITH x AS (SELECT uf FROM credito) SELECT uf FROM x"
+    assert aplicar_limite_linhas(sql, 10, "mssql") == "WITH x AS (SELECT uf FROM credito) SELECT TOP (10) uf FROM x"
+
+def test_limite_nao_altera_consultas_inseguras():
+    # Testa se UNION, OFFSET/FETCH e TOP PERCENT ficam sem limite injetado
+    for sql in (
+        "SELECT a FROM t UNION SELECT a FROM u",
+        "SELECT a FROM t ORDER BY a OFFSET 0 ROWS FETCH NEXT 10 ROWS ONLY",
+        "SELECT TOP 10 PERCENT a FROM t",
+    ):
+        assert aplicar_limite_linhas(sql, 10, "mssql") == sql
+
+def test_limite_outros_dialetos_usa_limit():
+    # Testa se os outros dialetos usam LIMIT no nível superior da consulta
+    assert aplicar_limite_linhas("SELECT * FROM t -- fim", 10, "sqlite") == "SELECT * FROM t LIMIT 10"
+    assert aplicar_limite_linhas("SELECT * FROM t LIMIT 500", 10, "sqlite") == "SELECT * FROM t LIMIT 10"
+    assert aplicar_limite_linhas("SELECT * FROM (SELECT * FROM t LIMIT 500) x", 10, "sqlite").endswith("x LIMIT 10")
+
+def test_dialeto_da_sintaxe():
+    # Testa a detecção do dialeto a partir do arquivo de sintaxe
+    assert dialeto_da_sintaxe("T-SQL (Transact-SQL)\n- Use TOP (N) instead of LIMIT") == "mssql"
+    assert dialeto_da_sintaxe("PostgreSQL") is None
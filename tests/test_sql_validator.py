@@ -0,0 +1,39 @@
+from core import sql_validator
+from core.sql_validator import validar_sql, corrigir_dialeto
+
+TABELAS = {"credito": [("IDADE", "INT"), ("VAR5", "VARCHAR(2)"), ("REF_DATE", "DATE")]}
+
+def test_corrigir_dialeto_troca_limit_por_top():
+    sql, correcoes = corrigir_dialeto("SELECT VAR5, COUNT(*) AS n FROM credito GROUP BY VAR5 ORDER BY n DESC LIMIT 5;")
+    assert sql == "SELECT TOP (5) VAR5, COUNT(*) AS n FROM credito GROUP BY VAR5 ORDER BY n DESC"
+    assert correcoes == ["LIMIT 5 trocado por TOP (5)"]
+
+def test_corrigir_dialeto_troca_aspas_e_funcoes():
+    sql, correcoes = corrigir_dialeto('SELECT "VAR5", LENGTH(VAR5), IFNULL(IDADE, 0) FROM credito')
+    assert sql == "SELECT [VAR5], LEN(VAR5), ISNULL(IDADE, 0) FROM credito"
+    assert len(correcoes) == 3
+    # Outros dialetos não são alterados
+    assert corrigir_dialeto("SELECT * FROM credito LIMIT 5", "sqlite") == ("SELECT * FROM credito LIMIT 5", [])
+
+def test_validar_sql_aponta_colunas_e_tabelas_inexistentes():
+    assert validar_sql("SELECT c.RENDA FROM credito c", TABELAS)["erros"] == ["Coluna inexistente: c.RENDA"]
+    assert "Tabela inexistente: clientes" in validar_sql("SELECT IDADE FROM clientes", TABELAS)["erros"]
+
+def test_validar_sql_aceita_apelidos_ctes_e_datepart():
+    consultas = [
+        "SELECT VAR5, AVG(IDADE) AS media FROM credito GROUP BY VAR5 ORDER BY media DESC",
+        "WITH x AS (SELECT VAR5 AS uf FROM credito) SELECT x.uf FROM x",
+        "SELECT DATEPART(year, REF_DATE) AS ano, COUNT(*) FROM credito GROUP BY DATEPART(year, REF_DATE)",
+        "SELECT CAST(idade AS FLOAT) FROM CREDITO WITH (NOLOCK) WHERE VAR5 = 'SP'",
+    ]
+    for consulta in consultas:
+        assert validar_sql(consulta, TABELAS)["erros"] == []
+
+def test_validar_sql_aponta_erro_de_sintaxe():
+    erros = validar_sql("SELECT FROM WHERE", TABELAS)["erros"]
+    assert len(erros) == 1 and erros[0].startswith("Erro de sintaxe")
+
+def test_validar_sql_sem_sqlglot_usa_analise_lexica(monkeypatch):
+    monkeypatch.setattr(sql_validator, "sqlglot", None)
+    assert validar_sql("SELECT c.RENDA, VAR5 FROM credito c", TABELAS)["erros"] == ["Coluna inexistente: RENDA"]
+    assert validar_sql("SELECT VAR5, COUNT(*) AS n FROM credito c GROUP BY VAR5 ORDER BY n", TABELAS)["erros"] == []
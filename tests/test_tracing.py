@@ -0,0 +1,104 @@
+import json
+import asyncio
+import pytest
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from core import tracing, llm_utils
+from core.db_utils import executar_sql
+
+CONFIG = {"AZURE_OPENAI_API_KEY": "fake", "AZURE_OPENAI_ENDPOINT": "fake", "AZURE_OPENAI_DEPLOYMENT_NAME": "fake", "AZURE_OPENAI_API_VERSION": "fake"}
+
+@pytest.fixture(autouse=True)
+def limpar_spans():
+    tracing.limpar_tracing()
+    yield
+    tracing._configuracao["caminho_jsonl"] = None
+    tracing.limpar_tracing()
+
+def test_spans_aninhados_e_atributos_somados():
+    # Testa se o span filho herda o trace do pai e se os valores somados se acumulam
+    with tracing.span("pai") as pai:
+        with tracing.span("filho"):
+            tracing.somar_no_span(prompt_tokens=10)
+            tracing.somar_no_span(prompt_tokens=5)
+    filho = tracing.spans_recentes("filho")[0]
+    assert filho["pai_id"] == pai.span_id
+    assert filho["trace_id"] == pai.trace_id
+    assert filho["atributos"]["prompt_tokens"] == 15
+    assert tracing.span_atual() is None
+
+def test_rastrear_registra_erro_e_funciona_com_corrotinas_e_geradores():
+    # Testa se o decorador cobre funções comuns, corrotinas e geradores (filho do span onde foi criado)
+    @tracing.rastrear("falha")
+    def falhar():
+        raise ValueError("boom")
+
+    @tracing.rastrear("corrotina")
+    async def corrotina():
+        return 1
+
+    @tracing.rastrear("gerador")
+    def gerador():
+        yield from (1, 2)
+
+    with pytest.raises(ValueError):
+        falhar()
+    assert asyncio.run(corrotina()) == 1
+    with tracing.span("turno") as turno:
+        iterador = gerador()
+    assert list(iterador) == [1, 2]
+    assert tracing.spans_recentes("falha")[0]["erro"] == "ValueError: boom"
+    assert tracing.spans_recentes("corrotina")
+    assert tracing.spans_recentes("gerador")[0]["pai_id"] == turno.span_id
+
+def test_exportar_prometheus_e_jsonl(tmp_path):
+    # Testa o histograma/contadores no formato do Prometheus e a gravação dos spans em JSONL
+    caminho = tmp_path / "spans.jsonl"
+    tracing.configurar_tracing({"TRACING_JSONL_PATH": str(caminho)})
+    with tracing.span("db.executar_sql", linhas=3):
+        pass
+    texto = tracing.exportar_prometheus()
+    assert 'chatbot_span_duration_seconds_count{span="db.executar_sql"} 1' in texto
+    assert 'chatbot_span_duration_seconds_bucket{span="db.executar_sql",le="+Inf"} 1' in texto
+    assert 'chatbot_span_attribute_total{span="db.executar_sql",attribute="linhas"} 3' in texto
+    linhas = caminho.read_text(encoding="utf-8").splitlines()
+    assert json.loads(linhas[0])["nome"] == "db.executar_sql"
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_chamadas_llm_registram_tokens_no_span(mock_llm):
+    # Testa se a chamada à LLM abre seu span e acumula os tokens informados pela API
+    resposta = mock_llm.return_value.invoke.return_value
+    resposta.content = "sql_request"
+    resposta.usage_metadata = {"input_tokens": 120, "output_tokens": 3}
+    with tracing.span("pipeline.turno") as turno:
+        llm_utils.classificar_mensagem("Qual a média de idade?", CONFIG, [])
+    registro = tracing.spans_recentes("llm.classificacao")[0]
+    assert registro["pai_id"] == turno.span_id
+    atributos = registro["atributos"]
+    assert (atributos["chamadas_llm"], atributos["prompt_tokens"], atributos["completion_tokens"]) == (1, 120, 3)
+
+def test_executar_sql_registra_linhas_e_bytes():
+    # Testa se a execução do SQL anota linhas, bytes e truncamento no span
+    engine = create_engine("sqlite:///:memory:")
+    executar_sql(engine, "SELECT 1 AS a UNION ALL SELECT 2", max_linhas=1)
+    registro = tracing.spans_recentes("db.executar_sql")[0]
+    assert registro["atributos"]["linhas"] == 1
+    assert registro["atributos"]["truncado"] is True
+    assert registro["atributos"]["bytes"] > 0
+
+@patch("core.llm_utils.AzureChatOpenAI")
+def test_span_do_turno_em_streaming_fecha_ao_consumir_a_resposta(mock_llm):
+    # Testa se o span pipeline.turno só é registrado depois do stream e inclui a resposta como filha
+    from core import pipeline
+    from tests.test_pipeline import criar_contexto
+    respostas = iter(["sql_request", "```sql\nSELECT COUNT(*) AS n FROM credito;\n```"])
+    mock_llm.return_value.invoke.side_effect = lambda prompt: type("R", (), {"content": next(respostas)})()
+    mock_llm.return_value.stream.return_value = iter([type("C", (), {"content": "Há 2."})()])
+    pergunta = "Quantos clientes existem?"
+    resultado = pipeline.processar_mensagem(pergunta, [("user", pergunta)], criar_contexto("classic"), stream=True)
+    assert tracing.span_atual() is None
+    assert not tracing.spans_recentes("pipeline.turno")
+    assert "".join(resultado["resposta"]) == "Há 2."
+    turno = tracing.spans_recentes("pipeline.turno")[0]
+    assert turno["duracao"] >= resultado["tempos"]["resposta_natural"]
+    assert any(registro["pai_id"] == turno["span_id"] for registro in tracing.spans_recentes())
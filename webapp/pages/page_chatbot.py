@@ -13,26 +13,36 @@ Funcionalidades:
 import streamlit as st
 import sys
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Ajusta o sys.path para importar módulos do projeto
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-from config import load_config
-from core.db_utils import create_db_engine, get_schema, executar_sql
+from config import load_config, get_setting
 from core.llm_utils import (
-    gerar_sql_llm_chat,
-    extrair_sql_da_resposta,
-    gerar_resposta_natural,
-    classificar_mensagem,
-    responder_casual_interaction,
     gerar_codigo_grafico_llm,
     is_safe_plot_code,
     limpar_codigo_plot,
+    precarregar_cliente_llm,
 )
-from core.prompt_utils import load_resource
+from core.db_utils import Cancelamento
+from core.df_utils import fingerprint_dataframe
+from core.chart_planner import gerar_codigo_grafico_local
+from core.chart_renderer import renderizar_grafico, obter_pool_graficos, obter_cache_graficos
+from core.tracing import resumo_spans
+from core.pipeline import (
+    carregar_contexto,
+    criar_historico,
+    processar_mensagem,
+    formatar_tempos,
+    usar_grafico_local,
+    MENSAGEM_CANCELADA,
+)
+
+# Fragmentos (st.fragment) executam de novo só a parte da página que mudou; versões antigas
+# do Streamlit têm apenas st.experimental_fragment e, sem nenhum dos dois, a página inteira é executada
+fragmento = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda funcao: funcao)
 
 # Configuração da página Streamlit
 st.set_page_config(page_title="LLM Data Analyzer", page_icon="🎲")
@@ -50,6 +60,50 @@ sugestoes = [
     "Qual o número de clientes por classe social?"
 ]
 
+MENSAGEM_RECURSOS_INDISPONIVEIS = (
+    "Desculpe, não foi possível carregar os recursos do chatbot (banco de dados ou LLM). Tente novamente em instantes."
+)
+
+def _carregar_recursos(config):
+    contexto = carregar_contexto(config)
+    precarregar_cliente_llm()
+    return contexto
+
+@st.cache_resource(show_spinner=False)
+def obter_contexto_compartilhado():
+    """
+    Carrega uma única vez por processo a configuração e inicia, em segundo plano, o carregamento
+    do contexto do pipeline (engine e pool de conexões, catálogo do schema, caches) e do cliente
+    da LLM, compartilhados por todas as sessões. A página é exibida sem esperar por ele.
+    Retorna (config, futuro do contexto).
+    """
+    config = load_config()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="carregamento")
+    futuro = executor.submit(_carregar_recursos, config)
+    executor.shutdown(wait=False)
+    return config, futuro
+
+def obter_contexto():
+    """
+    Retorna o contexto do pipeline, esperando o carregamento em segundo plano se ainda não terminou.
+    Um carregamento que falhou (por exemplo, banco inacessível na inicialização) ficaria em cache no
+    processo até o servidor reiniciar: ele é descartado e refeito uma vez; se falhar de novo, retorna
+    None (e a próxima mensagem tenta outra vez).
+    """
+    for _ in range(2):
+        futuro = st.session_state.carregamento
+        if not futuro.done():
+            with st.spinner("Carregando recursos..."):
+                erro = futuro.exception()
+        else:
+            erro = futuro.exception()
+        if erro is None:
+            return futuro.result()
+        print("Erro ao carregar os recursos do chatbot:", str(erro))
+        obter_contexto_compartilhado.clear()
+        st.session_state.config, st.session_state.carregamento = obter_contexto_compartilhado()
+    return None
+
 def inicializar_sessao():
     """
     Inicializa variáveis de sessão necessárias para o funcionamento do chatbot.
@@ -58,18 +112,84 @@ def inicializar_sessao():
         st.session_state.history = [
             ("assistant", "Olá! 👋 Eu sou o assistente de análise de dados da Neurotech. Como posso te ajudar hoje?")
         ]
-    if "engine" not in st.session_state:
-        config = load_config()
-        st.session_state.config = config
-        st.session_state.engine = create_db_engine(config["SQLALCHEMY_DATABASE_URI"])
-        st.session_state.schema = get_schema(st.session_state.engine, schema_name="dbo")
-        st.session_state.sintax = load_resource("resources/sintax.txt")
-        st.session_state.data_dictionary = load_resource("resources/data_dictionary.txt")
+    if "carregamento" not in st.session_state:
+        st.session_state.config, st.session_state.carregamento = obter_contexto_compartilhado()
+    if "historico_prompt" not in st.session_state:
+        # Histórico enviado à LLM: limitado por tokens, com resumo das mensagens antigas
+        st.session_state.historico_prompt = criar_historico(st.session_state.config)
+        for mensagem in st.session_state.history:
+            st.session_state.historico_prompt.append(mensagem)
+
+def processar_com_cancelamento(user_message):
+    """
+    Executa o pipeline em uma thread de trabalho e exibe um botão para cancelar a consulta.
+    O clique no botão interrompe esta execução do script (rerun do Streamlit); o bloco finally
+    então cancela a consulta SQL em andamento e registra o cancelamento no histórico.
+    Retorna o resultado do pipeline (ou, se os recursos não puderam ser carregados, um resultado
+    com MENSAGEM_RECURSOS_INDISPONIVEIS).
+    """
+    contexto = obter_contexto()
+    if contexto is None:
+        return {
+            "tipo": None, "resposta": MENSAGEM_RECURSOS_INDISPONIVEIS, "sql": None, "df": None,
+            "codigo_grafico": None, "modo": None, "tempos": {},
+        }
+    cancelamento = Cancelamento()
+    executor = ThreadPoolExecutor(max_workers=1)
+    futuro = executor.submit(
+        processar_mensagem,
+        user_message, st.session_state.historico_prompt, contexto,
+        stream=get_setting(st.session_state.config, "STREAMING_ENABLED", True, bool),
+        prefetch_grafico=get_setting(st.session_state.config, "CHART_PREFETCH", False, bool),
+        cancelamento=cancelamento,
+    )
+    concluido = False
+    try:
+        botao = st.empty()
+        botao.button("Cancelar consulta", key=f"cancelar_{len(st.session_state.history)}")
+        status = st.empty()
+        inicio = time.perf_counter()
+        while not futuro.done():
+            # Cada atualização da tela dá ao Streamlit a chance de interromper o script
+            status.caption(f"Processando... {time.perf_counter() - inicio:.0f}s")
+            time.sleep(0.2)
+        botao.empty()
+        status.empty()
+        concluido = True
+    finally:
+        executor.shutdown(wait=False)
+        if not concluido:
+            cancelamento.cancelar()
+            st.session_state.history.append(("assistant", MENSAGEM_CANCELADA))
+            st.session_state.historico_prompt.append(("assistant", MENSAGEM_CANCELADA))
+    return futuro.result()
+
+def _mostrar_mais_mensagens(tamanho_pagina):
+    st.session_state.mensagens_visiveis += tamanho_pagina
+
+def exibir_historico():
+    """
+    Exibe as últimas mensagens do chat. As mais antigas ficam ocultas atrás de um botão que carrega
+    mais uma página (CHAT_PAGE_SIZE mensagens), para que o custo de cada execução do script não
+    cresça com o tamanho da conversa.
+    """
+    tamanho_pagina = get_setting(st.session_state.config, "CHAT_PAGE_SIZE", 20, int)
+    visiveis = st.session_state.setdefault("mensagens_visiveis", tamanho_pagina)
+    ocultas = max(len(st.session_state.history) - visiveis, 0)
+    if ocultas:
+        # O callback roda antes do script, que já é executado com a página seguinte (sem st.rerun)
+        st.button(
+            f"Mostrar mensagens anteriores ({ocultas})", key="mostrar_anteriores",
+            on_click=_mostrar_mais_mensagens, args=(tamanho_pagina,),
+        )
+    for role, msg in st.session_state.history[ocultas:]:
+        st.chat_message("user" if role == "user" else "assistant").write(msg)
 
 def exibir_chat():
     """
     Exibe a interface do chatbot, processa as mensagens do usuário,
     executa consultas SQL, gera respostas e gráficos com IA.
+    Cada mensagem passa uma única vez pelo pipeline, na mesma execução do script em que foi enviada.
     """
     # Título e subtítulo
     st.markdown(
@@ -86,72 +206,49 @@ def exibir_chat():
         for s in sugestoes:
             st.markdown(f"- {s}")
 
-    # Exibe o histórico do chat
-    for role, msg in st.session_state.history:
-        if role == "user":
-            st.chat_message("user").write(msg)
-        else:
-            st.chat_message("assistant").write(msg)
-
-    # Campo de entrada do usuário
+    # Campo de entrada do usuário (fixo no rodapé, qualquer que seja a posição no script). A mensagem
+    # enviada entra no histórico antes de exibi-lo, sem um st.rerun que executaria o script duas vezes.
     user_message = st.chat_input("Digite sua pergunta ou mensagem...")
-
-    # Ao enviar mensagem, adiciona ao histórico e ativa processamento
     if user_message:
         st.session_state.history.append(("user", user_message))
-        st.session_state.pending_response = user_message
-        st.rerun()
-
-    # Processa a mensagem pendente (se houver)
-    if "pending_response" in st.session_state:
-        user_message = st.session_state.pending_response
-        config = st.session_state.config
-        engine = st.session_state.engine
-        schema = st.session_state.schema
-        sintax = st.session_state.sintax
-        data_dictionary = st.session_state.data_dictionary
-        history = st.session_state.history
-
-        tipo = classificar_mensagem(user_message, config, history)
-
-        if tipo == "casual_interaction":
-            # Responde interações casuais
-            resposta = responder_casual_interaction(history, user_message, config)
-            st.session_state.history.append(("assistant", resposta))
-            st.chat_message("assistant").write(resposta)
-            del st.session_state.pending_response
-        elif tipo == "sql_request":
-            # Gera SQL, executa consulta e responde
-            resposta_llm = gerar_sql_llm_chat(user_message, schema, config, sintax, data_dictionary, history)
-            try:
-                consulta_sql = extrair_sql_da_resposta(resposta_llm)
-                df_resultado = executar_sql(engine, consulta_sql)
-                resposta = gerar_resposta_natural(df_resultado, user_message, consulta_sql, config, history)
-                st.session_state.history.append(("assistant", resposta))
-                st.chat_message("assistant").write(resposta)
-
-                # Limpeza do DataFrame para gráficos
-                if df_resultado is not None and not df_resultado.empty:
-                    df_resultado = df_resultado.dropna()
-                    st.session_state.df_para_grafico = df_resultado
-                    st.session_state.pergunta_para_grafico = user_message
-                else:
-                    st.session_state.df_para_grafico = None
-                    st.session_state.pergunta_para_grafico = None
-
-                del st.session_state.pending_response
-            except Exception as e:
-                erro_msg = f"Desculpe, não pude processar seu pedido. Error: {str(e)}"
-                st.session_state.history.append(("assistant", erro_msg))
-                st.chat_message("assistant").write(erro_msg)
-                del st.session_state.pending_response
+        st.session_state.historico_prompt.append(("user", user_message))
+
+    # Exibe o histórico do chat
+    exibir_historico()
+
+    if user_message:
+        # Classifica a mensagem, gera e executa o SQL (se for o caso) e responde
+        resultado = processar_com_cancelamento(user_message)
+        resposta = resultado["resposta"]
+        if not isinstance(resposta, str):
+            # Renderiza a resposta à medida que os trechos chegam da LLM
+            resposta = st.chat_message("assistant").write_stream(resposta).strip()
         else:
-            # Mensagem não compreendida
-            erro_msg = "Desculpe, não pude entender sua mensagem. Por favor, tente novamente."
-            st.session_state.history.append(("assistant", erro_msg))
-            st.chat_message("assistant").write(erro_msg)
-            del st.session_state.pending_response
+            st.chat_message("assistant").write(resposta)
+        st.session_state.history.append(("assistant", resposta))
+        st.session_state.historico_prompt.append(("assistant", resposta))
+        if resultado["tempos"] and get_setting(st.session_state.config, "PIPELINE_SHOW_TIMINGS", False, bool):
+            st.caption(formatar_tempos(resultado))
+
+        # Limpeza do DataFrame para gráficos
+        if resultado["tipo"] == "sql_request":
+            df_resultado = resultado["df"]
+            if df_resultado is not None and not df_resultado.empty:
+                st.session_state.df_para_grafico = df_resultado.dropna()
+                st.session_state.pergunta_para_grafico = user_message
+            else:
+                st.session_state.df_para_grafico = None
+                st.session_state.pergunta_para_grafico = None
+            st.session_state.codigo_grafico_prefetch = resultado["codigo_grafico"]
 
+    exibir_painel_grafico()
+
+@fragmento
+def exibir_painel_grafico():
+    """
+    Botão e exibição do gráfico com IA. Como fragmento, o clique no botão executa de novo só
+    este painel, sem reexibir o histórico do chat.
+    """
     # Botão para gerar gráfico com IA (aparece apenas se houver dados)
     if (
         st.session_state.get("df_para_grafico") is not None
@@ -159,13 +256,25 @@ def exibir_chat():
         and not st.session_state.get("gerar_grafico", False)
     ):
         if st.button("Gerar gráfico com IA"):
-            code = gerar_codigo_grafico_llm(
-                st.session_state.df_para_grafico,
-                st.session_state.pergunta_para_grafico,
-                st.session_state.config
-            )
-            code_limpo = limpar_codigo_plot(code)
+            df_grafico = st.session_state.df_para_grafico
+            pergunta = st.session_state.pergunta_para_grafico
+            cache = obter_cache_graficos(st.session_state.config)
+            fingerprint_df = fingerprint_dataframe(df_grafico) if cache is not None else None
+            code_limpo = cache.buscar_codigo(pergunta, fingerprint_df) if cache is not None else None
+            if code_limpo is None and usar_grafico_local(st.session_state.config, df_grafico):
+                # Formatos comuns (categoria + valor, série temporal...) dispensam a LLM
+                code_limpo = gerar_codigo_grafico_local(df_grafico)
+            if code_limpo is None:
+                # Usa o código gerado em paralelo com a resposta, se houver
+                prefetch = st.session_state.get("codigo_grafico_prefetch")
+                if prefetch is not None:
+                    code = prefetch.result()
+                else:
+                    code = gerar_codigo_grafico_llm(df_grafico, pergunta, st.session_state.config)
+                code_limpo = limpar_codigo_plot(code)
             if is_safe_plot_code(code_limpo):
+                if cache is not None:
+                    cache.armazenar_codigo(pergunta, fingerprint_df, code_limpo)
                 st.session_state.code_grafico = code_limpo
                 st.session_state.gerar_grafico = True
             else:
@@ -174,23 +283,47 @@ def exibir_chat():
     # Exibe o gráfico se a flag estiver ativa
     if st.session_state.get("gerar_grafico", False):
         st.code(st.session_state.code_grafico, language="python")
-        local_vars = {"df": st.session_state.df_para_grafico}
-        try:
-            exec(
+        # O código roda em um processo separado, com limites de tempo, CPU e memória
+        with st.spinner("Renderizando o gráfico..."):
+            grafico = renderizar_grafico(
                 st.session_state.code_grafico,
-                {"plt": plt, "sns": sns, "px": px, "df": st.session_state.df_para_grafico},
-                local_vars
+                st.session_state.df_para_grafico,
+                obter_pool_graficos(st.session_state.config),
+                obter_cache_graficos(st.session_state.config),
             )
-            st.pyplot(plt.gcf())
-            plt.clf()
-        except Exception as e:
-            st.error(f"Erro ao executar o código gerado: {e}")
+        if "erro" in grafico:
+            st.error(f"Erro ao executar o código gerado: {grafico['erro']}")
+        elif grafico["tipo"] == "plotly":
+            # O plotly só é importado quando um gráfico plotly é exibido
+            import plotly.io as pio
+            st.plotly_chart(pio.from_json(grafico["conteudo"]), use_container_width=True)
+        else:
+            st.image(grafico["conteudo"])
         # Limpa o estado para não duplicar
         st.session_state.gerar_grafico = False
         st.session_state.code_grafico = None
         st.session_state.df_para_grafico = None
         st.session_state.pergunta_para_grafico = None
+        st.session_state.codigo_grafico_prefetch = None
+
+def exibir_painel_latencia():
+    """
+    Exibe na barra lateral a latência recente de cada etapa rastreada (TRACING_SIDEBAR_PANEL=true).
+    """
+    if not get_setting(st.session_state.config, "TRACING_SIDEBAR_PANEL", False, bool):
+        return
+    import pandas as pd
+    resumo = resumo_spans()
+    with st.sidebar.expander("Latência por etapa", expanded=False):
+        if not resumo:
+            st.caption("Nenhuma etapa registrada ainda.")
+            return
+        st.dataframe(
+            pd.DataFrame.from_dict(resumo, orient="index")[["n", "p50", "p95", "erros"]].round(3),
+            use_container_width=True,
+        )
 
 if __name__ == "__main__" or True:
     inicializar_sessao()
+    exibir_painel_latencia()
     exibir_chat()
\ No newline at end of file